@@ -1,4 +1,10 @@
-import itertools
+import re
+from collections import Counter
+
+from django.apps import apps
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Length
 
 from rest_framework.routers import DefaultRouter
 from transliterate import slugify as transliterate_slugify
@@ -31,14 +37,112 @@ class CustomRouter(DefaultRouter):
         return urls
 
 
+def slugify_source(value):
+    return transliterate_slugify(value, language_code='ru') or ''
+
+
+def _last_suffix(model, slug_field, base):
+    # Один запрос вместо перебора slug-1, slug-2, ...: самый длинный и
+    # старший из подходящих slug'ов содержит наибольший суффикс
+    last = model.objects.filter(**{
+        f'{slug_field}__startswith': base,
+        f'{slug_field}__regex': rf'^{re.escape(base)}(-[0-9]+)?$',
+    }).order_by(Length(slug_field).desc(), f'-{slug_field}').values_list(
+        slug_field, flat=True).first()
+
+    if last is None:
+        return None
+    return int(last[len(base) + 1:] or 0)
+
+
+def _allocate_suffixes(model, slug_field, base, amount):
+    # Счётчик на базовый slug: O(1) на выдачу, первая инициализация — по префиксу.
+    # Суффикс 0 соответствует slug без номера.
+    SlugCounter = apps.get_model('app', 'SlugCounter')
+    counter = SlugCounter.objects.filter(model=model._meta.label_lower, base=base)
+
+    with transaction.atomic():
+        if not counter.update(last=F('last') + amount):
+            last = _last_suffix(model, slug_field, base)
+            start = -1 if last is None else last
+            try:
+                with transaction.atomic():
+                    SlugCounter.objects.create(
+                        model=model._meta.label_lower, base=base, last=start + amount)
+                return start + 1
+            except IntegrityError:
+                counter.update(last=F('last') + amount)
+
+        return counter.values_list('last', flat=True).get() - amount + 1
+
+
+def _existing_slugs(model, slug_field, slugs, chunk_size=1000):
+    slugs = list(slugs)
+    existing = set()
+    for i in range(0, len(slugs), chunk_size):
+        existing.update(model.objects.filter(**{
+            f'{slug_field}__in': slugs[i:i + chunk_size]}).values_list(slug_field, flat=True))
+    return existing
+
+
+def unique_slugify_bulk(model, slug_field, values):
+    bases = [slugify_source(value) for value in values]
+    slugs = [None] * len(bases)
+
+    # Свободный базовый slug выдаётся без обращения к счётчику
+    free = set(bases) - _existing_slugs(model, slug_field, set(bases))
+    pending = []
+    for i, base in enumerate(bases):
+        if base in free:
+            slugs[i] = base
+            free.discard(base)
+        else:
+            pending.append(i)
+    used = set(filter(None, slugs))
+
+    while pending:
+        next_suffix = {
+            base: _allocate_suffixes(model, slug_field, base, amount)
+            for base, amount in Counter(bases[i] for i in pending).items()
+        }
+        candidates = []
+        for i in pending:
+            suffix = next_suffix[bases[i]]
+            next_suffix[bases[i]] += 1
+            candidates.append((i, f'{bases[i]}-{suffix}' if suffix else bases[i]))
+
+        # Счётчик знает только свои суффиксы: «Тур 1» уже мог занять tur-1
+        # у базы tur. Занятые значения пропускаем и берём следующие
+        taken = _existing_slugs(model, slug_field, [slug for _, slug in candidates])
+        pending = []
+        for i, slug in candidates:
+            if slug in taken or slug in used:
+                pending.append(i)
+            else:
+                slugs[i] = slug
+                used.add(slug)
+    return slugs
+
+
 def unique_slugify(instance, slug_field, source_field):
-    slug = transliterate_slugify(
-        getattr(instance, source_field), language_code='ru')
-    unique_slug = slug
+    return unique_slugify_bulk(
+        instance.__class__, slug_field, [getattr(instance, source_field)])[0]
+
 
-    for i in itertools.count(1):
-        if not instance.__class__.objects.filter(**{slug_field: unique_slug}).exists():
-            break
-        unique_slug = f'{slug}-{i}'
+def save_with_unique_slug(instance, save, slug_field, source_field, *args,
+                          attempts=5, **kwargs):
+    if getattr(instance, slug_field):
+        return save(*args, **kwargs)
 
-    return unique_slug
+    for attempt in range(attempts):
+        slug = unique_slugify(instance, slug_field, source_field)
+        setattr(instance, slug_field, slug)
+        try:
+            with transaction.atomic():
+                return save(*args, **kwargs)
+        except IntegrityError:
+            # Параллельная вставка заняла тот же slug — берём следующий
+            setattr(instance, slug_field, '')
+            collided = instance.__class__.objects.filter(**{slug_field: slug}).exists()
+            if not collided or attempt == attempts - 1:
+                raise
@@ -5,7 +5,8 @@ from .models import User
 
 class CustomUserAdmin(UserAdmin):
     def has_module_permission(self, request):
-        if request.user.is_api_user:
+        # Страница входа строит список приложений и для анонимного пользователя
+        if not request.user.is_authenticated or request.user.is_api_user:
             return False
         return super().has_module_permission(request)
 
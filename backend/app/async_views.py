@@ -0,0 +1,143 @@
+from asgiref.sync import sync_to_async
+from django.db.models import Prefetch
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from app import facets, lookups, rankings, reservations
+from app.caching import cache_async_view
+from app.filters import CompanyFilter, TourFilter
+from app.models import Company, Country, SocialMedia, Tour
+from app.pagination import AsyncCatalogPagination
+from app.serializers import (CompanyFullSerializer, CountrySerializer, TourInfoSerializer,
+                             TourSerializer, TourTimeSpanSerializer, compiled_company_serializer,
+                             compiled_tour_serializer)
+
+# Асинхронные (ASGI) версии тяжёлых анонимных GET-эндпоинтов каталога.
+# Ответы совпадают с вьюсетами из app.views; SQL выполняется через async ORM,
+# а сериализаторы работают только с уже загруженными объектами
+
+
+def json_response(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def not_found(detail='Not found.'):
+    return json_response({'detail': detail}, status=404)
+
+
+async def paginated(request, queryset, compiled, keyset_ordering):
+    drf_request = Request(request)
+    paginator = AsyncCatalogPagination(keyset_ordering=keyset_ordering)
+    rows = compiled.values(queryset, *keyset_ordering)
+    try:
+        page = await paginator.apaginate_queryset(rows, drf_request)
+    except NotFound as exc:
+        return None, not_found(str(exc.detail))
+    return paginator.get_paginated_response(compiled.serialize(page)).data, None
+
+
+@require_safe
+@cache_async_view('tour.list', ('tour', 'company', 'country'))
+async def tour_list(request):
+    filterset = TourFilter(request.GET, queryset=Tour.objects.select_related('company', 'country'))
+    if not filterset.is_valid():
+        return json_response(filterset.errors, status=400)
+    # Фильтр по стране при промахе справочника сверяется с БД синхронно
+    queryset = await sync_to_async(lambda: filterset.qs)()
+
+    data, error = await paginated(request, queryset, compiled_tour_serializer, ('price', 'id'))
+    if error:
+        return error
+
+    if request.GET.get('facets'):
+        data['facets'] = await sync_to_async(facets.get_facets)(
+            queryset, request.GET, TourFilter.base_filters)
+    return json_response(data)
+
+
+@require_safe
+@cache_async_view('tour.retrieve', ('tour', 'company', 'country'))
+async def tour_detail(request, slug):
+    try:
+        tour = await Tour.objects.select_related('company', 'country').aget(slug=slug)
+    except Tour.DoesNotExist:
+        return not_found('No Tour matches the given query.')
+    return json_response(TourSerializer(tour).data)
+
+
+@require_safe
+@cache_async_view('tour.get_full_info', ('company', 'country'),
+                  kwarg_groups=lambda slug: (f'tour:{slug}',))
+async def tour_full_info(request, slug):
+    try:
+        tour = await Tour.objects.select_related('tourinfo', 'company', 'country').aget(slug=slug)
+    except Tour.DoesNotExist:
+        return not_found('No Tour matches the given query.')
+    timespans = await reservations.aupcoming_timespans(tour)
+
+    return json_response({
+        'basic_info': TourSerializer(tour).data,
+        'detailed_info': TourInfoSerializer(tour.tourinfo).data if hasattr(tour, 'tourinfo') else None,
+        'time_spans': TourTimeSpanSerializer(timespans[0]).data if timespans else None,
+        'upcoming_time_spans': TourTimeSpanSerializer(timespans, many=True).data
+    })
+
+
+@require_safe
+async def popular_tours(request):
+    scope, scope_id = rankings.GLOBAL, None
+    try:
+        if country := request.GET.get('country'):
+            scope = rankings.COUNTRY
+            scope_id = await sync_to_async(lookups.countries.get_id)(country)
+            if scope_id is None:
+                raise Country.DoesNotExist
+        elif company := request.GET.get('company'):
+            scope = rankings.COMPANY
+            scope_id = (await Company.objects.aget(slug=company)).pk
+    except Country.DoesNotExist:
+        return not_found('No Country matches the given query.')
+    except Company.DoesNotExist:
+        return not_found('No Company matches the given query.')
+
+    # Рейтинг берётся из кэша; на холодном кэше — ограниченная выборка по
+    # favourites_count, а полный пересчёт идёт в фоне (app.rankings)
+    ids = await sync_to_async(rankings.get_popular_ids)(scope, scope_id)
+    tours = await Tour.objects.select_related('company', 'country').ain_bulk(ids)
+    return json_response(TourSerializer([tours[pk] for pk in ids if pk in tours], many=True).data)
+
+
+@require_safe
+@cache_async_view('company.list', ('company', 'social_media', 'tour'))
+async def company_list(request):
+    filterset = CompanyFilter(request.GET, queryset=Company.objects.all())
+    if not filterset.is_valid():
+        return json_response(filterset.errors, status=400)
+
+    data, error = await paginated(request, filterset.qs, compiled_company_serializer, ('id',))
+    return error or json_response(data)
+
+
+@require_safe
+@cache_async_view('company.retrieve', ('company', 'social_media', 'tour'))
+async def company_detail(request, slug):
+    await lookups.social_media_types.aload()
+    queryset = Company.objects.prefetch_related(
+        Prefetch('socialmedia_set', queryset=SocialMedia.objects.all()),
+        Prefetch('tour_set', queryset=Tour.objects.all())
+    )
+    try:
+        company = await queryset.aget(slug=slug)
+    except Company.DoesNotExist:
+        return not_found('No Company matches the given query.')
+    return json_response(CompanyFullSerializer(company).data)
+
+
+@require_safe
+@cache_async_view('country.list', ('country',))
+async def country_list(request):
+    countries = [country async for country in Country.objects.all()]
+    return json_response(CountrySerializer(countries, many=True).data)
@@ -0,0 +1,119 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+DEFAULT_TTL = 60
+# Версия формата записи: меняется вместе с CACHED_FIELDS
+KEY_PREFIX = 'auth:user:v2'
+# В кэше только то, что нужно правам доступа; хэш пароля туда не попадает
+CACHED_FIELDS = ['id', 'username', 'is_active', 'is_staff', 'is_superuser']
+
+
+def generation_key(user_id):
+    return f'{KEY_PREFIX}:generation:{user_id}'
+
+
+def get_generation(user_id):
+    generation = cache.get(generation_key(user_id))
+    if generation is None:
+        # Не с нуля: после вытеснения счётчика старые записи не должны ожить
+        cache.add(generation_key(user_id), time.time_ns(), timeout=None)
+        generation = cache.get(generation_key(user_id))
+    return generation
+
+
+def cache_key(user_id, generation):
+    return f'{KEY_PREFIX}:{user_id}:{generation}'
+
+
+def invalidate(*user_ids):
+    # Новое поколение в ключе: запись, которую параллельный запрос успел
+    # положить по старому ключу, больше никто не прочитает
+    for user_id in user_ids:
+        try:
+            cache.incr(generation_key(user_id))
+        except ValueError:
+            cache.set(generation_key(user_id), time.time_ns(), timeout=None)
+
+
+def dump_user(user):
+    data = {field: getattr(user, field) for field in CACHED_FIELDS}
+    # Версия пароля для CHECK_REVOKE_TOKEN — как в claim токена, не сам хэш
+    data['password_version'] = get_md5_hash_password(user.password)
+    return data
+
+
+def load_user(data):
+    # Остальные поля User отложены (deferred) и читаются из БД при обращении;
+    # save() такого экземпляра пишет только загруженные поля
+    model = get_user_model()
+    # from_db ждёт значения в порядке полей модели
+    fields = [field.attname for field in model._meta.concrete_fields if field.attname in data]
+    user = model.from_db(DEFAULT_DB_ALIAS, fields, [data[field] for field in fields])
+    user.password_version = data['password_version']
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    # JWTAuthentication, который берёт пользователя из кэша, а не SELECT на каждый запрос.
+    # Поколение в ключе меняется сигналом при сохранении/удалении User (см. app.signals)
+    # и вызовом invalidate() после update() в обход сигналов.
+    # Вьюсеты с cached_auth_user = False (профиль) получают пользователя из БД.
+    # Stateless-режим (settings.JWT_STATELESS_READS): для безопасных методов
+    # в действиях из view.stateless_auth_actions пользователь строится из claims
+    # токена (TokenUser) без обращения к БД и кэшу
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        view = (getattr(request, 'parser_context', None) or {}).get('view')
+        if self.is_stateless(request, view):
+            if api_settings.USER_ID_CLAIM not in validated_token:
+                raise InvalidToken(_('Token contained no recognizable user identification'))
+            return api_settings.TOKEN_USER_CLASS(validated_token), validated_token
+        if not getattr(view, 'cached_auth_user', True):
+            return super().get_user(validated_token), validated_token
+        return self.get_user(validated_token), validated_token
+
+    def is_stateless(self, request, view):
+        if not getattr(settings, 'JWT_STATELESS_READS', False) or request.method not in SAFE_METHODS:
+            return False
+        return getattr(view, 'action', None) in getattr(view, 'stateless_auth_actions', ())
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+
+        key = cache_key(user_id, get_generation(user_id))
+        data = cache.get(key)
+        if data is None:
+            # Промах: обычная выборка со всеми проверками JWTAuthentication
+            user = super().get_user(validated_token)
+            cache.set(key, dump_user(user), timeout=getattr(settings, 'AUTH_USER_CACHE_TTL', DEFAULT_TTL))
+            return user
+
+        # Те же проверки, что делает JWTAuthentication.get_user после выборки
+        user = load_user(data)
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM) != user.password_version:
+            raise AuthenticationFailed(_("The user's password has been changed."),
+                                       code='password_changed')
+        return user
@@ -0,0 +1,147 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from app.models import AvatarFile, User
+
+logger = logging.getLogger(__name__)
+
+# Аватары хранятся по хэшу содержимого: avatars/<sha256>.<ext> — оригинал,
+# avatars/<sha256>/<size>.<format> — уменьшенные копии. Одинаковые файлы
+# разных пользователей лежат на диске один раз
+DEFAULTS = {
+    'SIZES': [64, 128, 256],
+    'FORMATS': {'webp': {'quality': 80, 'method': 4},
+                'jpeg': {'quality': 85, 'optimize': True, 'progressive': True}},
+    # 0 — копии строятся прямо в запросе (тесты, разработка)
+    'WORKERS': 1,
+}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'AVATARS', {})}
+
+
+def use_disk_uploads(request):
+    # Загрузка пишется во временный файл по частям, а не держится в памяти целиком
+    if not hasattr(request, '_files'):
+        request.upload_handlers = [TemporaryFileUploadHandler(request)]
+
+
+def lock_file(name):
+    # Блокировка держится до конца транзакции вызывающего
+    AvatarFile.objects.get_or_create(name=name)
+    list(AvatarFile.objects.select_for_update().filter(name=name).values_list('pk'))
+
+
+def store(upload):
+    # Хэш считается по частям файла; если такой файл уже есть — повторно не пишется.
+    # Вызывается в транзакции, которая сохраняет ссылку на файл: до её коммита
+    # release() того же файла ждёт и потом видит новую ссылку
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    upload.seek(0)
+
+    ext = os.path.splitext(upload.name)[1].lower()
+    name = f'avatars/{digest.hexdigest()}{ext}'
+    lock_file(name)
+    if not default_storage.exists(name):
+        name = default_storage.save(name, upload)
+    return name
+
+
+def variant_name(name, size, fmt):
+    return f'{os.path.splitext(name)[0]}/{size}.{EXTENSIONS[fmt]}'
+
+
+def variant_names(name):
+    config = get_config()
+    return [variant_name(name, size, fmt) for size in config['SIZES'] for fmt in config['FORMATS']]
+
+
+def generate_variants(name):
+    config = get_config()
+    with default_storage.open(name) as source:
+        image = Image.open(source)
+        # JPEG декодируется сразу в уменьшенном виде — быстрее и меньше памяти
+        largest = max(config['SIZES'])
+        image.draft('RGB', (largest * 2, largest * 2))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+
+    for size in config['SIZES']:
+        thumbnail = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        for fmt, options in config['FORMATS'].items():
+            target = variant_name(name, size, fmt)
+            if default_storage.exists(target):
+                continue
+            buffer = io.BytesIO()
+            thumbnail.save(buffer, fmt.upper(), **options)
+            default_storage.save(target, ContentFile(buffer.getvalue()))
+
+
+def _generate_safely(name):
+    try:
+        generate_variants(name)
+    except Exception:
+        logger.exception('Не удалось построить копии аватара %s', name)
+
+
+def schedule_variants(name):
+    # После коммита и вне потока запроса
+    global _executor
+    workers = get_config()['WORKERS']
+    if not workers:
+        transaction.on_commit(lambda: _generate_safely(name))
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='avatars')
+    transaction.on_commit(lambda: _executor.submit(_generate_safely, name))
+
+
+def variant_urls(name, request=None):
+    # {размер: {формат: url}} только для уже построенных копий
+    config = get_config()
+    result = {}
+    for size in config['SIZES']:
+        urls = {}
+        for fmt in config['FORMATS']:
+            target = variant_name(name, size, fmt)
+            if default_storage.exists(target):
+                url = default_storage.url(target)
+                urls[fmt] = request.build_absolute_uri(url) if request else url
+        if urls:
+            result[str(size)] = urls
+    return result
+
+
+def release(name):
+    # Удаляет оригинал и копии, если файл больше не нужен ни одному пользователю
+    if not name:
+        return
+    with transaction.atomic():
+        lock_file(name)
+        if User.objects.filter(avatar=name).exists():
+            return
+        for target in [name, *variant_names(name)]:
+            default_storage.delete(target)
+        try:
+            os.rmdir(default_storage.path(os.path.splitext(name)[0]))
+        except (NotImplementedError, OSError):
+            pass
+        AvatarFile.objects.filter(name=name).delete()
@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import time
+from contextlib import nullcontext
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.test import override_settings
+
+from app.benchmarks import summarize
+from app.models import Company, Tour
+
+# Одни и те же эндпоинты синхронных вьюсетов (/api/) и асинхронного пути (/api/async/)
+SCENARIOS = [
+    ('tour.list', 'tour/', 'page=2'),
+    ('tour.retrieve', 'tour/{tour}/', ''),
+    ('tour.get_full_info', 'tour/{tour}/full/', ''),
+    ('tour.popular', 'tour/popular/', ''),
+    ('company.list', 'company/', ''),
+    ('company.retrieve', 'company/{company}/', ''),
+    ('country.list', 'country/', ''),
+]
+
+# (развёртывание, префикс пути): WSGI с пулом потоков, ASGI с синхронными
+# вьюсетами (каждый запрос уходит в поток через sync_to_async) и ASGI с async-представлениями
+MODES = [
+    ('wsgi', '/api/'),
+    ('asgi-sync', '/api/'),
+    ('asgi-async', '/api/async/'),
+]
+
+
+def add_arguments(parser):
+    parser.add_argument('--requests', type=int, default=500, help='Запросов на сценарий')
+    parser.add_argument('--concurrency', type=int, default=32,
+                        help='Одновременных соединений (потоков WSGI или задач ASGI)')
+    parser.add_argument('--cache', action='store_true',
+                        help='Не отключать кэш ответов (по умолчанию замеряется путь до БД)')
+    parser.add_argument('--only', default=None, help='Подстрока имени сценария')
+
+
+def wsgi_request(application, path, query):
+    environ = {'PATH_INFO': path, 'QUERY_STRING': query, 'HTTP_HOST': 'localhost',
+               'REQUEST_METHOD': 'GET'}
+    setup_testing_defaults(environ)
+    status = []
+    result = application(environ, lambda code, headers, exc_info=None: status.append(code))
+    try:
+        b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return int(status[0].split()[0])
+
+
+async def asgi_request(application, path, query):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'localhost')],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+    body_sent = False
+    status = []
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Клиент не отключается: Django отменит ожидание после ответа
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+def run_wsgi(path, query, total, concurrency):
+    from backend.wsgi import application
+
+    samples = []
+    errors = []
+    remaining = iter(range(total))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    break
+            started = time.perf_counter()
+            code = wsgi_request(application, path, query)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                samples.append(elapsed)
+                if code != 200:
+                    errors.append(code)
+        close_old_connections()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, errors
+
+
+def run_asgi(path, query, total, concurrency):
+    from backend.asgi import application
+
+    samples = []
+    errors = []
+
+    async def worker(remaining):
+        for _ in remaining:
+            started = time.perf_counter()
+            code = await asgi_request(application, path, query)
+            samples.append((time.perf_counter() - started) * 1000)
+            if code != 200:
+                errors.append(code)
+
+    async def main():
+        remaining = iter(range(total))
+        await asyncio.gather(*(worker(remaining) for _ in range(concurrency)))
+
+    asyncio.run(main())
+    return samples, errors
+
+
+def run(requests=500, concurrency=32, cache=False, only=None, **kwargs):
+    tour = Tour.objects.filter(tourinfo__isnull=False).order_by('pk').first() or Tour.objects.first()
+    company = Company.objects.order_by('pk').first()
+    if tour is None or company is None:
+        raise ValueError('Нет данных для замера: запустите generate_catalogue')
+
+    result = {
+        'meta': {'database': connection.vendor, 'requests': requests,
+                 'concurrency': concurrency, 'response_cache': cache},
+    }
+    # Без кэша ответов сравнивается работа с БД, а не чтение из памяти
+    response_cache = {**getattr(settings, 'RESPONSE_CACHE', {}), 'TTL': 0}
+    with nullcontext() if cache else override_settings(RESPONSE_CACHE=response_cache):
+        for name, path, query in SCENARIOS:
+            if only and only not in name:
+                continue
+            path = path.format(tour=tour.slug, company=company.slug)
+            result[name] = {}
+            for mode, prefix in MODES:
+                runner = run_wsgi if mode == 'wsgi' else run_asgi
+                started = time.perf_counter()
+                samples, errors = runner(prefix + path, query, requests, concurrency)
+                elapsed = time.perf_counter() - started
+                result[name][mode] = {
+                    **summarize(samples),
+                    'throughput_rps': round(len(samples) / elapsed, 1),
+                    'errors': len(errors),
+                }
+    return result
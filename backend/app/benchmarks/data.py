@@ -0,0 +1,159 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from app import lookups
+from app.models import (Company, Country, Favourites, Reservation, ReservationStatus, Tour,
+                        TourInfo, TourTimeSpan, User)
+
+WORDS = [
+    'Турция', 'Египет', 'Греция', 'Италия', 'Испания', 'Кипр', 'море', 'горы', 'пляж',
+    'экскурсия', 'круиз', 'отдых', 'семейный', 'горящий', 'всё', 'включено', 'озеро',
+    'Байкал', 'Алтай', 'Карелия', 'Кавказ', 'Сочи', 'Крым', 'сафари', 'дайвинг',
+]
+
+
+def _bulk(model, objects, batch_size):
+    with transaction.atomic():
+        return model.objects.bulk_create(objects, batch_size=batch_size)
+
+
+# Статусы сгенерированных бронирований и их доли
+RESERVATION_STATUSES = [
+    (ReservationStatus.WAITING, 5),
+    (ReservationStatus.PAID, 3),
+    (ReservationStatus.COMPLETED, 1),
+    (ReservationStatus.DECLINED, 1),
+]
+
+
+def seed_catalogue(companies=20, countries=10, tours=1000, users=1000,
+                   favourites=10000, timespans=0, reservations=0, batch_size=5000, seed=0):
+    # Синтетические данные создаются напрямую через bulk_create, минуя save()
+    # и сигналы; счётчики избранного и учёт мест заполняются здесь же
+    rnd = random.Random(seed)
+    now = timezone.now()
+
+    country_objs = _bulk(Country, [
+        Country(name=f'bench-country-{i}') for i in range(countries)
+    ], batch_size)
+    # Сигналы не вызывались — справочник стран сбрасываем явно
+    transaction.on_commit(lookups.countries.invalidate)
+    company_objs = _bulk(Company, [
+        Company(name=f'bench-company-{i}', slug=f'bench-company-{i}', phone='79990000000',
+                address='-', description='-', image='https://example.com/c.png')
+        for i in range(companies)
+    ], batch_size)
+
+    tour_objs = []
+    for start in range(0, tours, batch_size):
+        tour_objs += _bulk(Tour, [
+            Tour(company=company_objs[i % companies], country=country_objs[i % countries],
+                 title=f'{rnd.choice(WORDS)} {rnd.choice(WORDS)} {i}', slug=f'bench-tour-{i}',
+                 img_preview_url='https://example.com/t.png',
+                 price=Decimal(rnd.randint(1000, 500000)) / 100,
+                 short_description=' '.join(rnd.sample(WORDS, 4)))
+            for i in range(start, min(start + batch_size, tours))
+        ], batch_size)
+
+    user_objs = []
+    for start in range(0, users, batch_size):
+        user_objs += _bulk(User, [
+            User(username=f'bench-user-{i}', password='!')
+            for i in range(start, min(start + batch_size, users))
+        ], batch_size)
+
+    # Пары (пользователь, тур) уникальны, пока на пользователя приходится не больше туров, чем есть
+    per_user = min(tours, -(-favourites // users))
+    counts = [0] * tours
+    pending = []
+    created = 0
+    for u, user in enumerate(user_objs):
+        for j in range(per_user):
+            if created == favourites:
+                break
+            t = (u * 7919 + j) % tours
+            counts[t] += 1
+            pending.append(Favourites(customer=user, target=tour_objs[t],
+                                      datetime=now - timedelta(days=rnd.randint(0, 365))))
+            created += 1
+            if len(pending) == batch_size:
+                _bulk(Favourites, pending, batch_size)
+                pending = []
+    if pending:
+        _bulk(Favourites, pending, batch_size)
+
+    for tour, count in zip(tour_objs, counts):
+        tour.favourites_count = count
+    with transaction.atomic():
+        Tour.objects.bulk_update(tour_objs, ['favourites_count'], batch_size=batch_size)
+
+    timespan_objs = []
+    if timespans:
+        # Подробности тура создаются вместе с периодами: вместе их читает страница тура
+        for start in range(0, tours, batch_size):
+            chunk = tour_objs[start:start + batch_size]
+            _bulk(TourInfo, [
+                TourInfo(tour=tour, description=' '.join(rnd.sample(WORDS, 12)),
+                         img_url='https://example.com/i.png',
+                         img_background_url='https://example.com/b.png', placed='-')
+                for tour in chunk
+            ], batch_size)
+            pending = []
+            for tour in chunk:
+                for k in range(timespans):
+                    # Периоды идут подряд: первый может быть уже в прошлом
+                    date_from = now + timedelta(days=30 * k - rnd.randint(0, 20))
+                    pending.append(TourTimeSpan(
+                        group_name=f'Группа {k + 1}', tour=tour, place_count=rnd.randint(10, 40),
+                        date_from=date_from, date_to=date_from + timedelta(days=rnd.randint(3, 14))))
+            timespan_objs += _bulk(TourTimeSpan, pending, batch_size)
+
+    created_reservations = 0
+    if reservations and timespan_objs and user_objs:
+        statuses = {
+            code: ReservationStatus.objects.get_or_create(status=code)[0]
+            for code, _ in ReservationStatus.STATUS_CHOICES
+        }
+        codes = [code for code, _ in RESERVATION_STATUSES]
+        weights = [weight for _, weight in RESERVATION_STATUSES]
+        ledger = {}
+        pending = []
+        for i in range(reservations):
+            timespan = timespan_objs[rnd.randrange(len(timespan_objs))]
+            used = ledger.setdefault(timespan.pk, {ReservationStatus.WAITING: 0, ReservationStatus.PAID: 0})
+            code = rnd.choices(codes, weights)[0]
+            count = rnd.randint(1, 3)
+            if code in used:
+                # Бронирования, занимающие места, не превышают вместимость периода
+                if sum(used.values()) + count > timespan.place_count:
+                    code = ReservationStatus.DECLINED
+                else:
+                    used[code] += count
+            pending.append(Reservation(customer=user_objs[i % users], target=timespan,
+                                       status=statuses[code], count=count))
+            if len(pending) == batch_size:
+                _bulk(Reservation, pending, batch_size)
+                pending = []
+        if pending:
+            _bulk(Reservation, pending, batch_size)
+        created_reservations = reservations
+
+        for timespan in timespan_objs:
+            used = ledger.get(timespan.pk)
+            if used:
+                timespan.places_reserved = used[ReservationStatus.WAITING]
+                timespan.places_paid = used[ReservationStatus.PAID]
+        with transaction.atomic():
+            TourTimeSpan.objects.bulk_update(
+                [timespan for timespan in timespan_objs if timespan.pk in ledger],
+                ['places_reserved', 'places_paid'], batch_size=batch_size)
+
+    return {
+        'countries': countries, 'companies': companies, 'tours': tours,
+        'users': users, 'favourites': created, 'timespans': len(timespan_objs),
+        'reservations': created_reservations,
+    }
@@ -0,0 +1,175 @@
+import asyncio
+import re
+import subprocess
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.test import AsyncClient, Client
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from app import caching, search
+from app.benchmarks import summarize
+from app.benchmarks.data import seed_catalogue
+from app.models import Company, Reservation, Tour, User
+
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+# (имя, метод, путь, нужна ли авторизация); {tour} и {company} — слаги из данных
+SCENARIOS = [
+    ('country.list', 'get', '/api/country/', False),
+    ('social_media_type.list', 'get', '/api/social-media-type/', False),
+    ('reservation_status_type.list', 'get', '/api/reservation-status-type/', False),
+    ('company.list', 'get', '/api/company/', False),
+    ('company.retrieve', 'get', '/api/company/{company}/', False),
+    ('tour.list', 'get', '/api/tour/', False),
+    ('tour.list.facets', 'get', '/api/tour/?facets=1', False),
+    ('tour.list.cursor', 'get', '/api/tour/?pagination=cursor', False),
+    ('tour.retrieve', 'get', '/api/tour/{tour}/', False),
+    ('tour.get_full_info', 'get', '/api/tour/{tour}/full/', False),
+    ('tour.search', 'get', '/api/tour/search/?q=море', False),
+    ('tour.get_popular_tours', 'get', '/api/tour/popular/', False),
+    ('toggle_favourite.check', 'get', '/api/favourites/{tour}/check/', False),
+    ('tour.list.auth', 'get', '/api/tour/', True),
+    ('tour.get_full_info.auth', 'get', '/api/tour/{tour}/full/', True),
+    ('auth.user', 'get', '/api/auth/user/', True),
+    ('favourites.list', 'get', '/api/favourite/', True),
+    ('toggle_favourite.add', 'post', '/api/favourites/{tour}/add/', True),
+    ('toggle_favourite.remove', 'delete', '/api/favourites/{tour}/remove/', True),
+    ('reservations.list', 'get', '/api/reservation/', True),
+    ('reservations.count', 'get', '/api/reservation/count/', True),
+    ('reservations.history', 'get', '/api/reservation/history/', True),
+]
+
+
+def add_arguments(parser):
+    parser.add_argument('--seed', action='store_true',
+                        help='Сгенерировать синтетические данные перед замером')
+    parser.add_argument('--tours', type=int, default=10_000)
+    parser.add_argument('--users', type=int, default=1_000)
+    parser.add_argument('--favourites', type=int, default=50_000)
+    parser.add_argument('--reservations', type=int, default=20_000)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--client', choices=['wsgi', 'asgi'], default='wsgi',
+                        help='Тестовый клиент Django (WSGI) или AsyncClient (ASGI)')
+    parser.add_argument('--cold', action='store_true',
+                        help='Очищать кэш ответов перед каждым запросом')
+    parser.add_argument('--only', default=None,
+                        help='Регулярное выражение для отбора сценариев по имени')
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class LocalAsyncClient(AsyncClient):
+    # AsyncClient всегда подставляет Host: testserver, которого нет в ALLOWED_HOSTS
+    def _base_scope(self, **request):
+        scope = super()._base_scope(**request)
+        scope['headers'] = [
+            (name, b'localhost' if name == b'host' else value) for name, value in scope['headers']
+        ]
+        return scope
+
+
+class Driver:
+    # Единый интерфейс к синхронному и асинхронному тестовым клиентам
+    def __init__(self, kind, headers=None):
+        self.kind = kind
+        self.headers = headers or {}
+        if kind == 'asgi':
+            self.client = LocalAsyncClient()
+            self.loop = asyncio.new_event_loop()
+        else:
+            self.client = Client(HTTP_HOST='localhost')
+
+    def request(self, method, path):
+        response = getattr(self.client, method)(path, headers=self.headers)
+        if self.kind == 'asgi':
+            response = self.loop.run_until_complete(response)
+        return response
+
+    def close(self):
+        if self.kind == 'asgi':
+            self.loop.close()
+
+
+def run_scenario(driver, method, path, iterations, warmup, cold):
+    for _ in range(warmup):
+        driver.request(method, path)
+
+    samples = []
+    queries = []
+    status = None
+    started = time.perf_counter()
+    for _ in range(iterations):
+        if cold:
+            caching.get_backend().clear()
+        request_started = time.perf_counter()
+        response = driver.request(method, path)
+        samples.append((time.perf_counter() - request_started) * 1000)
+        status = response.status_code
+        # Число запросов берём из Server-Timing (app.middleware): так оно
+        # считается и для ASGI, где ORM работает в отдельном потоке
+        match = QUERIES_RE.search(response.get('Server-Timing', ''))
+        if match:
+            queries.append(int(match.group(1)))
+    elapsed = time.perf_counter() - started
+
+    result = summarize(samples)
+    result['status'] = status
+    result['throughput_rps'] = round(iterations / elapsed, 1)
+    if queries:
+        result['queries_mean'] = round(sum(queries) / len(queries), 2)
+        result['queries_max'] = max(queries)
+    return result
+
+
+def run(seed=False, tours=10_000, users=1_000, favourites=50_000, reservations=20_000,
+        iterations=100, warmup=5, client='wsgi', cold=False, only=None, **kwargs):
+    result = {
+        'meta': {
+            'commit': git_commit(),
+            'database': connection.vendor,
+            'client': client,
+            'cold_cache': cold,
+            'iterations': iterations,
+        },
+    }
+    if seed:
+        result['data'] = seed_catalogue(tours=tours, users=users, favourites=favourites,
+                                        timespans=3, reservations=reservations)
+        search.rebuild()
+
+    tour = Tour.objects.filter(tourinfo__isnull=False).order_by('pk').first() or Tour.objects.first()
+    company = Company.objects.order_by('pk').first()
+    reservation = Reservation.objects.select_related('customer').order_by('pk').first()
+    user = reservation.customer if reservation else User.objects.order_by('pk').first()
+    if tour is None or company is None or user is None:
+        raise ValueError('Нет данных для замера: запустите generate_catalogue или передайте --seed')
+
+    token = str(RefreshToken.for_user(user).access_token)
+    anonymous = Driver(client)
+    authenticated = Driver(client, {'authorization': f'Bearer {token}'})
+
+    pattern = re.compile(only) if only else None
+    endpoints = {}
+    try:
+        for name, method, path, auth in SCENARIOS:
+            if pattern and not pattern.search(name):
+                continue
+            path = path.format(tour=tour.slug, company=company.slug)
+            endpoints[name] = run_scenario(
+                authenticated if auth else anonymous, method, path, iterations, warmup, cold)
+    finally:
+        anonymous.close()
+        authenticated.close()
+
+    result['endpoints'] = endpoints
+    return result
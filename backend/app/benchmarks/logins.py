@@ -0,0 +1,115 @@
+import io
+import json
+import threading
+import time
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.db import close_old_connections
+from django.test import override_settings
+
+from app.benchmarks import summarize
+from app.benchmarks.concurrency import wsgi_request
+from app.models import Tour, User
+
+USERNAME = 'bench-login'
+PASSWORD = 'bench-login-password'
+
+# Без шторма входов; хэш на каждом потоке входа (пул шириной в число потоков —
+# как было до пула); ограниченный пул из settings.PASSWORD_HASHING
+MODES = ['baseline', 'unbounded', 'pooled']
+
+
+def add_arguments(parser):
+    parser.add_argument('--requests', type=int, default=300,
+                        help='Запросов к каталогу в каждом режиме')
+    parser.add_argument('--logins', type=int, default=16,
+                        help='Потоков, непрерывно выполняющих вход')
+
+
+def wsgi_post(application, path, data):
+    body = json.dumps(data).encode()
+    environ = {'PATH_INFO': path, 'HTTP_HOST': 'localhost', 'REQUEST_METHOD': 'POST',
+               'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+               'wsgi.input': io.BytesIO(body)}
+    setup_testing_defaults(environ)
+    status = []
+    result = application(environ, lambda code, headers, exc_info=None: status.append(code))
+    try:
+        b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return int(status[0].split()[0])
+
+
+def storm(application, stop, codes, lock):
+    while not stop.is_set():
+        code = wsgi_post(application, '/api/auth/login/', {'username': USERNAME, 'password': PASSWORD})
+        with lock:
+            codes[code] = codes.get(code, 0) + 1
+    close_old_connections()
+
+
+def run_mode(application, mode, requests, logins, pages):
+    stop = threading.Event()
+    lock = threading.Lock()
+    codes = {}
+    threads = []
+    if mode != 'baseline':
+        threads = [threading.Thread(target=storm, args=(application, stop, codes, lock))
+                   for _ in range(logins)]
+    for thread in threads:
+        thread.start()
+
+    samples = []
+    started = time.perf_counter()
+    try:
+        for i in range(requests):
+            request_started = time.perf_counter()
+            wsgi_request(application, '/api/tour/', f'page={i % pages + 1}')
+            samples.append((time.perf_counter() - request_started) * 1000)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'catalogue': summarize(samples),
+        'logins': {str(code): count for code, count in sorted(codes.items())},
+        'logins_per_second': round(sum(codes.values()) / elapsed, 1),
+    }
+
+
+def run(requests=300, logins=16, **kwargs):
+    # Задержка каталога (p99) при шторме входов: хэши на потоках запросов против пула
+    from backend.wsgi import application
+
+    if not Tour.objects.exists():
+        raise ValueError('Нет данных для замера: запустите generate_catalogue')
+    pages = max(1, min(20, Tour.objects.count() // settings.REST_FRAMEWORK.get('PAGE_SIZE', 10)))
+    pool = getattr(settings, 'PASSWORD_HASHING', {})
+    configs = {
+        'baseline': pool,
+        'unbounded': {**pool, 'WORKERS': logins, 'MAX_PENDING': logins},
+        'pooled': pool,
+    }
+    response_cache = {**getattr(settings, 'RESPONSE_CACHE', {}), 'TTL': 0}
+
+    result = {'meta': {'requests': requests, 'logins': logins, 'pool': pool,
+                       'iterations': PBKDF2PasswordHasher.iterations}}
+    # Замер всегда с настоящим PBKDF2, даже если в настройках быстрый хэшер
+    with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher'],
+                           RESPONSE_CACHE=response_cache):
+        user, _ = User.objects.get_or_create(username=USERNAME)
+        user.set_password(PASSWORD)
+        user.save()
+        try:
+            for mode in MODES:
+                with override_settings(PASSWORD_HASHING=configs[mode]):
+                    result[mode] = run_mode(application, mode, requests, logins, pages)
+        finally:
+            user.delete()
+    return result
@@ -0,0 +1,44 @@
+from django.test import Client
+
+from app.benchmarks import measure
+from app.benchmarks.data import seed_catalogue
+from app.models import Tour
+from app.pagination import encode_cursor
+
+PAGE_SIZE = 10
+
+
+def add_arguments(parser):
+    parser.add_argument('--seed', action='store_true',
+                        help='Сгенерировать синтетические данные перед замером')
+    parser.add_argument('--tours', type=int, default=200_000)
+    parser.add_argument('--page', type=int, default=10_000)
+    parser.add_argument('--iterations', type=int, default=50)
+
+
+def run(seed=False, tours=200_000, page=10_000, iterations=50, **kwargs):
+    result = {}
+    if seed:
+        result['data'] = seed_catalogue(tours=tours, users=1, favourites=0)
+
+    client = Client(HTTP_HOST='localhost')
+
+    # Курсор, указывающий на начало той же страницы, что и ?page=N
+    offset = (page - 1) * PAGE_SIZE
+    row = Tour.objects.order_by('price', 'id').values_list('price', 'id')[offset - 1]
+    deep_cursor = encode_cursor(row)
+
+    scenarios = {
+        'page_1': '/api/tour/?page=1',
+        f'page_{page}': f'/api/tour/?page={page}',
+        'page_1_no_count': '/api/tour/?page=1&count=false',
+        f'page_{page}_no_count': f'/api/tour/?page={page}&count=false',
+        'cursor_1': '/api/tour/?pagination=cursor',
+        f'cursor_{page}': f'/api/tour/?cursor={deep_cursor}',
+    }
+    for name, url in scenarios.items():
+        response = client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+        result[name] = measure(lambda: client.get(url), iterations=iterations)
+
+    return result
@@ -0,0 +1,48 @@
+import time
+
+from django.core.cache import cache
+from django.db.models import Count
+from django.test import Client
+
+from app import rankings
+from app.benchmarks import measure
+from app.benchmarks.data import seed_catalogue
+from app.models import Tour
+
+
+def add_arguments(parser):
+    parser.add_argument('--seed', action='store_true',
+                        help='Сгенерировать синтетические данные перед замером')
+    parser.add_argument('--favourites', type=int, default=1_000_000)
+    parser.add_argument('--tours', type=int, default=20_000)
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--iterations', type=int, default=200)
+
+
+def run(seed=False, favourites=1_000_000, tours=20_000, users=20_000, iterations=200, **kwargs):
+    result = {}
+    if seed:
+        result['data'] = seed_catalogue(tours=tours, users=users, favourites=favourites)
+
+    # before и after замеряются одинаково и одинаковое число раз: получение семи
+    # туров со справочниками. after_endpoint — для справки весь запрос к API
+    client = Client(HTTP_HOST='localhost')
+
+    def before():
+        # Прежняя реализация: агрегат по всей таблице избранного на каждый запрос
+        list(Tour.objects.annotate(favourites_total=Count('favourites'))
+             .select_related('company', 'country').order_by('-favourites_total')[:7])
+
+    def after():
+        ids = rankings.get_popular_ids()
+        Tour.objects.select_related('company', 'country').in_bulk(ids)
+
+    cache.clear()
+    started = time.perf_counter()
+    result['refresh_scopes'] = rankings.refresh()
+    result['refresh_seconds'] = round(time.perf_counter() - started, 2)
+
+    result['before'] = measure(before, iterations=iterations)
+    result['after'] = measure(after, iterations=iterations)
+    result['after_endpoint'] = measure(lambda: client.get('/api/tour/popular/'), iterations=iterations)
+    return result
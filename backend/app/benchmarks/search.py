@@ -0,0 +1,35 @@
+import time
+
+from django.test import Client
+
+from app import search
+from app.benchmarks import measure
+from app.benchmarks.data import seed_catalogue
+
+QUERIES = ['турция', 'горящий круиз', 'байкал', 'экскурсия море', 'дайвинг кипр']
+
+
+def add_arguments(parser):
+    parser.add_argument('--seed', action='store_true',
+                        help='Сгенерировать синтетические данные перед замером')
+    parser.add_argument('--tours', type=int, default=1_000_000)
+    parser.add_argument('--reindex', action='store_true',
+                        help='Перестроить индекс перед замером')
+    parser.add_argument('--iterations', type=int, default=50)
+
+
+def run(seed=False, tours=1_000_000, reindex=False, iterations=50, **kwargs):
+    result = {'backend': 'postgresql' if search.use_postgres() else 'inverted-index'}
+    if seed:
+        result['data'] = seed_catalogue(tours=tours, users=1, favourites=0)
+
+    if seed or reindex:
+        started = time.perf_counter()
+        result['indexed'] = search.rebuild()
+        result['index_seconds'] = round(time.perf_counter() - started, 1)
+
+    client = Client(HTTP_HOST='localhost')
+    for query in QUERIES:
+        result[query] = measure(
+            lambda: client.get('/api/tour/search/', {'q': query}), iterations=iterations)
+    return result
@@ -0,0 +1,44 @@
+from rest_framework.renderers import JSONRenderer
+
+from app.benchmarks import measure
+from app.models import Reservation, Tour
+from app.serializers import (ReservationSerializer, TourSerializer, compiled_reservation_serializer,
+                             compiled_tour_serializer)
+
+CASES = {
+    'tour': (TourSerializer, compiled_tour_serializer,
+             lambda: Tour.objects.select_related('company', 'country').order_by('pk')),
+    'reservation': (ReservationSerializer, compiled_reservation_serializer,
+                    lambda: Reservation.objects.select_related('target__tour', 'status').order_by('pk')),
+}
+
+
+def add_arguments(parser):
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--iterations', type=int, default=30)
+
+
+def run(rows=1000, iterations=30, **kwargs):
+    # Время на rows строк: только сериализация (объекты/строки уже загружены)
+    # и полный путь «запрос + сериализация»
+    renderer = JSONRenderer()
+    result = {'rows': rows}
+    for name, (serializer_class, compiled, queryset) in CASES.items():
+        instances = list(queryset()[:rows])
+        values = list(compiled.values(queryset()[:rows]))
+        if len(instances) < rows:
+            raise ValueError(f'{name}: в БД {len(instances)} строк из {rows}, запустите generate_catalogue')
+
+        before = renderer.render(serializer_class(instances, many=True).data)
+        after = renderer.render(compiled.serialize(values))
+        result[name] = {
+            'identical': before == after,
+            'serialize_before': measure(lambda: serializer_class(instances, many=True).data,
+                                        iterations=iterations),
+            'serialize_after': measure(lambda: compiled.serialize(values), iterations=iterations),
+            'query_and_serialize_before': measure(
+                lambda: serializer_class(list(queryset()[:rows]), many=True).data, iterations=iterations),
+            'query_and_serialize_after': measure(
+                lambda: compiled.serialize(compiled.values(queryset()[:rows])), iterations=iterations),
+        }
+    return result
@@ -0,0 +1,84 @@
+import itertools
+import time
+from decimal import Decimal
+
+from django.db import connection, transaction
+from transliterate import slugify as transliterate_slugify
+
+from app.addons import unique_slugify_bulk
+from app.models import Company, Country, Tour
+
+TITLE = 'Тур в Турцию'
+
+
+def add_arguments(parser):
+    parser.add_argument('--count', type=int, default=10_000)
+    parser.add_argument('--legacy-count', type=int, default=1_000,
+                        help='Сколько туров сохранять старым алгоритмом (он квадратичный)')
+
+
+def legacy_unique_slugify(instance, slug_field, source_field):
+    # Прежняя реализация: один exists() на каждый кандидат
+    slug = transliterate_slugify(getattr(instance, source_field), language_code='ru')
+    unique_slug = slug
+    for i in itertools.count(1):
+        if not instance.__class__.objects.filter(**{slug_field: unique_slug}).exists():
+            break
+        unique_slug = f'{slug}-{i}'
+    return unique_slug
+
+
+def _tour(company, country):
+    return Tour(company=company, country=country, title=TITLE, price=Decimal('100.00'),
+                img_preview_url='https://example.com/t.png', short_description='-')
+
+
+def _timed(fn):
+    queries = 0
+
+    def count(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+    return {'seconds': round(elapsed, 3), 'queries': queries}
+
+
+def run(count=10_000, legacy_count=1_000, **kwargs):
+    result = {}
+
+    with transaction.atomic():
+        company = Company.objects.create(
+            name='bench-slugs', phone='79990000000', address='-',
+            description='-', image='https://example.com/c.png')
+        country = Country.objects.create(name='bench-slugs')
+
+        def legacy():
+            for _ in range(legacy_count):
+                tour = _tour(company, country)
+                tour.slug = legacy_unique_slugify(tour, 'slug', 'title')
+                tour.save()
+
+        def per_object():
+            for _ in range(count):
+                _tour(company, country).save()
+
+        def bulk():
+            tours = [_tour(company, country) for _ in range(count)]
+            for tour, slug in zip(tours, unique_slugify_bulk(Tour, 'slug', [TITLE] * count)):
+                tour.slug = slug
+            Tour.objects.bulk_create(tours, batch_size=1000)
+
+        result[f'legacy_save_{legacy_count}'] = _timed(legacy)
+        Tour.objects.filter(company=company).delete()
+        result[f'save_{count}'] = _timed(per_object)
+        Tour.objects.filter(company=company).delete()
+        result[f'bulk_{count}'] = _timed(bulk)
+
+        transaction.set_rollback(True)
+
+    return result
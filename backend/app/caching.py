@@ -0,0 +1,278 @@
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils.module_loading import import_string
+
+from app import metrics
+
+DEFAULTS = {
+    'BACKEND': 'app.caching.LRUBackend',
+    'OPTIONS': {},
+    'TTL': 60,
+}
+
+# Параметры, не влияющие на ответ
+IGNORED_PARAMS = {'_'}
+
+# Заголовки, которые ставит finalize_response DRF; при попадании в кэш
+# представление не вызывается, поэтому они сохраняются вместе с ответом
+REPLAYED_HEADERS = ('Vary', 'Allow')
+
+
+class LRUBackend:
+    # Кэш в памяти процесса; версии групп хранятся отдельно и не вытесняются
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_versions(self, groups):
+        with self.lock:
+            return {group: self.versions.setdefault(group, time.time()) for group in groups}
+
+    def bump(self, group):
+        with self.lock:
+            self.versions[group] = max(time.time(), self.versions.get(group, 0) + 1e-6)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.versions.clear()
+
+    # Операции в памяти не блокируют цикл событий — асинхронные версии тривиальны
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value, ttl):
+        self.set(key, value, ttl)
+
+    async def aget_versions(self, groups):
+        return self.get_versions(groups)
+
+
+class DjangoCacheBackend:
+    # Общий кэш Django (например, RedisCache) — инвалидация видна всем воркерам
+    def __init__(self, alias='default', prefix='response'):
+        self.cache = caches[alias]
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.cache.get(f'{self.prefix}:{key}')
+
+    def set(self, key, value, ttl):
+        self.cache.set(f'{self.prefix}:{key}', value, timeout=ttl)
+
+    def get_versions(self, groups):
+        keys = {f'{self.prefix}:version:{group}': group for group in groups}
+        stored = self.cache.get_many(keys)
+        versions = {keys[key]: value for key, value in stored.items()}
+        missing = {key: time.time() for key, group in keys.items() if group not in versions}
+        if missing:
+            self.cache.set_many(missing, timeout=None)
+            versions.update({keys[key]: value for key, value in missing.items()})
+        return versions
+
+    def bump(self, group):
+        self.cache.set(f'{self.prefix}:version:{group}', time.time(), timeout=None)
+
+    def clear(self):
+        self.cache.clear()
+
+    async def aget(self, key):
+        return await self.cache.aget(f'{self.prefix}:{key}')
+
+    async def aset(self, key, value, ttl):
+        await self.cache.aset(f'{self.prefix}:{key}', value, timeout=ttl)
+
+    async def aget_versions(self, groups):
+        keys = {f'{self.prefix}:version:{group}': group for group in groups}
+        stored = await self.cache.aget_many(keys)
+        versions = {keys[key]: value for key, value in stored.items()}
+        missing = {key: time.time() for key, group in keys.items() if group not in versions}
+        if missing:
+            await self.cache.aset_many(missing, timeout=None)
+            versions.update({keys[key]: value for key, value in missing.items()})
+        return versions
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'RESPONSE_CACHE', {})}
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = get_config()
+                _backend = import_string(config['BACKEND'])(**config['OPTIONS'])
+    return _backend
+
+
+def invalidate(*groups):
+    backend = get_backend()
+    for group in groups:
+        backend.bump(group)
+
+
+def is_anonymous(request):
+    # Персональные ответы не кэшируются; аутентификацию DRF при этом не запускаем
+    return ('HTTP_AUTHORIZATION' not in request.META
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES)
+
+
+def cache_key(request, versions):
+    params = sorted(
+        (key, value)
+        for key in request.GET if key not in IGNORED_PARAMS
+        for value in request.GET.getlist(key)
+    )
+    # Хост входит в ключ: абсолютные ссылки в ответе (пагинация, картинки) зависят от него
+    raw = repr((request.get_host(), request.path, params, request.META.get('HTTP_ACCEPT', ''),
+                sorted(versions.items())))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return etag in [value.strip() for value in if_none_match.split(',')] or if_none_match == '*'
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and int(last_modified) <= if_modified_since
+
+
+def with_validators(response, entry, status):
+    for name, value in entry.get('headers', {}).items():
+        response[name] = value
+    # Кэшируется только анонимный ответ (is_anonymous): он зависит от этих заголовков.
+    # Без этого Vary: Cookie появлялся бы только у промаха — от SessionMiddleware
+    patch_vary_headers(response, ('Cookie', 'Authorization'))
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    response['Cache-Control'] = 'no-cache'
+    response['X-Cache'] = status
+    return response
+
+
+def cached_response(request, entry):
+    if not_modified(request, entry['etag'], entry['last_modified']):
+        return with_validators(HttpResponseNotModified(), entry, 'HIT')
+    response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    return with_validators(response, entry, 'HIT')
+
+
+def make_entry(response, versions):
+    if hasattr(response, 'render'):
+        response.render()
+    return {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'headers': {name: response[name] for name in REPLAYED_HEADERS if response.has_header(name)},
+        'etag': f'"{hashlib.sha1(response.content).hexdigest()}"',
+        'last_modified': max(versions.values(), default=time.time()),
+    }
+
+
+def fresh_response(request, response, entry):
+    if not_modified(request, entry['etag'], entry['last_modified']):
+        return with_validators(HttpResponseNotModified(), entry, 'MISS')
+    return with_validators(response, entry, 'MISS')
+
+
+class CachedResponseMixin:
+    # Кэширует анонимные GET-ответы перечисленных действий. Ключ — хост, путь,
+    # нормализованные параметры и версии групп cache_groups, которые
+    # сдвигаются сигналами при изменении моделей (см. app.signals)
+    cache_groups = ()
+    cached_actions = ('list', 'retrieve')
+
+    def get_cache_groups(self, action, **kwargs):
+        return tuple(self.cache_groups)
+
+    def dispatch(self, request, *args, **kwargs):
+        action = getattr(self, 'action_map', {}).get(request.method.lower())
+        if (request.method not in ('GET', 'HEAD') or action not in self.cached_actions
+                or not is_anonymous(request)):
+            return super().dispatch(request, *args, **kwargs)
+
+        backend = get_backend()
+        versions = backend.get_versions(self.get_cache_groups(action, **kwargs))
+        key = cache_key(request, versions)
+        view = f'{self.basename}.{action}'
+
+        entry = backend.get(key)
+        if entry is not None:
+            metrics.inc('response_cache_hits_total', view=view)
+            return cached_response(request, entry)
+
+        metrics.inc('response_cache_misses_total', view=view)
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+
+        entry = make_entry(response, versions)
+        backend.set(key, entry, get_config()['TTL'])
+        return fresh_response(request, response, entry)
+
+
+def cache_async_view(name, groups, kwarg_groups=None):
+    # То же для асинхронных представлений (app.async_views); kwarg_groups(**kwargs)
+    # добавляет группы, зависящие от параметров URL (например, tour:<slug>)
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not is_anonymous(request):
+                return await view(request, *args, **kwargs)
+
+            backend = get_backend()
+            view_groups = tuple(groups) + (kwarg_groups(**kwargs) if kwarg_groups else ())
+            versions = await backend.aget_versions(view_groups)
+            key = cache_key(request, versions)
+
+            entry = await backend.aget(key)
+            if entry is not None:
+                metrics.inc('response_cache_hits_total', view=name)
+                return cached_response(request, entry)
+
+            metrics.inc('response_cache_misses_total', view=name)
+            response = await view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+            entry = make_entry(response, versions)
+            await backend.aset(key, entry, get_config()['TTL'])
+            return fresh_response(request, response, entry)
+        return wrapper
+    return decorator
@@ -0,0 +1,90 @@
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+
+from app.middleware import serializing
+
+
+class CompiledSerializer:
+    # Плоский режим чтения для списков: поля сериализатора разбираются один раз
+    # в план (ключ ответа, lookup для values(), функция представления), после чего
+    # словари строятся прямо из строк values() без создания моделей и обхода полей DRF.
+    # Результат совпадает с serializer_class(many=True).data.
+    #   method_sources — lookup для SerializerMethodField, которые лишь читают атрибут
+    def __init__(self, serializer_class, method_sources=None, prefix=''):
+        self.serializer_class = serializer_class
+        self.plan = []
+        self.lookups = []
+
+        method_sources = method_sources or {}
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            lookup = prefix + '__'.join(field.source_attrs)
+
+            if isinstance(field, serializers.SerializerMethodField):
+                if name not in method_sources:
+                    raise TypeError(f'{serializer_class.__name__}.{name}: нужен lookup в method_sources')
+                self.add(name, prefix + method_sources[name])
+            elif isinstance(field, serializers.ListSerializer):
+                raise TypeError(f'{serializer_class.__name__}.{name}: many=True не поддерживается')
+            elif isinstance(field, serializers.BaseSerializer):
+                # Вложенный объект: свой план с префиксом; None — если пуст внешний ключ
+                nested = CompiledSerializer(type(field), prefix=lookup + '__')
+                self.add(name, lookup, nested=nested)
+                self.lookups.extend(nested.lookups)
+            elif isinstance(field, PrimaryKeyRelatedField):
+                # values() отдаёт значение внешнего ключа, как PKOnlyObject в DRF
+                self.add(name, lookup)
+            elif isinstance(field, (serializers.ModelField, serializers.FileField,
+                                    serializers.RelatedField, serializers.HiddenField)):
+                raise TypeError(f'{serializer_class.__name__}.{name}: '
+                                f'{type(field).__name__} не поддерживается')
+            elif isinstance(field, serializers.ReadOnlyField):
+                self.add(name, lookup)
+            elif (isinstance(field, serializers.CharField)
+                  and type(field).to_representation is serializers.CharField.to_representation):
+                # CharField.to_representation — это str(); вызываем его напрямую
+                self.add(name, lookup, convert=str)
+            else:
+                self.add(name, lookup, convert=field.to_representation)
+
+    def add(self, name, lookup, convert=None, nested=None):
+        self.lookups.append(lookup)
+        self.plan.append((name, lookup, convert, nested))
+
+    def build(self, row):
+        data = {}
+        for name, lookup, convert, nested in self.plan:
+            value = row[lookup]
+            if value is not None:
+                if nested is not None:
+                    value = nested.build(row)
+                elif convert is not None:
+                    value = convert(value)
+            data[name] = value
+        return data
+
+    def values(self, queryset, *extra):
+        # extra — поля, нужные помимо ответа (например, для курсора пагинации)
+        return queryset.values(*dict.fromkeys([*self.lookups, *extra]))
+
+    def serialize(self, rows):
+        build = self.build
+        with serializing():
+            return [build(row) for row in rows]
+
+
+class CompiledListMixin:
+    # list() вьюсета через CompiledSerializer; поля keyset_ordering добавляются
+    # в values(), чтобы курсорная пагинация могла построить следующий курсор
+    compiled_serializer = None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = self.compiled_serializer.values(queryset, *getattr(self, 'keyset_ordering', ()))
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.compiled_serializer.serialize(page))
+        return Response(self.compiled_serializer.serialize(rows))
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Value, When
+
+DEFAULTS = {
+    'TTL': 10 * 60,
+    # Границы ценовых корзин: [0, 10000), [10000, 30000), ..., [100000, ∞)
+    'PRICE_BUCKETS': [10000, 30000, 50000, 100000],
+}
+
+VERSION_KEY = 'facets:version'
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'TOUR_FACETS', {})}
+
+
+def invalidate():
+    # Новая версия делает недоступными все ранее сохранённые фасеты
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def cache_key(params, filter_names):
+    normalized = {
+        name: sorted(value.strip() for value in params.getlist(name))
+        for name in sorted(filter_names) if params.get(name, '').strip()
+    }
+    digest = hashlib.sha1(json.dumps(normalized, ensure_ascii=False).encode()).hexdigest()
+    # Версия начинается не с 1: после вытеснения ключа версии старые фасеты не оживут
+    return f'facets:{cache.get_or_set(VERSION_KEY, time.time_ns, timeout=None)}:{digest}'
+
+
+def price_bucket(bounds):
+    whens = [When(price__lt=bound, then=Value(i)) for i, bound in enumerate(bounds)]
+    return Case(*whens, default=Value(len(bounds)), output_field=IntegerField())
+
+
+def compute(queryset, config=None):
+    config = config or get_config()
+    bounds = [Decimal(bound) for bound in config['PRICE_BUCKETS']]
+
+    # Один GROUP BY по сочетаниям (страна, компания, корзина) вместо запроса на каждый фасет
+    rows = queryset.order_by().values(
+        'country_id', 'country__name', 'company_id', 'company__name', 'company__slug',
+        bucket=price_bucket(bounds),
+    ).annotate(total=Count('pk'))
+
+    countries, companies, prices = {}, {}, defaultdict(int)
+    for row in rows:
+        country = countries.setdefault(row['country_id'], {
+            'name': row['country__name'], 'count': 0})
+        country['count'] += row['total']
+        company = companies.setdefault(row['company_id'], {
+            'name': row['company__name'], 'slug': row['company__slug'], 'count': 0})
+        company['count'] += row['total']
+        prices[row['bucket']] += row['total']
+
+    edges = [None] + list(config['PRICE_BUCKETS']) + [None]
+    return {
+        'country': sorted(countries.values(), key=lambda item: (-item['count'], item['name'])),
+        'company': sorted(companies.values(), key=lambda item: (-item['count'], item['name'])),
+        'price': [
+            {'min': edges[i], 'max': edges[i + 1], 'count': prices[i]}
+            for i in range(len(bounds) + 1) if prices[i]
+        ],
+    }
+
+
+def get_facets(queryset, params, filter_names):
+    config = get_config()
+    key = cache_key(params, filter_names)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute(queryset, config)
+        cache.set(key, facets, timeout=config['TTL'])
+    return facets
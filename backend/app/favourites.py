@@ -0,0 +1,45 @@
+from app.models import Favourites, Tour
+
+# Сколько слагов принимают пакетные эндпоинты
+BATCH_LIMIT = 1000
+
+
+def get_slugs(user, slugs):
+    # Какие из слагов в избранном у пользователя — один запрос по индексу
+    # unique_favourite. Не кэшируется: после добавления или удаления ответ
+    # сразу верен в любом воркере, без общего кэша и его инвалидации
+    slugs = list(slugs)
+    if not slugs:
+        return frozenset()
+    return frozenset(Favourites.objects.filter(
+        customer_id=user.pk, target__slug__in=slugs).values_list('target__slug', flat=True))
+
+
+def mark(request, items):
+    # Добавляет is_favorite в сериализованные туры для авторизованного пользователя
+    if not request.user.is_authenticated:
+        return items
+    slugs = get_slugs(request.user, [item['slug'] for item in items])
+    for item in items:
+        item['is_favorite'] = item['slug'] in slugs
+    return items
+
+
+def parse_slugs(value, limit=BATCH_LIMIT):
+    # Список слагов из тела запроса; None — если формат неверный
+    if not isinstance(value, list) or len(value) > limit:
+        return None
+    if not all(isinstance(slug, str) for slug in value):
+        return None
+    return list(dict.fromkeys(value))
+
+
+def add_many(user, slugs):
+    # Одна выборка туров и один INSERT; возвращает (добавлено, неизвестные слаги)
+    tours = dict(Tour.objects.filter(slug__in=slugs).values_list('slug', 'pk'))
+    added = Favourites.objects.add_many(user, tours.values())
+    return added, [slug for slug in slugs if slug not in tours]
+
+
+def remove_many(user, slugs):
+    return Favourites.objects.remove(customer=user, target__slug__in=slugs)
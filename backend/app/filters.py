@@ -1,17 +1,22 @@
 from django_filters import FilterSet, NumberFilter, CharFilter
 
+from app import lookups
 from app.models import Tour, Company
 
 
 class TourFilter(FilterSet):
     min_price = NumberFilter(field_name="price", lookup_expr='gte')
     max_price = NumberFilter(field_name="price", lookup_expr='lte')
-    country = CharFilter(field_name='country__name', lookup_expr='icontains')
+    country = CharFilter(method='filter_country')
 
     class Meta:
         model = Tour
         fields = ['country', 'price']
 
+    def filter_country(self, queryset, name, value):
+        # Подходящие страны ищутся в справочнике в памяти — без JOIN с country
+        return queryset.filter(country_id__in=lookups.countries.ids_containing(value))
+
 
 class CompanyFilter(FilterSet):
     name = CharFilter(field_name='name', lookup_expr='icontains')
@@ -0,0 +1,198 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework.exceptions import APIException
+from rest_framework.views import APIView
+
+from app import metrics
+
+# Хэширование паролей (PBKDF2 и др.) в ограниченном пуле потоков: hashlib
+# отпускает GIL, так что пул действительно выполняет хэши параллельно запросам,
+# но одновременно их не больше WORKERS, а в очереди — не больше MAX_PENDING.
+# Остальные запросы API сразу получают 503 вместо того, чтобы занимать воркеры
+DEFAULTS = {
+    'WORKERS': 2,
+    'MAX_PENDING': 32,
+    # Сколько секунд запрос ждёт результат, прежде чем сдаться
+    'TIMEOUT': 10,
+}
+
+
+class HashingOverloaded(APIException):
+    status_code = 503
+    default_detail = 'Сервер перегружен, повторите попытку позже'
+    default_code = 'hashing_overloaded'
+    # DRF отдаёт его в заголовке Retry-After
+    wait = 1
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'PASSWORD_HASHING', {})}
+
+
+class HashingPool:
+    def __init__(self, workers, max_pending):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self.slots = threading.BoundedSemaphore(workers + max_pending)
+        self.lock = threading.Lock()
+        self.depth = 0
+
+    def set_depth(self, delta):
+        with self.lock:
+            self.depth += delta
+            metrics.set_gauge('password_hash_queue_depth', self.depth)
+
+    def submit(self, operation, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            metrics.inc('password_hash_rejected_total', operation=operation)
+            raise HashingOverloaded()
+        self.set_depth(1)
+        queued = time.perf_counter()
+
+        def task():
+            started = time.perf_counter()
+            metrics.observe('password_hash_wait_seconds', started - queued, operation=operation)
+            try:
+                return fn(*args)
+            finally:
+                metrics.observe('password_hash_seconds', time.perf_counter() - started,
+                                operation=operation)
+
+        def done(_):
+            self.slots.release()
+            self.set_depth(-1)
+
+        try:
+            future = self.executor.submit(task)
+        except BaseException:
+            done(None)
+            raise
+        future.add_done_callback(done)
+        return future
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+_pool = None
+_pool_config = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool, _pool_config
+    config = get_config()
+    key = (config['WORKERS'], config['MAX_PENDING'])
+    with _pool_lock:
+        if _pool is None or _pool_config != key:
+            # Старый пул (после смены настроек) дорабатывает уже принятые задачи
+            if _pool is not None:
+                _pool.executor.shutdown(wait=False)
+            _pool, _pool_config = HashingPool(*key), key
+        return _pool
+
+
+# True внутри представлений DRF (см. PasswordHashingMiddleware): только там
+# HashingOverloaded превращается в 503. Админка, формы Django и команды при
+# заполненном пуле хэшируют в своём потоке, а не падают с 500
+_shed_load = ContextVar('password_hashing_shed_load', default=False)
+
+
+def is_api_view(view_func):
+    view_class = getattr(view_func, 'cls', None)
+    return isinstance(view_class, type) and issubclass(view_class, APIView)
+
+
+class PasswordHashingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = _shed_load.set(False)
+        try:
+            return self.get_response(request)
+        finally:
+            _shed_load.reset(token)
+
+    async def __acall__(self, request):
+        token = _shed_load.set(False)
+        try:
+            return await self.get_response(request)
+        finally:
+            _shed_load.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _shed_load.set(is_api_view(view_func))
+
+
+def run(operation, fn, *args):
+    if not _shed_load.get():
+        try:
+            future = get_pool().submit(operation, fn, *args)
+        except HashingOverloaded:
+            return fn(*args)
+        return future.result()
+    future = get_pool().submit(operation, fn, *args)
+    try:
+        return future.result(timeout=get_config()['TIMEOUT'])
+    except TimeoutError:
+        metrics.inc('password_hash_timeouts_total', operation=operation)
+        raise HashingOverloaded()
+
+
+async def arun(operation, fn, *args):
+    if not _shed_load.get():
+        try:
+            future = get_pool().submit(operation, fn, *args)
+        except HashingOverloaded:
+            return await sync_to_async(fn, thread_sensitive=False)(*args)
+        return await asyncio.wrap_future(future)
+    future = get_pool().submit(operation, fn, *args)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), get_config()['TIMEOUT'])
+    except asyncio.TimeoutError:
+        metrics.inc('password_hash_timeouts_total', operation=operation)
+        raise HashingOverloaded()
+
+
+def make_password(password):
+    # Непригодный пароль (None) — просто случайная строка, пул не нужен
+    if password is None:
+        return hashers.make_password(None)
+    return run('make', hashers.make_password, password)
+
+
+async def amake_password(password):
+    if password is None:
+        return hashers.make_password(None)
+    return await arun('make', hashers.make_password, password)
+
+
+def check_password(password, encoded, setter=None):
+    # Как django.contrib.auth.hashers.check_password, но setter (пересохранение
+    # хэша с новыми параметрами) вызывается в потоке запроса, а не в пуле
+    is_correct, must_update = run('check', hashers.verify_password, password, encoded)
+    if setter and is_correct and must_update:
+        setter(password)
+    return is_correct
+
+
+async def acheck_password(password, encoded, setter=None):
+    is_correct, must_update = await arun('check', hashers.verify_password, password, encoded)
+    if setter and is_correct and must_update:
+        await setter(password)
+    return is_correct
@@ -0,0 +1,344 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from django.conf import settings
+from django.core import signing
+from django.http import FileResponse, HttpResponseNotModified, JsonResponse
+from django.views.decorators.http import require_safe
+from PIL import Image, ImageOps
+
+from app import metrics
+
+# Прокси внешних картинок туров и компаний: оригинал скачивается один раз,
+# уменьшенные копии (WebP/JPEG) лежат в дисковом кэше с LRU-вытеснением по размеру.
+# Ссылки подписаны (signing), поэтому прокси не открыт для произвольных адресов
+DEFAULTS = {
+    # Serializers отдают ссылки на прокси, только если он включён
+    'ENABLED': False,
+    # Префикс для абсолютных ссылок (фронтенд живёт на другом origin)
+    'BASE_URL': '',
+    'WIDTHS': [320, 640, 1280, 1920],
+    # По умолчанию — BASE_DIR/image-cache (вне MEDIA_ROOT)
+    'CACHE_DIR': None,
+    'CACHE_SIZE': 512 * 1024 * 1024,
+    'MAX_BYTES': 15 * 1024 * 1024,
+    'MAX_PIXELS': 50_000_000,
+    'TIMEOUT': 5,
+    'MAX_REDIRECTS': 3,
+    'QUALITY': 80,
+    'MAX_AGE': 7 * 24 * 60 * 60,
+    # Только для тестов и разработки: разрешить адреса локальной сети
+    'ALLOW_PRIVATE_NETWORKS': False,
+}
+SIGNING_SALT = 'app.imageproxy'
+FORMATS = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+
+class ProxyError(Exception):
+    def __init__(self, message, status=502):
+        self.status = status
+        super().__init__(message)
+
+
+def get_config():
+    config = {**DEFAULTS, **getattr(settings, 'IMAGE_PROXY', {})}
+    config['CACHE_DIR'] = config['CACHE_DIR'] or os.path.join(settings.BASE_DIR, 'image-cache')
+    return config
+
+
+def signature(url, width):
+    return signing.Signer(salt=SIGNING_SALT).signature(f'{width}:{url}')
+
+
+def proxied_url(url, width):
+    # Ссылка на прокси для внешней картинки; при выключенном прокси — исходный адрес
+    # Вызывается на каждую строку списков: выключенный прокси проверяем без get_config()
+    if not url or not getattr(settings, 'IMAGE_PROXY', {}).get('ENABLED', DEFAULTS['ENABLED']):
+        return url
+    config = get_config()
+    width = min((w for w in config['WIDTHS'] if w >= width), default=max(config['WIDTHS']))
+    query = urllib.parse.urlencode({'url': url, 'w': width, 's': signature(url, width)})
+    return f'{config["BASE_URL"]}/api/image-proxy/?{query}'
+
+
+def check_address(address, config):
+    if not config['ALLOW_PRIVATE_NETWORKS'] and not ipaddress.ip_address(address.split('%')[0]).is_global:
+        raise ProxyError('Адрес источника недоступен', status=400)
+
+
+def check_host(url, config):
+    # Защита от SSRF: только http(s) и только публичные адреса
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ProxyError('Поддерживаются только http(s)-адреса', status=400)
+    if config['ALLOW_PRIVATE_NETWORKS']:
+        return
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+    except socket.gaierror:
+        raise ProxyError('Не удалось разрешить адрес источника')
+    for *_, sockaddr in addresses:
+        check_address(sockaddr[0], config)
+
+
+def checked_create_connection(config):
+    # Соединение резолвит имя ещё раз, и DNS может ответить уже другим адресом
+    # (DNS rebinding): проверяем адрес открытого сокета до отправки запроса и TLS
+    def create_connection(*args, **kwargs):
+        sock = socket.create_connection(*args, **kwargs)
+        try:
+            check_address(sock.getpeername()[0], config)
+        except ProxyError:
+            sock.close()
+            raise
+        return sock
+    return create_connection
+
+
+class CheckedConnectionMixin:
+    connection_class = None
+
+    def __init__(self, config):
+        super().__init__()
+        self.config = config
+
+    def connect(self, host, **kwargs):
+        connection = self.connection_class(host, **kwargs)
+        connection._create_connection = checked_create_connection(self.config)
+        return connection
+
+
+class CheckedHTTPHandler(CheckedConnectionMixin, urllib.request.HTTPHandler):
+    connection_class = http.client.HTTPConnection
+
+    def http_open(self, req):
+        return self.do_open(self.connect, req)
+
+
+class CheckedHTTPSHandler(CheckedConnectionMixin, urllib.request.HTTPSHandler):
+    connection_class = http.client.HTTPSConnection
+
+    def https_open(self, req):
+        return self.do_open(self.connect, req, context=self._context)
+
+
+class CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def __init__(self, config):
+        self.config = config
+        self.max_redirections = config['MAX_REDIRECTS']
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        # Каждый адрес перенаправления проходит ту же проверку
+        check_host(newurl, self.config)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def fetch(url, config):
+    check_host(url, config)
+    # Прокси из окружения отключён: проверять нужно адрес самого источника
+    opener = urllib.request.build_opener(
+        CheckedRedirectHandler(config), CheckedHTTPHandler(config), CheckedHTTPSHandler(config),
+        urllib.request.ProxyHandler({}))
+    request = urllib.request.Request(url, headers={'User-Agent': 'tourism-image-proxy'})
+    started = time.perf_counter()
+    try:
+        with opener.open(request, timeout=config['TIMEOUT']) as response:
+            if not response.headers.get_content_type().startswith('image/'):
+                raise ProxyError('Источник вернул не изображение')
+            # Читаем частями и обрываем слишком большие файлы
+            data = io.BytesIO()
+            while chunk := response.read(64 * 1024):
+                data.write(chunk)
+                if data.tell() > config['MAX_BYTES']:
+                    raise ProxyError('Изображение слишком большое')
+    except (urllib.error.URLError, OSError) as exc:
+        raise ProxyError(f'Источник недоступен: {exc}')
+    finally:
+        metrics.observe('image_proxy_fetch_seconds', time.perf_counter() - started)
+    return data.getvalue()
+
+
+def render(original, width, fmt, config):
+    image = Image.open(io.BytesIO(original))
+    if image.width * image.height > config['MAX_PIXELS']:
+        raise ProxyError('Изображение слишком большое')
+    # JPEG декодируется сразу в уменьшенном виде
+    image.draft('RGB', (width, width * 4))
+    transparent = 'A' in image.getbands() or 'transparency' in image.info
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('RGBA' if fmt == 'webp' and transparent else 'RGB')
+    if image.width > width:
+        image.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    options = {'quality': config['QUALITY']}
+    if fmt == 'jpeg':
+        options.update(optimize=True, progressive=True)
+    image.save(buffer, fmt.upper(), **options)
+    return buffer.getvalue()
+
+
+class DiskCache:
+    # Файлы кэша: <dir>/<aa>/<sha256>.<ext>; mtime — время последнего обращения.
+    # Размер считается приблизительно и уточняется полным обходом при вытеснении
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.size = None
+
+    def path(self, key, ext):
+        return os.path.join(self.directory, key[:2], f'{key}.{ext}')
+
+    def open(self, key, ext):
+        # Открытый файл остаётся читаемым, даже если его тут же вытеснят
+        path = self.path(key, ext)
+        try:
+            file = open(path, 'rb')
+        except OSError:
+            return None
+        os.utime(path)
+        return file
+
+    def read(self, key, ext):
+        file = self.open(key, ext)
+        if file is None:
+            return None
+        with file:
+            return file.read()
+
+    def set(self, key, ext, data):
+        path = self.path(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Запись через временный файл: читатели не увидят файл наполовину
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(data)
+        os.replace(temporary, path)
+        file = open(path, 'rb')
+
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self.entries())
+            else:
+                self.size += len(data)
+            if self.size > self.max_size:
+                self.evict()
+        return file
+
+    def entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def evict(self):
+        # Удаляем давно не запрошенные файлы, пока не освободим 10% лимита
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_size * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            metrics.inc('image_proxy_evictions_total')
+        self.size = total
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+# Параллельные запросы одной картинки ждут единственной загрузки (блокировки по хэшу ключа)
+_key_locks = [threading.Lock() for _ in range(64)]
+
+
+def get_cache(config):
+    key = (config['CACHE_DIR'], config['CACHE_SIZE'])
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = DiskCache(*key)
+        return _caches[key]
+
+
+def key_lock(key):
+    return _key_locks[int(key[:8], 16) % len(_key_locks)]
+
+
+def get_variant(url, width, fmt, config):
+    cache = get_cache(config)
+    source_key = hashlib.sha256(url.encode()).hexdigest()
+    variant_key = hashlib.sha256(f'{url}\n{width}\n{fmt}'.encode()).hexdigest()
+    ext = 'webp' if fmt == 'webp' else 'jpg'
+
+    file = cache.open(variant_key, ext)
+    if file:
+        metrics.inc('image_proxy_requests_total', result='hit')
+        return variant_key, file
+
+    with key_lock(source_key):
+        file = cache.open(variant_key, ext)
+        if file:
+            metrics.inc('image_proxy_requests_total', result='hit')
+            return variant_key, file
+        original = cache.read(source_key, 'orig')
+        if original is None:
+            original = fetch(url, config)
+            cache.set(source_key, 'orig', original).close()
+        metrics.inc('image_proxy_requests_total', result='miss')
+        return variant_key, cache.set(variant_key, ext, render(original, width, fmt, config))
+
+
+@require_safe
+def image_proxy(request):
+    config = get_config()
+    url = request.GET.get('url', '')
+    try:
+        width = int(request.GET.get('w', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Width must be a valid integer'}, status=400)
+    if width not in config['WIDTHS']:
+        return JsonResponse({'error': f'Width must be one of {config["WIDTHS"]}'}, status=400)
+    if not signing.constant_time_compare(request.GET.get('s', ''), signature(url, width)):
+        return JsonResponse({'error': 'Invalid signature'}, status=403)
+
+    fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+    try:
+        key, file = get_variant(url, width, fmt, config)
+    except ProxyError as exc:
+        metrics.inc('image_proxy_requests_total', result='error')
+        return JsonResponse({'error': str(exc)}, status=exc.status)
+    except (OSError, Image.DecompressionBombError, SyntaxError):
+        metrics.inc('image_proxy_requests_total', result='error')
+        return JsonResponse({'error': 'Не удалось обработать изображение'}, status=502)
+
+    # mtime файла кэша — время обращения (LRU), поэтому только ETag, без Last-Modified
+    headers = {
+        'ETag': f'"{key[:32]}"',
+        'Cache-Control': f'public, max-age={config["MAX_AGE"]}',
+        'Vary': 'Accept',
+    }
+    if headers['ETag'] in request.headers.get('If-None-Match', ''):
+        file.close()
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(file, content_type=FORMATS[fmt])
+    for name, value in headers.items():
+        response[name] = value
+    return response
@@ -0,0 +1,325 @@
+import csv
+import itertools
+import json
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from app import caching, facets, lookups, search
+from app.addons import unique_slugify_bulk
+from app.models import Company, Country, Tour, TourInfo, TourTimeSpan
+
+COMPANY = 'company'
+TOUR = 'tour'
+
+COMPANY_FIELDS = ['phone', 'address', 'description', 'image']
+TOUR_FIELDS = ['title', 'img_preview_url', 'price', 'short_description']
+TOUR_INFO_FIELDS = ['description', 'img_url', 'img_background_url', 'placed']
+TIMESPAN_FIELDS = ['group_name', 'date_from', 'date_to', 'place_count']
+
+
+class RowError(Exception):
+    pass
+
+
+@dataclass
+class ImportStats:
+    rows: int = 0
+    companies: int = 0
+    tours: int = 0
+    timespans: int = 0
+    errors: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.perf_counter() - self.started
+        return self.rows / elapsed if elapsed else 0.0
+
+
+def read_csv(path):
+    # В CSV каждая строка — тур с не более чем одним периодом (колонки TIMESPAN_FIELDS)
+    with open(path, newline='', encoding='utf-8') as f:
+        for line_no, row in enumerate(csv.DictReader(f), start=2):
+            row = {key: value for key, value in row.items() if value not in (None, '')}
+            if any(key in row for key in TIMESPAN_FIELDS):
+                row['timespans'] = [{key: row.pop(key, None) for key in TIMESPAN_FIELDS}]
+            yield line_no, row
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, RowError(f'Некорректный JSON: {e}')
+
+
+def _parse_datetime(value):
+    parsed = parse_datetime(value or '')
+    if parsed is None:
+        raise RowError(f'Некорректная дата: {value!r}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _require(record, keys):
+    missing = [key for key in keys if record.get(key) in (None, '')]
+    if missing:
+        raise RowError(f'Не заполнены поля: {", ".join(missing)}')
+
+
+class CatalogueImporter:
+    def __init__(self, chunk_size=1000, on_error=None, on_progress=None):
+        self.chunk_size = chunk_size
+        self.on_error = on_error or (lambda line_no, message: None)
+        self.on_progress = on_progress or (lambda stats: None)
+        self.stats = ImportStats()
+        # Справочники загружаются один раз и пополняются по ходу импорта
+        self.countries = dict(Country.objects.values_list('name', 'pk'))
+        self.companies = dict(Company.objects.values_list('name', 'pk'))
+        # Туры без slug'а в файле сопоставляются с уже существующими по (компания, название):
+        # k-я такая строка обновляет k-й по pk тур, лишние вставляются
+        self.existing = {}
+
+    def run(self, records):
+        records = iter(records)
+        while chunk := list(itertools.islice(records, self.chunk_size)):
+            self.import_chunk(chunk)
+            self.on_progress(self.stats)
+        facets.invalidate()
+        caching.invalidate('tour', 'company', 'country')
+        return self.stats
+
+    def error(self, line_no, message):
+        self.stats.errors += 1
+        self.on_error(line_no, str(message))
+
+    def import_chunk(self, chunk):
+        self.stats.rows += len(chunk)
+        companies, tour_records, tours = [], [], []
+
+        # Компании пакета сохраняются раньше туров, которые на них ссылаются
+        for line_no, record in chunk:
+            if isinstance(record, Exception):
+                self.error(line_no, record)
+            elif record.get('type', TOUR) == COMPANY:
+                try:
+                    companies.append((line_no, self.build_company(record)))
+                except (RowError, ValidationError) as e:
+                    self.error(line_no, e)
+            else:
+                tour_records.append((line_no, record))
+        self.save_companies(companies)
+
+        for line_no, record in tour_records:
+            try:
+                tours.append((line_no, record, self.build_tour(record)))
+            except (RowError, ValidationError) as e:
+                self.error(line_no, e)
+        self.save_tours(tours)
+
+    def build_company(self, record):
+        _require(record, ['name'] + COMPANY_FIELDS)
+        company = Company(name=record['name'], **{key: record[key] for key in COMPANY_FIELDS})
+        company.full_clean(exclude=['slug'], validate_unique=False, validate_constraints=False)
+        return company
+
+    def build_tour(self, record):
+        _require(record, ['company', 'country'] + TOUR_FIELDS)
+        if record['company'] not in self.companies:
+            raise RowError(f'Компания не найдена: {record["company"]}')
+
+        try:
+            price = Decimal(str(record['price']))
+        except InvalidOperation:
+            raise RowError(f'Некорректная цена: {record["price"]!r}')
+
+        tour = Tour(
+            company_id=self.companies[record['company']],
+            slug=record.get('slug', ''),
+            price=price,
+            **{key: record[key] for key in TOUR_FIELDS if key != 'price'}
+        )
+        tour.upsert = bool(tour.slug)
+        tour.full_clean(exclude=['company', 'country', 'slug'],
+                        validate_unique=False, validate_constraints=False)
+
+        tour.info = None
+        if any(key in record for key in TOUR_INFO_FIELDS):
+            tour.info = TourInfo(**{key: record.get(key, '') for key in TOUR_INFO_FIELDS})
+            tour.info.full_clean(exclude=['tour'], validate_unique=False, validate_constraints=False)
+
+        tour.timespans = []
+        for item in record.get('timespans') or []:
+            _require(item, TIMESPAN_FIELDS)
+            try:
+                place_count = int(item['place_count'])
+            except (TypeError, ValueError):
+                raise RowError(f'Некорректное число мест: {item["place_count"]!r}')
+            tour.timespans.append(TourTimeSpan(
+                group_name=item['group_name'],
+                date_from=_parse_datetime(item['date_from']),
+                date_to=_parse_datetime(item['date_to']),
+                place_count=place_count,
+            ))
+        return tour
+
+    def resolve_countries(self, names):
+        missing = [name for name in dict.fromkeys(names) if name not in self.countries]
+        if missing:
+            Country.objects.bulk_create(
+                [Country(name=name) for name in missing], ignore_conflicts=True)
+            # bulk_create не вызывает сигналы, справочник стран сбрасываем сами
+            transaction.on_commit(lookups.countries.invalidate)
+            self.countries.update(
+                Country.objects.filter(name__in=missing).values_list('name', 'pk'))
+
+    def save_companies(self, companies):
+        if not companies:
+            return
+
+        new = [company for _, company in companies if company.name not in self.companies]
+        for company, slug in zip(new, unique_slugify_bulk(
+                Company, 'slug', [company.name for company in new])):
+            company.slug = slug
+
+        objects = [company for _, company in companies]
+        failed = self.write(companies, lambda: Company.objects.bulk_create(
+            objects, update_conflicts=True, unique_fields=['name'], update_fields=COMPANY_FIELDS))
+
+        self.companies.update(Company.objects.filter(
+            name__in=[company.name for company in objects]).values_list('name', 'pk'))
+        self.stats.companies += len(objects) - failed
+
+    def save_tours(self, tours):
+        if not tours:
+            return
+
+        self.resolve_countries(record['country'] for _, record, _ in tours)
+        for _, record, tour in tours:
+            tour.country_id = self.countries[record['country']]
+
+        self.match_existing([tour for _, _, tour in tours if not tour.slug],
+                            {tour.slug for _, _, tour in tours if tour.slug})
+        self.assign_slugs([tour for _, _, tour in tours if not tour.slug])
+
+        rows = [(line_no, tour) for line_no, _, tour in tours]
+        self.write(rows, lambda: self.write_tours([tour for _, tour in rows]))
+
+    def match_existing(self, tours, claimed):
+        keys = {(tour.company_id, tour.title) for tour in tours} - self.existing.keys()
+        if keys:
+            for key in keys:
+                self.existing[key] = deque()
+            matches = Tour.objects.filter(
+                company_id__in={company_id for company_id, _ in keys},
+                title__in={title for _, title in keys},
+            ).order_by('pk')
+            for company_id, title, slug in matches.values_list('company_id', 'title', 'slug'):
+                if (company_id, title) in keys:
+                    self.existing[company_id, title].append(slug)
+
+        for tour in tours:
+            # Тур, который в этом же пакете указан по slug'у, второй раз не берём
+            candidates = self.existing[tour.company_id, tour.title]
+            while candidates and candidates[0] in claimed:
+                candidates.popleft()
+            if candidates:
+                tour.slug = candidates.popleft()
+                tour.upsert = True
+
+    def assign_slugs(self, tours):
+        for tour, slug in zip(tours, unique_slugify_bulk(Tour, 'slug', [tour.title for tour in tours])):
+            tour.slug = slug
+
+    def insert_tours(self, tours, attempts=5):
+        # Выделенный slug могла занять параллельная запись: такие туры получают новый
+        for attempt in range(attempts):
+            try:
+                with transaction.atomic():
+                    Tour.objects.bulk_create(tours)
+                return
+            except IntegrityError:
+                for tour in tours:
+                    tour.pk = None
+                taken = set(Tour.objects.filter(
+                    slug__in=[tour.slug for tour in tours]).values_list('slug', flat=True))
+                if not taken or attempt == attempts - 1:
+                    raise
+                self.assign_slugs([tour for tour in tours if tour.slug in taken])
+
+    def write_tours(self, tours):
+        # Повторная запись после отката пакета не должна опираться на старые pk
+        for tour in tours:
+            tour.pk = None
+
+        # Обновляются только туры со slug'ом из файла или найденные по названию.
+        # Выделенные slug'и только вставляются: upsert по ним перезаписал бы чужой тур
+        Tour.objects.bulk_create(
+            [tour for tour in tours if tour.upsert], update_conflicts=True, unique_fields=['slug'],
+            update_fields=['company', 'country'] + TOUR_FIELDS)
+        self.insert_tours([tour for tour in tours if not tour.upsert])
+        ids = dict(Tour.objects.filter(
+            slug__in=[tour.slug for tour in tours]).values_list('slug', 'pk'))
+        for tour in tours:
+            tour.pk = ids[tour.slug]
+
+        infos = []
+        for tour in tours:
+            if tour.info is not None:
+                tour.info.tour_id = tour.pk
+                infos.append(tour.info)
+        TourInfo.objects.bulk_create(
+            infos, update_conflicts=True, unique_fields=['tour'], update_fields=TOUR_INFO_FIELDS)
+
+        # Повторный импорт не дублирует уже существующие периоды
+        existing = set(TourTimeSpan.objects.filter(tour_id__in=ids.values()).values_list(
+            'tour_id', 'group_name', 'date_from'))
+        timespans = []
+        for tour in tours:
+            for timespan in tour.timespans:
+                timespan.tour_id = tour.pk
+                if (tour.pk, timespan.group_name, timespan.date_from) not in existing:
+                    timespans.append(timespan)
+        TourTimeSpan.objects.bulk_create(timespans)
+
+        # bulk_create не вызывает сигналы, поэтому поисковый индекс обновляем сами
+        search.index_tours([tour.pk for tour in tours])
+
+        self.stats.tours += len(tours)
+        self.stats.timespans += len(timespans)
+
+    def write(self, rows, bulk_write):
+        try:
+            with transaction.atomic():
+                bulk_write()
+            return 0
+        except DatabaseError:
+            pass
+
+        # Пакет не прошёл целиком — повторяем построчно, чтобы найти плохие строки
+        failed = 0
+        for line_no, obj in rows:
+            try:
+                with transaction.atomic():
+                    if isinstance(obj, Tour):
+                        self.write_tours([obj])
+                    else:
+                        Company.objects.bulk_create(
+                            [obj], update_conflicts=True, unique_fields=['name'],
+                            update_fields=COMPANY_FIELDS)
+            except DatabaseError as e:
+                failed += 1
+                self.error(line_no, e)
+        return failed
@@ -0,0 +1,89 @@
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from app.models import Country, ReservationStatus, SocialMediaType
+
+# Как часто (в секундах) процесс сверяет свою копию с версией в общем кэше
+DEFAULT_CHECK_INTERVAL = 5
+
+
+class LookupTable:
+    # Маленький справочник (id ↔ имя) целиком в памяти процесса.
+    # Версия лежит в общем кэше Django: invalidate() в одном воркере
+    # заставляет остальные перечитать таблицу при следующей сверке
+    def __init__(self, model, field):
+        self.model = model
+        self.field = field
+        self.version_key = f'lookups:version:{model._meta.label_lower}'
+        self.lock = threading.Lock()
+        self.version = None
+        self.checked = 0
+        self.names = {}
+        self.ids = {}
+
+    def load(self):
+        interval = getattr(settings, 'LOOKUP_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL)
+        if self.version is not None and time.monotonic() - self.checked < interval:
+            return
+        with self.lock:
+            version = cache.get(self.version_key)
+            if version is None:
+                cache.add(self.version_key, time.time(), timeout=None)
+                version = cache.get(self.version_key)
+            # Версия читается до таблицы: изменение между ними вызовет ещё одно чтение
+            if version is None or version != self.version:
+                rows = list(self.model.objects.values_list('pk', self.field))
+                self.names = dict(rows)
+                self.ids = {name: pk for pk, name in rows}
+                self.version = version
+            self.checked = time.monotonic()
+
+    async def aload(self):
+        # Для async-представлений: после aload() обращения не идут в БД до следующей сверки
+        await sync_to_async(self.load)()
+
+    def reload_if_exists(self, **filters):
+        # bulk_create и update() не шлют сигналов, и версия могла остаться старой:
+        # прежде чем считать значение неизвестным, сверяемся с БД
+        if self.model.objects.filter(**filters).exists():
+            self.invalidate()
+            self.load()
+
+    def get_id(self, name):
+        self.load()
+        if name not in self.ids:
+            self.reload_if_exists(**{self.field: name})
+        return self.ids.get(name)
+
+    def get_name(self, pk):
+        self.load()
+        return self.names.get(pk)
+
+    def ids_containing(self, text):
+        # Аналог name__icontains без JOIN
+        self.load()
+        folded = text.casefold()
+        ids = [pk for pk, name in self.names.items() if folded in name.casefold()]
+        if not ids:
+            self.reload_if_exists(**{f'{self.field}__icontains': text})
+            ids = [pk for pk, name in self.names.items() if folded in name.casefold()]
+        return ids
+
+    def reset(self):
+        with self.lock:
+            self.version = None
+
+    def invalidate(self):
+        self.reset()
+        cache.set(self.version_key, time.time(), timeout=None)
+
+
+countries = LookupTable(Country, 'name')
+reservation_statuses = LookupTable(ReservationStatus, 'status')
+social_media_types = LookupTable(SocialMediaType, 'type')
+
+TABLES = {table.model: table for table in (countries, reservation_statuses, social_media_types)}
@@ -0,0 +1,21 @@
+import importlib
+import json
+
+from django.core.management.base import BaseCommand
+
+BENCHMARKS = ['concurrency', 'endpoints', 'logins', 'pagination', 'popular', 'search', 'serializers', 'slugs']
+
+
+class Command(BaseCommand):
+    help = 'Запускает замер производительности и печатает результат в JSON'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='benchmark', required=True)
+        for name in BENCHMARKS:
+            module = importlib.import_module(f'app.benchmarks.{name}')
+            module.add_arguments(subparsers.add_parser(name))
+
+    def handle(self, *args, **options):
+        module = importlib.import_module(f'app.benchmarks.{options["benchmark"]}')
+        result = module.run(**options)
+        self.stdout.write(json.dumps(result, ensure_ascii=False, indent=2))
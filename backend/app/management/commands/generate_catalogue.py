@@ -0,0 +1,53 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import caching, facets, search
+from app.benchmarks.data import seed_catalogue
+from app.models import Company, Country, User
+
+
+class Command(BaseCommand):
+    help = 'Генерирует синтетический каталог для замеров производительности (bulk insert)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=20)
+        parser.add_argument('--countries', type=int, default=10)
+        parser.add_argument('--tours', type=int, default=1000)
+        parser.add_argument('--timespans', type=int, default=3, help='Периодов на тур')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--favourites', type=int, default=10000)
+        parser.add_argument('--reservations', type=int, default=10000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора случайных чисел')
+        parser.add_argument('--flush', action='store_true',
+                            help='Удалить ранее сгенерированные данные перед генерацией')
+        parser.add_argument('--no-index', action='store_true',
+                            help='Не перестраивать поисковый индекс')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['flush']:
+            # Каскад удаляет туры, периоды, бронирования и избранное
+            User.objects.filter(username__startswith='bench-user-').delete()
+            Company.objects.filter(slug__startswith='bench-company-').delete()
+            Country.objects.filter(name__startswith='bench-country-').delete()
+        elif Company.objects.filter(slug__startswith='bench-company-').exists():
+            raise CommandError('Синтетические данные уже есть, используйте --flush')
+
+        result = seed_catalogue(
+            companies=options['companies'], countries=options['countries'],
+            tours=options['tours'], users=options['users'], favourites=options['favourites'],
+            timespans=options['timespans'], reservations=options['reservations'],
+            batch_size=options['batch_size'], seed=options['seed'])
+        result['seed_seconds'] = round(time.perf_counter() - started, 2)
+
+        # bulk_create не вызывает сигналы — индекс и кэши обновляем сами
+        if not options['no_index']:
+            search.rebuild()
+        facets.invalidate()
+        caching.invalidate('tour', 'company', 'country')
+        result['total_seconds'] = round(time.perf_counter() - started, 2)
+
+        self.stdout.write(json.dumps(result, ensure_ascii=False, indent=2))
@@ -0,0 +1,47 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.importer import CatalogueImporter, read_csv, read_jsonl
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+class Command(BaseCommand):
+    help = 'Потоковый импорт компаний, туров, описаний и периодов из CSV/JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=READERS, default=None,
+                            help='По умолчанию определяется по расширению файла')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--errors', default=None,
+                            help='Файл для ошибок по строкам (JSONL), по умолчанию stderr')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if fmt not in READERS:
+            raise CommandError(f'Неизвестный формат: {fmt}')
+
+        errors = open(options['errors'], 'w', encoding='utf-8') if options['errors'] else sys.stderr
+
+        def on_error(line_no, message):
+            errors.write(json.dumps({'line': line_no, 'error': message}, ensure_ascii=False) + '\n')
+
+        def on_progress(stats):
+            self.stdout.write(f'{stats.rows} строк, {stats.rows_per_second:.0f} строк/с, '
+                              f'ошибок: {stats.errors}')
+
+        try:
+            importer = CatalogueImporter(options['chunk_size'], on_error, on_progress)
+            stats = importer.run(READERS[fmt](path))
+        finally:
+            if errors is not sys.stderr:
+                errors.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {stats.rows} строк за {stats.rows / stats.rows_per_second if stats.rows else 0:.1f}с '
+            f'({stats.rows_per_second:.0f} строк/с); компаний {stats.companies}, туров {stats.tours}, '
+            f'периодов {stats.timespans}, ошибок {stats.errors}'))
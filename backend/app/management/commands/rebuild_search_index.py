@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс туров'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано туров: {count} за {time.perf_counter() - started:.1f}с'))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import rankings
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинги популярных туров и сохраняет их в кэш; '
+            'веб-воркеры видят результат только при общем CACHES')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Пересчитывать периодически, а не один раз')
+        parser.add_argument('--interval', type=int, default=None,
+                            help='Период пересчёта в секундах (по умолчанию STALE_AFTER)')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or rankings.get_config()['STALE_AFTER']
+
+        while True:
+            started = time.perf_counter()
+            scopes = rankings.refresh()
+            self.stdout.write(self.style.SUCCESS(
+                f'Рейтинги обновлены: {scopes} срезов за {time.perf_counter() - started:.2f}с'))
+
+            if not options['loop']:
+                return
+            time.sleep(interval)
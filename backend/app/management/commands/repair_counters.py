@@ -0,0 +1,102 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+
+from app.models import Favourites, Reservation, Tour, TourTimeSpan
+from app.reservations import LEDGER_COLUMNS
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        removed = self.remove_duplicate_favourites(options['dry_run'])
+        self.stdout.write(self.style.SUCCESS(
+            f'дубликаты избранного: удалено — {removed}'))
+
+        fixed = self.repair_favourites(options['batch_size'], options['dry_run'])
+        self.stdout.write(self.style.SUCCESS(
+            f'favourites_count: исправлено туров — {fixed}'))
+
+        fixed = self.repair_ledger(options['batch_size'], options['dry_run'])
+        self.stdout.write(self.style.SUCCESS(
+            f'учёт мест: исправлено периодов — {fixed}'))
+
+    def remove_duplicate_favourites(self, dry_run):
+        # Нужно до включения ограничения unique_favourite на существующей базе
+        duplicates = Favourites.objects.values('customer_id', 'target_id').annotate(
+            first=Min('pk'), total=Count('pk')).filter(total__gt=1)
+
+        removed = 0
+        with transaction.atomic():
+            for row in duplicates.iterator():
+                queryset = Favourites.objects.filter(
+                    customer_id=row['customer_id'], target_id=row['target_id']
+                ).exclude(pk=row['first'])
+                removed += row['total'] - 1
+                if not dry_run:
+                    queryset.delete()
+        return removed
+
+    def repair_favourites(self, batch_size, dry_run):
+        fixed = 0
+        last_id = 0
+
+        while True:
+            batch = list(
+                Tour.objects.filter(pk__gt=last_id).order_by('pk')
+                .values_list('pk', 'favourites_count')[:batch_size]
+            )
+            if not batch:
+                return fixed
+            last_id = batch[-1][0]
+
+            with transaction.atomic():
+                actual = dict(
+                    Favourites.objects.filter(
+                        target_id__in=[pk for pk, _ in batch]
+                    ).values_list('target_id').annotate(total=Count('pk'))
+                )
+                drifted = [
+                    Tour(pk=pk, favourites_count=actual.get(pk, 0))
+                    for pk, stored in batch if actual.get(pk, 0) != stored
+                ]
+                if drifted and not dry_run:
+                    Tour.objects.bulk_update(drifted, ['favourites_count'])
+            fixed += len(drifted)
+
+    def repair_ledger(self, batch_size, dry_run):
+        columns = list(LEDGER_COLUMNS.values())
+        fixed = 0
+        last_id = 0
+
+        while True:
+            batch = list(
+                TourTimeSpan.objects.filter(pk__gt=last_id).order_by('pk')
+                .values_list('pk', *columns)[:batch_size]
+            )
+            if not batch:
+                return fixed
+            last_id = batch[-1][0]
+
+            with transaction.atomic():
+                actual = {}
+                sums = Reservation.objects.filter(
+                    target_id__in=[row[0] for row in batch],
+                    status__status__in=LEDGER_COLUMNS,
+                ).values_list('target_id', 'status__status').annotate(seats=Sum('count'))
+                for target_id, status_code, seats in sums:
+                    actual[(target_id, LEDGER_COLUMNS[status_code])] = seats
+
+                drifted = []
+                for pk, *stored in batch:
+                    expected = [actual.get((pk, column), 0) for column in columns]
+                    if expected != stored:
+                        drifted.append(TourTimeSpan(pk=pk, **dict(zip(columns, expected))))
+                if drifted and not dry_run:
+                    TourTimeSpan.objects.bulk_update(drifted, columns)
+            fixed += len(drifted)
@@ -0,0 +1,151 @@
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+# Раздача MEDIA_ROOT без static(): ETag/Last-Modified, Range и выгрузка байтов
+# фронтовому серверу. OFFLOAD: None — файл отдаёт Django через wsgi.file_wrapper
+# (gunicorn/uwsgi превращают его в os.sendfile); 'x-accel' — nginx по
+# X-Accel-Redirect на ACCEL_PREFIX; 'x-sendfile' — Apache/lighttpd по X-Sendfile
+DEFAULTS = {
+    'OFFLOAD': None,
+    'ACCEL_PREFIX': '/protected-media/',
+    'MAX_AGE': 60 * 60,
+}
+
+# Файлы с хэшем содержимого в пути (см. app.avatars) никогда не меняются
+IMMUTABLE_PATH = re.compile(r'(^|/)[0-9a-f]{64}([./]|$)')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'MEDIA_SERVING', {})}
+
+
+class FileRange:
+    # Окно файла [start, start + length): read() не выходит за его границы,
+    # а fileno() и позиция позволяют серверу отправить окно через sendfile
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def etag_for(st):
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def parse_range(header, size):
+    # (start, end) включительно; None — заголовок не про одно окно (отдаём файл целиком);
+    # ValueError — окно вне файла (416)
+    match = RANGE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:
+        length = int(end)
+        if length == 0:
+            raise ValueError
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError
+    return start, end
+
+
+def not_modified(request, etag, mtime):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+    since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return since is not None and int(mtime) <= since
+
+
+@require_safe
+def serve(request, path):
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Файл не найден')
+    try:
+        st = os.stat(fullpath)
+    except OSError:
+        raise Http404('Файл не найден')
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404('Файл не найден')
+
+    config = get_config()
+    etag = etag_for(st)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(st.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': (f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+                          if IMMUTABLE_PATH.search(path) else f'public, max-age={config["MAX_AGE"]}'),
+    }
+
+    if not_modified(request, etag, st.st_mtime):
+        response = HttpResponseNotModified()
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+
+    if config['OFFLOAD'] == 'x-accel':
+        # nginx сам разберёт Range и условные заголовки
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['X-Accel-Redirect'] = config['ACCEL_PREFIX'].rstrip('/') + '/' + path.lstrip('/')
+        return response
+    if config['OFFLOAD'] == 'x-sendfile':
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['X-Sendfile'] = fullpath
+        return response
+
+    start, end = 0, st.st_size - 1
+    status = 200
+    range_header = request.headers.get('Range')
+    # If-Range с другим ETag: файл изменился — отдаём его целиком
+    if range_header and request.headers.get('If-Range', etag) == etag:
+        try:
+            window = parse_range(range_header, st.st_size)
+        except ValueError:
+            return HttpResponse(status=416, headers={'Content-Range': f'bytes */{st.st_size}'})
+        if window:
+            start, end = window
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{st.st_size}'
+
+    length = end - start + 1
+    if request.method == 'HEAD':
+        response = HttpResponse(status=status, content_type=content_type, headers=headers)
+    else:
+        response = FileResponse(FileRange(open(fullpath, 'rb'), start, length), status=status,
+                                content_type=content_type, headers=headers)
+    response['Content-Length'] = length
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,94 @@
+import bisect
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = {}
+_histograms = {}
+
+# Границы корзин по умолчанию — в секундах, как у клиентов Prometheus
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    with _lock:
+        _counters[(name, _labels(labels))] += amount
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[(name, _labels(labels))] = value
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {
+                'buckets': tuple(buckets), 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        # Считаем попадания в корзины без накопления, накопительные суммы — при выводе
+        position = bisect.bisect_left(histogram['buckets'], value)
+        if position < len(histogram['buckets']):
+            histogram['counts'][position] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+
+def gauges():
+    with _lock:
+        return dict(_gauges)
+
+
+def histograms():
+    with _lock:
+        return {key: {**value, 'counts': list(value['counts'])} for key, value in _histograms.items()}
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def render_prometheus():
+    lines = []
+    seen = set()
+    for (name, labels), value in sorted(counters().items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f'# TYPE {name} counter')
+        lines.append(f'{name}{_format_labels(labels)} {value:g}')
+
+    for (name, labels), value in sorted(gauges().items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name}{_format_labels(labels)} {value:g}')
+
+    for (name, labels), histogram in sorted(histograms().items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f'# TYPE {name} histogram')
+        total = 0
+        for bound, count in zip(histogram['buckets'], histogram['counts']):
+            total += count
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", f"{bound:g}"),))} {total}')
+        lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {histogram["count"]}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {histogram["sum"]:g}')
+        lines.append(f'{name}_count{_format_labels(labels)} {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,199 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from rest_framework import serializers
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERY_BUDGET = {
+    # Допустимое число SQL-запросов на запрос; None — без ограничения
+    'DEFAULT': None,
+    # Лимиты для отдельных представлений: {'tour.get_full_info': 2}
+    'VIEWS': {},
+    # True — исключение вместо предупреждения в логе (для тестов)
+    'RAISE': False,
+}
+
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+class QueryBudgetExceeded(Exception):
+    def __init__(self, view, queries, budget):
+        super().__init__(f'{view}: {queries} SQL queries, budget is {budget}')
+        self.view = view
+        self.queries = queries
+        self.budget = budget
+
+
+def get_query_budget():
+    return {**DEFAULT_QUERY_BUDGET, **getattr(settings, 'QUERY_BUDGET', {})}
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.serialize_duration = 0.0
+        self.serializing = False
+
+
+# Статистика текущего запроса. Контекстная переменная, а не обёртка на время
+# запроса: асинхронный ORM выполняет SQL в другом потоке, но с тем же контекстом
+_current_stats = ContextVar('query_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.duration += time.perf_counter() - start
+        stats.count += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # Подключается к connection_created (см. app.signals) для каждого соединения
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def serializing():
+    # Время сериализаторов текущего запроса; вложенные вызовы (ListSerializer →
+    # Serializer, CompiledSerializer) учитываются один раз — внешним
+    stats = _current_stats.get()
+    if stats is None or stats.serializing:
+        yield
+        return
+    stats.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialize_duration += time.perf_counter() - start
+        stats.serializing = False
+
+
+def timed_data(data):
+    def fget(self):
+        with serializing():
+            return data.fget(self)
+
+    fget.timed = True
+    return property(fget, doc=data.__doc__)
+
+
+def install_serializer_timer():
+    # serializer.data у сериализаторов DRF; вызывается из AppConfig.ready()
+    for cls in (serializers.BaseSerializer, serializers.Serializer, serializers.ListSerializer):
+        data = cls.__dict__['data']
+        if not getattr(data.fget, 'timed', False):
+            cls.data = timed_data(data)
+
+
+def view_name(request):
+    match = request.resolver_match
+    if match is None:
+        return None
+    # Для вьюсетов DRF — «basename.action», например tour.get_full_info
+    initkwargs = getattr(match.func, 'initkwargs', None) or {}
+    actions = getattr(match.func, 'actions', None) or {}
+    action = actions.get(request.method.lower())
+    if initkwargs.get('basename') and action:
+        return f'{initkwargs["basename"]}.{action}'
+    return match.view_name or getattr(match.func, '__name__', 'unknown')
+
+
+class InstrumentationMiddleware:
+    # Число и время SQL-запросов, время сериализаторов (serializer.data),
+    # рендеринга ответа и общее время
+    # по каждому представлению: заголовок Server-Timing и гистограммы в app.metrics.
+    # Работает и под WSGI, и под ASGI, не переводя асинхронные представления в поток
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start, stats, token = self.begin(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self.finish(request, response, start, stats)
+
+    async def __acall__(self, request):
+        start, stats, token = self.begin(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self.finish(request, response, start, stats)
+
+    def begin(self, request):
+        stats = QueryStats()
+        request._render_duration = 0.0
+        return time.perf_counter(), stats, _current_stats.set(stats)
+
+    def finish(self, request, response, start, stats):
+        total = time.perf_counter() - start
+        view = view_name(request)
+        if view is None:
+            return response
+
+        render = request._render_duration
+        metrics.observe('http_request_duration_seconds', total, view=view)
+        metrics.observe('http_request_db_duration_seconds', stats.duration, view=view)
+        metrics.observe('http_request_serialize_duration_seconds', stats.serialize_duration, view=view)
+        metrics.observe('http_request_render_duration_seconds', render, view=view)
+        metrics.observe('http_request_db_queries', stats.count, buckets=QUERY_BUCKETS, view=view)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"',
+            f'serialize;dur={stats.serialize_duration * 1000:.1f}',
+            f'render;dur={render * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+        self.check_budget(view, stats.count)
+        return response
+
+    def process_template_response(self, request, response):
+        # Response DRF рендерится после выхода из представления: замеряем
+        # от этого момента до окончания рендеринга
+        start = time.perf_counter()
+
+        def finished(rendered):
+            request._render_duration = time.perf_counter() - start
+
+        response.add_post_render_callback(finished)
+        return response
+
+    async def aprocess_template_response(self, request, response):
+        return InstrumentationMiddleware.process_template_response(self, request, response)
+
+    def check_budget(self, view, queries):
+        config = get_query_budget()
+        budget = config['VIEWS'].get(view, config['DEFAULT'])
+        if budget is None or queries <= budget:
+            return
+        metrics.inc('query_budget_exceeded_total', view=view)
+        if config['RAISE']:
+            raise QueryBudgetExceeded(view, queries, budget)
+        logger.warning('%s: %d SQL queries, budget is %d', view, queries, budget)
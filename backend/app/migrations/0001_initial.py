@@ -0,0 +1,217 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:51
+
+import django.contrib.auth.models
+import django.contrib.auth.validators
+import django.contrib.postgres.search
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Company',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('phone', models.CharField(max_length=11, validators=[django.core.validators.RegexValidator(message="Номер телефона должен быть в формате: '+999999999'. Допускается до 15 цифр.", regex='^\\+?1?\\d{9,15}$')])),
+                ('address', models.TextField()),
+                ('slug', models.SlugField(editable=False, unique=True)),
+                ('description', models.TextField()),
+                ('image', models.URLField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Country',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=120, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReservationStatus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('paid', 'Оплачено'), ('completed', 'Завершено'), ('no_show', 'Клиент не явился'), ('waiting', 'Ожидание оплаты'), ('paid_back', 'Возврат средств'), ('moved', 'Перенесено'), ('declined', 'Отклонено')], max_length=20, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SocialMediaType',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(max_length=120, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Tour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=100)),
+                ('slug', models.SlugField(editable=False, unique=True)),
+                ('img_preview_url', models.URLField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('short_description', models.CharField(max_length=120)),
+                ('favourites_count', models.PositiveIntegerField(default=0, editable=False)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.company')),
+                ('country', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.country')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('password', models.CharField(max_length=128, verbose_name='password')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('is_superuser', models.BooleanField(default=False, help_text='Designates that this user has all permissions without explicitly assigning them.', verbose_name='superuser status')),
+                ('username', models.CharField(error_messages={'unique': 'A user with that username already exists.'}, help_text='Required. 150 characters or fewer. Letters, digits and @/./+/-/_ only.', max_length=150, unique=True, validators=[django.contrib.auth.validators.UnicodeUsernameValidator()], verbose_name='username')),
+                ('first_name', models.CharField(blank=True, max_length=150, verbose_name='first name')),
+                ('last_name', models.CharField(blank=True, max_length=150, verbose_name='last name')),
+                ('email', models.EmailField(blank=True, max_length=254, verbose_name='email address')),
+                ('is_staff', models.BooleanField(default=False, help_text='Designates whether the user can log into this admin site.', verbose_name='staff status')),
+                ('is_active', models.BooleanField(default=True, help_text='Designates whether this user should be treated as active. Unselect this instead of deleting accounts.', verbose_name='active')),
+                ('date_joined', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date joined')),
+                ('phone', models.CharField(blank=True, max_length=20)),
+                ('avatar', models.ImageField(blank=True, upload_to='avatars/')),
+                ('is_api_user', models.BooleanField(default=True)),
+                ('groups', models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_set', related_query_name='user', to='auth.group', verbose_name='groups')),
+                ('user_permissions', models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='user_set', related_query_name='user', to='auth.permission', verbose_name='user permissions')),
+            ],
+            options={
+                'verbose_name': 'user',
+                'verbose_name_plural': 'users',
+                'abstract': False,
+            },
+            managers=[
+                ('objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SlugCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('base', models.CharField(max_length=255)),
+                ('last', models.IntegerField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('model', 'base'), name='unique_slug_counter')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SocialMedia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(default='', max_length=120, unique=True)),
+                ('date_to', models.DateTimeField(editable=False)),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.company')),
+                ('media_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.socialmediatype')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TourSearchDocument',
+            fields=[
+                ('tour', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='app.tour')),
+                ('vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Feedback',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField()),
+                ('datetime', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.tour')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Favourites',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datetime', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.tour')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TourInfo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('description', models.TextField(blank=True)),
+                ('img_url', models.URLField()),
+                ('img_background_url', models.URLField()),
+                ('placed', models.TextField()),
+                ('tour', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='app.tour')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TourSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.FloatField()),
+                ('tour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.tour')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TourTimeSpan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_name', models.CharField(max_length=100)),
+                ('date_from', models.DateTimeField()),
+                ('date_to', models.DateTimeField()),
+                ('place_count', models.IntegerField()),
+                ('places_reserved', models.PositiveIntegerField(default=0, editable=False)),
+                ('places_paid', models.PositiveIntegerField(default=0, editable=False)),
+                ('tour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.tour')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField()),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('status', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.reservationstatus')),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.tourtimespan')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(fields=['price', 'id'], name='tour_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(fields=['country', 'price'], name='tour_country_price_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='favourites',
+            constraint=models.UniqueConstraint(fields=('customer', 'target'), name='unique_favourite'),
+        ),
+        migrations.AddIndex(
+            model_name='toursearchterm',
+            index=models.Index(fields=['term', 'tour'], name='tour_search_term_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tourtimespan',
+            index=models.Index(fields=['date_to', 'id'], name='timespan_date_to_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tourtimespan',
+            index=models.Index(fields=['tour', 'date_to'], name='timespan_tour_date_to_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['customer', 'status'], name='reservation_cust_status_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+# GIN есть только в PostgreSQL: индекс создаётся SQL-ом и не попадает в состояние
+# моделей, поэтому модель не зависит от СУБД, а на SQLite миграция ничего не делает
+INDEX_NAME = 'tour_search_vector_gin'
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = schema_editor.quote_name(apps.get_model('app', 'TourSearchDocument')._meta.db_table)
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {schema_editor.quote_name(INDEX_NAME)} ON {table} USING gin (vector)')
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {schema_editor.quote_name(INDEX_NAME)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
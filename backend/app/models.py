@@ -1,11 +1,16 @@
 import datetime
+from collections import defaultdict
 
 from django.core.validators import RegexValidator
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import F
 from django.db.models.manager import Manager
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
-from app.addons import unique_slugify
+from app import hashing
+from app.addons import save_with_unique_slug
 
 
 # Create your models here.
@@ -19,10 +24,58 @@ class User(AbstractUser):
             self.is_api_user = False
         super().save(*args, **kwargs)
 
+    # Хэширование и проверка пароля идут через ограниченный пул (app.hashing):
+    # регистрация, вход (ModelBackend) и смена пароля не занимают воркеры целиком
+    def set_password(self, raw_password):
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        def setter(raw_password):
+            self.set_password(raw_password)
+            self._password = None
+            self.save(update_fields=['password'])
+
+        return hashing.check_password(raw_password, self.password, setter)
+
+    async def aset_password(self, raw_password):
+        self.password = await hashing.amake_password(raw_password)
+        self._password = raw_password
+
+    async def acheck_password(self, raw_password):
+        async def setter(raw_password):
+            await self.aset_password(raw_password)
+            self._password = None
+            await self.asave(update_fields=['password'])
+
+        return await hashing.acheck_password(raw_password, self.password, setter)
+
     def __str__(self):
         return self.username
 
 
+class AvatarFile(models.Model):
+    # Строка-блокировка файла аватара (см. app.avatars): сохранение ссылки на
+    # файл и его удаление при освобождении идут по очереди
+    name = models.CharField(max_length=255, unique=True)
+
+    objects: Manager = models.Manager()
+
+
+class SlugCounter(models.Model):
+    # Последний выданный суффикс для базового slug'а модели (см. app.addons)
+    model = models.CharField(max_length=100)
+    base = models.CharField(max_length=255)
+    last = models.IntegerField()
+
+    objects: Manager = models.Manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'base'], name='unique_slug_counter'),
+        ]
+
+
 class SocialMediaType(models.Model):
     type = models.CharField(max_length=120, unique=True)
 
@@ -48,9 +101,7 @@ class Company(models.Model):
     objects: Manager = models.Manager()
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = unique_slugify(self, 'slug', 'name')
-        super().save(*args, **kwargs)
+        save_with_unique_slug(self, super().save, 'slug', 'name', *args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -86,13 +137,22 @@ class Tour(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     short_description = models.CharField(max_length=120)
     country = models.ForeignKey(Country, on_delete=models.CASCADE)
+    # Денормализованный счётчик, поддерживается FavouritesManager
+    favourites_count = models.PositiveIntegerField(default=0, editable=False)
 
     objects: Manager = models.Manager()
 
+    class Meta:
+        indexes = [
+            # Keyset-пагинация каталога (CatalogPagination, TourViewSet.keyset_ordering)
+            # и диапазоны цены в TourFilter
+            models.Index(fields=['price', 'id'], name='tour_price_id_idx'),
+            # TourFilter: страна + диапазон цены
+            models.Index(fields=['country', 'price'], name='tour_country_price_idx'),
+        ]
+
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = unique_slugify(self, 'slug', 'title')
-        super().save(*args, **kwargs)
+        save_with_unique_slug(self, super().save, 'slug', 'title', *args, **kwargs)
 
     def __str__(self):
         return self.title
@@ -108,15 +168,50 @@ class TourInfo(models.Model):
     objects: Manager = models.Manager()
 
 
+class TourSearchDocument(models.Model):
+    # Поисковый вектор тура для PostgreSQL (см. app.search)
+    tour = models.OneToOneField(Tour, on_delete=models.CASCADE, primary_key=True)
+    vector = SearchVectorField(null=True)
+
+    # GIN-индекс по vector создаёт миграция 0002 и только в PostgreSQL;
+    # на других СУБД поиск идёт по TourSearchTerm
+    objects: Manager = models.Manager()
+
+
+class TourSearchTerm(models.Model):
+    # Обратный индекс для СУБД без полнотекстового поиска (SQLite в тестах)
+    term = models.CharField(max_length=64)
+    tour = models.ForeignKey(Tour, on_delete=models.CASCADE)
+    weight = models.FloatField()
+
+    objects: Manager = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'tour'], name='tour_search_term_idx'),
+        ]
+
+
 class TourTimeSpan(models.Model):
     group_name = models.CharField(max_length=100)
     tour = models.ForeignKey(Tour, on_delete=models.CASCADE)
     date_from = models.DateTimeField()
     date_to = models.DateTimeField()
     place_count = models.IntegerField()
+    # Учёт мест: суммы count по ожидающим оплаты и оплаченным бронированиям
+    places_reserved = models.PositiveIntegerField(default=0, editable=False)
+    places_paid = models.PositiveIntegerField(default=0, editable=False)
 
     objects: Manager = models.Manager()
 
+    class Meta:
+        indexes = [
+            # Keyset-пагинация истории бронирований по (target__date_to, id)
+            models.Index(fields=['date_to', 'id'], name='timespan_date_to_id_idx'),
+            # Ближайший период тура: tourtimespan_set.order_by('-date_to')
+            models.Index(fields=['tour', 'date_to'], name='timespan_tour_date_to_idx'),
+        ]
+
 
 class ReservationStatus(models.Model):
     # Константы значений (хранятся в БД)
@@ -156,12 +251,81 @@ class Reservation(models.Model):
 
     objects: Manager = models.Manager()
 
+    class Meta:
+        indexes = [
+            # Корзина и счётчик пользователя: customer + статус
+            models.Index(fields=['customer', 'status'], name='reservation_cust_status_idx'),
+        ]
+
+
+class FavouritesManager(models.Manager):
+    def lock_customer(self, customer):
+        # Добавления одного пользователя идут по очереди: пакет точно знает,
+        # какие записи новые, и не завышает favourites_count при гонке
+        list(User.objects.select_for_update().filter(pk=customer.pk).values_list('pk'))
+
+    def add(self, customer, target):
+        with transaction.atomic():
+            self.lock_customer(customer)
+            _, created = self.get_or_create(customer=customer, target=target)
+            if created:
+                Tour.objects.filter(pk=target.pk).update(
+                    favourites_count=F('favourites_count') + 1)
+        return created
+
+    def add_many(self, customer, target_ids):
+        # Идемпотентно: уже добавленные туры пропускаются, остальные — одним INSERT
+        target_ids = set(target_ids)
+        if not target_ids:
+            return 0
+        with transaction.atomic():
+            self.lock_customer(customer)
+            existing = set(self.filter(customer=customer, target_id__in=target_ids)
+                           .values_list('target_id', flat=True))
+            new_ids = sorted(target_ids - existing)
+            if new_ids:
+                self.bulk_create([self.model(customer=customer, target_id=target_id)
+                                  for target_id in new_ids], ignore_conflicts=True)
+                Tour.objects.filter(pk__in=new_ids).update(
+                    favourites_count=F('favourites_count') + 1)
+        return len(new_ids)
+
+    def remove(self, **filters):
+        # Удаляет записи и списывает счётчики туров в той же транзакции
+        with transaction.atomic():
+            rows = list(self.filter(**filters).select_for_update()
+                        .values_list('pk', 'target_id'))
+            if not rows:
+                return 0
+
+            per_tour = defaultdict(int)
+            for _, target_id in rows:
+                per_tour[target_id] += 1
+
+            deleted, _ = self.filter(pk__in=[pk for pk, _ in rows]).delete()
+
+            by_amount = defaultdict(list)
+            for target_id, amount in per_tour.items():
+                by_amount[amount].append(target_id)
+            for amount, tour_ids in by_amount.items():
+                Tour.objects.filter(pk__in=tour_ids).update(
+                    favourites_count=F('favourites_count') - amount)
+
+        return deleted
+
 
 class Favourites(models.Model):
     customer = models.ForeignKey(User, on_delete=models.CASCADE)
     target = models.ForeignKey(Tour, on_delete=models.CASCADE)
+    datetime = models.DateTimeField(default=timezone.now, editable=False)
 
-    objects: Manager = models.Manager()
+    objects: FavouritesManager = FavouritesManager()
+
+    class Meta:
+        constraints = [
+            # Дубликаты завышали бы favourites_count; индекс обслуживает проверку избранного
+            models.UniqueConstraint(fields=['customer', 'target'], name='unique_favourite'),
+        ]
 
 
 class Feedback(models.Model):
@@ -0,0 +1,237 @@
+import base64
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def encode_cursor(values):
+    raw = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise NotFound('Invalid cursor')
+
+
+def ordering_field(model, field):
+    parts = field.lstrip('-').split('__')
+    for part in parts[:-1]:
+        model = model._meta.get_field(part).related_model
+    return model._meta.get_field(parts[-1])
+
+
+def parse_cursor(model, ordering, cursor):
+    # Курсор приходит от клиента: кроме формата проверяем, что значения
+    # приводятся к типам полей сортировки, иначе фильтр упадёт с 500
+    values = decode_cursor(cursor)
+    if (not isinstance(values, list) or len(values) != len(ordering)
+            or not all(isinstance(value, str) for value in values)):
+        raise NotFound('Invalid cursor')
+    try:
+        return [ordering_field(model, field).to_python(value)
+                for field, value in zip(ordering, values)]
+    except (ValidationError, TypeError, ValueError):
+        raise NotFound('Invalid cursor')
+
+
+def keyset_filter(ordering, values):
+    # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y); '-поле' — по убыванию
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        equal = {ordering[j].lstrip('-'): values[j] for j in range(i)}
+        condition |= Q(**equal, **{f'{name}__{lookup}': values[i]})
+
+    # Диапазон по первому полю позволяет планировщику начать с поиска по индексу
+    first = ordering[0]
+    bound = 'lte' if first.startswith('-') else 'gte'
+    return Q(**{f'{first.lstrip("-")}__{bound}': values[0]}) & condition
+
+
+def estimate_count(queryset, threshold=10000):
+    # На PostgreSQL большие выборки оцениваются планировщиком без COUNT(*)
+    if connection.vendor == 'postgresql':
+        plan = json.loads(queryset.explain(format='json'))
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+        if estimate >= threshold:
+            return estimate
+    return queryset.count()
+
+
+# Постраничная навигация с опциональными режимами:
+#   ?cursor= или ?pagination=cursor — keyset-навигация по keyset_ordering вьюсета,
+#       без COUNT(*) и OFFSET;
+#   ?count=false — страницы без подсчёта общего числа записей;
+#   ?count=estimate — оценка числа записей вместо точного подсчёта.
+class CatalogPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    default_keyset_ordering = ('id',)
+
+    def __init__(self, keyset_ordering=None):
+        self.keyset_ordering = keyset_ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.count_mode = request.query_params.get(self.count_query_param, 'exact')
+
+        if (self.cursor_query_param in request.query_params
+                or request.query_params.get(self.mode_query_param) == 'cursor'):
+            self.mode = 'cursor'
+            return self.paginate_keyset(queryset, request, view)
+
+        if self.count_mode in ('false', 'estimate'):
+            self.mode = 'offset'
+            return self.paginate_without_count(queryset, request)
+
+        self.mode = 'page'
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_ordering(self, view):
+        return tuple(
+            self.keyset_ordering
+            or getattr(view, 'keyset_ordering', None)
+            or self.default_keyset_ordering
+        )
+
+    def keyset_queryset(self, queryset, request, view):
+        self.ordering = self.get_ordering(view)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            values = parse_cursor(queryset.model, self.ordering, cursor)
+            queryset = queryset.filter(keyset_filter(self.ordering, values))
+        # Лишняя строка показывает, есть ли следующая страница
+        return queryset[:self.get_page_size(request) + 1]
+
+    def offset_queryset(self, queryset, request):
+        page_size = self.get_page_size(request)
+        try:
+            self.page_number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            raise NotFound('Invalid page.')
+        if self.page_number < 1:
+            raise NotFound('Invalid page.')
+
+        offset = (self.page_number - 1) * page_size
+        return queryset[offset:offset + page_size + 1]
+
+    def set_rows(self, rows, request):
+        page_size = self.get_page_size(request)
+        self.page = rows[:page_size]
+        self.has_next = len(rows) > page_size
+        return self.page
+
+    def paginate_keyset(self, queryset, request, view):
+        return self.set_rows(list(self.keyset_queryset(queryset, request, view)), request)
+
+    def paginate_without_count(self, queryset, request):
+        self.set_rows(list(self.offset_queryset(queryset, request)), request)
+        self.count = None
+        if self.count_mode == 'estimate':
+            self.count = estimate_count(queryset)
+        return self.page
+
+    def row_values(self, obj):
+        if isinstance(obj, dict):
+            # Строка values() (см. app.compiled): поля курсора выбраны под своими lookup
+            return [obj[field.lstrip('-')] for field in self.ordering]
+        values = []
+        for field in self.ordering:
+            value = obj
+            for part in field.lstrip('-').split('__'):
+                value = getattr(value, part)
+            values.append(value)
+        return values
+
+    def get_next_link(self):
+        if self.mode == 'page':
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+        if self.mode == 'cursor':
+            url = remove_query_param(url, self.mode_query_param)
+            return replace_query_param(
+                url, self.cursor_query_param, encode_cursor(self.row_values(self.page[-1])))
+        return replace_query_param(url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.mode == 'page':
+            return super().get_previous_link()
+        if self.mode == 'cursor' or self.page_number == 1:
+            # Курсорный режим рассчитан на бесконечную прокрутку только вперёд
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.page_query_param, self.page_number - 1)
+
+    def get_paginated_response(self, data):
+        if self.mode == 'cursor':
+            return Response({
+                'next': self.get_next_link(),
+                'previous': None,
+                'results': data,
+            })
+        if self.mode == 'offset':
+            return Response({
+                'count': self.count,
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link(),
+                'results': data,
+            })
+        return super().get_paginated_response(data)
+
+
+class AsyncCatalogPagination(CatalogPagination):
+    # Те же режимы для асинхронных представлений: строки читаются через async ORM.
+    # request — rest_framework.request.Request поверх HttpRequest
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.count_mode = request.query_params.get(self.count_query_param, 'exact')
+
+        if (self.cursor_query_param in request.query_params
+                or request.query_params.get(self.mode_query_param) == 'cursor'):
+            self.mode = 'cursor'
+            rows = [obj async for obj in self.keyset_queryset(queryset, request, view)]
+            return self.set_rows(rows, request)
+
+        if self.count_mode in ('false', 'estimate'):
+            self.mode = 'offset'
+            rows = [obj async for obj in self.offset_queryset(queryset, request)]
+            self.set_rows(rows, request)
+            self.count = None
+            if self.count_mode == 'estimate':
+                self.count = await sync_to_async(estimate_count)(queryset)
+            return self.page
+
+        self.mode = 'page'
+        page_size = self.get_page_size(request)
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Число записей считаем заранее, чтобы Paginator не обращался к БД синхронно
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        self.page.object_list = [obj async for obj in self.page.object_list]
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
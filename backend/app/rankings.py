@@ -0,0 +1,166 @@
+import heapq
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from app.models import Favourites, Reservation, ReservationStatus, Tour
+
+DEFAULTS = {
+    'SIZE': 7,
+    # Сколько хранить рейтинг в кэше и через сколько считать его устаревшим
+    'TTL': 60 * 60,
+    'STALE_AFTER': 5 * 60,
+    'PAID_SEAT_WEIGHT': 2.0,
+    # (возраст в днях, вес) — свежие добавления в избранное весят больше
+    'DECAY_BUCKETS': [(7, 1.0), (30, 0.5), (90, 0.25)],
+    'OLD_FAVOURITE_WEIGHT': 0.1,
+    # False — пересчёт прямо в запросе (тесты, разработка)
+    'BACKGROUND_REFRESH': True,
+    # False — веб-воркеры не пересчитывают рейтинг сами, его пишет только
+    # refresh_rankings --loop (имеет смысл лишь при общем CACHES)
+    'WORKER_REFRESH': True,
+}
+
+GLOBAL = 'global'
+COUNTRY = 'country'
+COMPANY = 'company'
+
+KEY_PREFIX = 'rankings:v1'
+LOCK_KEY = f'{KEY_PREFIX}:refresh-lock'
+# Время последнего полного пересчёта: отличает срез без туров от холодного кэша
+BUILT_KEY = f'{KEY_PREFIX}:built-at'
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'POPULAR_TOURS', {})}
+
+
+def scope_key(scope, scope_id=None):
+    if scope == GLOBAL:
+        return f'{KEY_PREFIX}:{GLOBAL}'
+    return f'{KEY_PREFIX}:{scope}:{scope_id}'
+
+
+def compute_scores(tours=None, config=None):
+    config = config or get_config()
+    tours = Tour.objects.all() if tours is None else tours
+    now = timezone.now()
+
+    buckets = sorted(config['DECAY_BUCKETS'])
+    aggregates = {
+        f'bucket_{days}': Count('pk', filter=Q(datetime__gte=now - timedelta(days=days)))
+        for days, _ in buckets
+    }
+    favourites = Favourites.objects.filter(target__in=tours).values('target_id').annotate(
+        total=Count('pk'), **aggregates
+    )
+
+    scores = defaultdict(float)
+    for row in favourites:
+        # Каждое добавление учитывается с весом самой узкой подходящей корзины
+        counted = 0
+        for days, weight in buckets:
+            in_bucket = row[f'bucket_{days}'] - counted
+            scores[row['target_id']] += in_bucket * weight
+            counted = row[f'bucket_{days}']
+        scores[row['target_id']] += (row['total'] - counted) * config['OLD_FAVOURITE_WEIGHT']
+
+    paid = Reservation.objects.filter(
+        target__tour__in=tours,
+        target__date_to__gte=now,
+        status__status=ReservationStatus.PAID,
+    ).values('target__tour_id').annotate(seats=Sum('count'))
+    for row in paid:
+        scores[row['target__tour_id']] += (row['seats'] or 0) * config['PAID_SEAT_WEIGHT']
+
+    return scores
+
+
+def build_rankings(tours=None, config=None):
+    config = config or get_config()
+    tours = Tour.objects.all() if tours is None else tours
+    scores = compute_scores(tours, config)
+
+    groups = defaultdict(list)
+    for pk, country_id, company_id, favourites_count in tours.values_list(
+            'pk', 'country_id', 'company_id', 'favourites_count').iterator():
+        entry = (scores.get(pk, 0.0), favourites_count, -pk)
+        groups[scope_key(GLOBAL)].append(entry)
+        groups[scope_key(COUNTRY, country_id)].append(entry)
+        groups[scope_key(COMPANY, company_id)].append(entry)
+
+    return {
+        key: [-entry[2] for entry in heapq.nlargest(config['SIZE'], entries)]
+        for key, entries in groups.items()
+    }
+
+
+def refresh(config=None):
+    config = config or get_config()
+    rankings = build_rankings(config=config)
+    built_at = time.time()
+    entries = {key: {'ids': ids, 'built_at': built_at} for key, ids in rankings.items()}
+    entries[BUILT_KEY] = built_at
+    cache.set_many(entries, timeout=config['TTL'])
+    return len(rankings)
+
+
+def schedule_refresh(config):
+    # Только один процесс пересчитывает рейтинг, остальные отдают то, что есть
+    if not cache.add(LOCK_KEY, True, timeout=config['STALE_AFTER']):
+        return False
+
+    def worker():
+        try:
+            refresh(config)
+        finally:
+            cache.delete(LOCK_KEY)
+
+    if not config['BACKGROUND_REFRESH']:
+        worker()
+        return True
+
+    def background():
+        try:
+            worker()
+        finally:
+            close_old_connections()
+
+    threading.Thread(target=background, daemon=True).start()
+    return True
+
+
+def fallback_ids(scope, scope_id, config):
+    # Пока рейтинга нет в кэше: ограниченная выборка по денормализованному счётчику
+    tours = Tour.objects.all()
+    if scope == COUNTRY:
+        tours = tours.filter(country_id=scope_id)
+    elif scope == COMPANY:
+        tours = tours.filter(company_id=scope_id)
+    return list(tours.order_by('-favourites_count', 'pk').values_list('pk', flat=True)[:config['SIZE']])
+
+
+def get_popular_ids(scope=GLOBAL, scope_id=None):
+    config = get_config()
+    key = scope_key(scope, scope_id)
+    entries = cache.get_many([key, BUILT_KEY])
+    entry = entries.get(key)
+
+    built_at = entry['built_at'] if entry else entries.get(BUILT_KEY)
+    stale = built_at is None or time.time() - built_at > config['STALE_AFTER']
+    if stale and config['WORKER_REFRESH']:
+        # Все срезы пересчитываются разом в фоне; до конца пересчёта отдаём прежний срез
+        if schedule_refresh(config) and not config['BACKGROUND_REFRESH']:
+            entry = cache.get(key)
+
+    if entry is None:
+        # Холодный кэш (или срез без туров): не пустой список, а туры по счётчику избранного
+        return fallback_ids(scope, scope_id, config)
+    return entry['ids']
@@ -0,0 +1,188 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from app import caching, lookups
+from app.models import Reservation, ReservationStatus, TourTimeSpan
+
+UPCOMING_LIMIT = 5
+
+# Какие статусы занимают места и в какой колонке TourTimeSpan они учитываются
+LEDGER_COLUMNS = {
+    ReservationStatus.WAITING: 'places_reserved',
+    ReservationStatus.PAID: 'places_paid',
+}
+
+
+# Разрешённые переходы статусов: откуда → куда
+TRANSITIONS = {
+    ReservationStatus.WAITING: {ReservationStatus.PAID, ReservationStatus.MOVED,
+                                ReservationStatus.DECLINED},
+    ReservationStatus.PAID: {ReservationStatus.COMPLETED, ReservationStatus.DIDNT_COME,
+                             ReservationStatus.PAID_BACK, ReservationStatus.MOVED},
+    ReservationStatus.MOVED: {ReservationStatus.WAITING, ReservationStatus.PAID,
+                              ReservationStatus.DECLINED},
+    ReservationStatus.COMPLETED: set(),
+    ReservationStatus.DIDNT_COME: set(),
+    ReservationStatus.PAID_BACK: set(),
+    ReservationStatus.DECLINED: set(),
+}
+
+def status_id(code):
+    pk = lookups.reservation_statuses.get_id(code)
+    if pk is None:
+        raise ReservationStatus.DoesNotExist(f'Статус {code} не найден')
+    return pk
+
+
+def transition_sources(status_code):
+    return sorted(source for source, targets in TRANSITIONS.items() if status_code in targets)
+
+
+class OverbookingError(Exception):
+    def __init__(self, timespan_id):
+        self.timespan_id = timespan_id
+        super().__init__(f'Недостаточно свободных мест в периоде {timespan_id}')
+
+
+def adjust_ledger(deltas):
+    # deltas: {(timespan_id, status): изменение числа мест}
+    updates = defaultdict(dict)
+    occupied = defaultdict(int)
+    for (timespan_id, status_code), delta in deltas.items():
+        column = LEDGER_COLUMNS.get(status_code)
+        if column and delta > 0:
+            updates[timespan_id][column] = F(column) + delta
+        elif column and delta < 0:
+            # Колонки неотрицательные: если учёт разошёлся с бронями (правка
+            # в админке), освобождение мест не должно падать на ограничении
+            updates[timespan_id][column] = Greatest(F(column) + delta, 0)
+        if column:
+            occupied[timespan_id] += delta
+
+    # Фиксированный порядок обновления строк исключает взаимные блокировки
+    for timespan_id in sorted(updates):
+        queryset = TourTimeSpan.objects.filter(pk=timespan_id)
+        if occupied[timespan_id] > 0:
+            # Условное обновление атомарно: места списываются, только если они есть
+            queryset = queryset.filter(
+                place_count__gte=F('places_reserved') + F('places_paid') + occupied[timespan_id]
+            )
+        if not queryset.update(**updates[timespan_id]):
+            raise OverbookingError(timespan_id)
+
+    if updates:
+        # Свободные места показываются на странице тура — сбрасываем её кэш
+        slugs = set(TourTimeSpan.objects.filter(pk__in=updates).values_list('tour__slug', flat=True))
+        transaction.on_commit(lambda: caching.invalidate(*(f'tour:{slug}' for slug in slugs)))
+
+
+def timespans_by_proximity(tour, now, limit):
+    # Одним запросом: сначала незавершённые периоды по дате начала,
+    # за ними прошедшие — от последнего к первому
+    upcoming = Q(date_to__gte=now)
+    return TourTimeSpan.objects.filter(tour=tour).order_by(
+        Case(When(upcoming, then=Value(0)), default=Value(1)),
+        Case(When(upcoming, then=F('date_from'))).asc(),
+        Case(When(~upcoming, then=F('date_to'))).desc(),
+        'pk',
+    )[:limit]
+
+
+def pick_upcoming(timespans, now):
+    # Ближайшие незавершённые периоды; если таких нет — последний прошедший
+    upcoming = [timespan for timespan in timespans if timespan.date_to >= now]
+    return upcoming or timespans[:1]
+
+
+def upcoming_timespans(tour, limit=UPCOMING_LIMIT):
+    now = timezone.now()
+    return pick_upcoming(list(timespans_by_proximity(tour, now, limit)), now)
+
+
+async def aupcoming_timespans(tour, limit=UPCOMING_LIMIT):
+    now = timezone.now()
+    return pick_upcoming([timespan async for timespan in timespans_by_proximity(tour, now, limit)], now)
+
+
+def select_timespan(tour, timespan_id=None):
+    if timespan_id is not None:
+        return TourTimeSpan.objects.filter(tour=tour, pk=timespan_id).first()
+    timespans = upcoming_timespans(tour, limit=1)
+    return timespans[0] if timespans else None
+
+
+def create(customer, timespan, count):
+    return create_many(customer, [(timespan, count)])[0]
+
+
+def create_many(customer, items):
+    # items: [(timespan, count)] — либо все брони создаются, либо ни одной
+    with transaction.atomic():
+        waiting = status_id(ReservationStatus.WAITING)
+
+        deltas = defaultdict(int)
+        for timespan, count in items:
+            deltas[(timespan.pk, ReservationStatus.WAITING)] += count
+        adjust_ledger(deltas)
+
+        return Reservation.objects.bulk_create([
+            Reservation(status_id=waiting, customer=customer, target=timespan, count=count)
+            for timespan, count in items
+        ])
+
+
+def change_count(queryset, count):
+    with transaction.atomic():
+        item = queryset.select_for_update(of=('self',)).first()
+        if item is None:
+            return None
+
+        adjust_ledger({(item.target_id, lookups.reservation_statuses.get_name(item.status_id)): count - item.count})
+        item.count = count
+        item.save(update_fields=['count'])
+    return item
+
+
+def transition(queryset, ids, status_code):
+    # Массовая смена статуса: меняются только брони из queryset, чей текущий статус
+    # допускает переход в status_code. Возвращает список изменённых id
+    sources = [status_id(code) for code in transition_sources(status_code)]
+    if not sources:
+        return []
+    target = status_id(status_code)
+    ids = sorted(set(ids))
+
+    with transaction.atomic():
+        # Один SELECT FOR UPDATE и один UPDATE на всю пачку, сколько бы в ней ни было id
+        rows = list(queryset.filter(pk__in=ids, status_id__in=sources)
+                    .select_for_update(of=('self',))
+                    .values_list('pk', 'target_id', 'status_id', 'count'))
+        deltas = defaultdict(int)
+        for _, target_id, old_status, count in rows:
+            deltas[(target_id, lookups.reservation_statuses.get_name(old_status))] -= count
+            deltas[(target_id, status_code)] += count
+
+        adjust_ledger(deltas)
+        # Обновляются только заблокированные строки: бронь, перешедшая в исходный
+        # статус после SELECT, не попадает в UPDATE мимо учёта мест
+        changed = [row[0] for row in rows]
+        Reservation.objects.filter(pk__in=changed, status_id__in=sources).update(status_id=target)
+    return changed
+
+
+def release(queryset):
+    with transaction.atomic():
+        rows = list(queryset.select_for_update(of=('self',))
+                    .values_list('pk', 'target_id', 'status_id', 'count'))
+
+        deltas = defaultdict(int)
+        for _, target_id, status, count in rows:
+            deltas[(target_id, lookups.reservation_statuses.get_name(status))] -= count
+
+        deleted, _ = Reservation.objects.filter(pk__in=[row[0] for row in rows]).delete()
+        adjust_ledger(deltas)
+    return deleted
@@ -0,0 +1,138 @@
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, transaction
+from django.db.models import F, Q, Sum, Value
+
+from app.models import Tour, TourSearchDocument, TourSearchTerm
+
+# Вес поля в ранжировании: A — заголовок, B — краткое описание и справочники, C — описание
+FIELD_WEIGHTS = [
+    ('title', 'A'),
+    ('short_description', 'B'),
+    ('company_name', 'B'),
+    ('country_name', 'B'),
+    ('description', 'C'),
+    ('placed', 'C'),
+]
+# Соответствует весам ts_rank по умолчанию ({0.1, 0.2, 0.4, 1.0} для D, C, B, A)
+WEIGHT_VALUES = {'A': 1.0, 'B': 0.4, 'C': 0.2}
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MIN_TOKEN_LENGTH = 2
+MAX_TOKEN_LENGTH = 64
+CHUNK_SIZE = 1000
+
+
+def get_config():
+    return getattr(settings, 'SEARCH_CONFIG', 'russian')
+
+
+def use_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def tokenize(text):
+    return [
+        token[:MAX_TOKEN_LENGTH]
+        for token in TOKEN_RE.findall((text or '').lower().replace('ё', 'е'))
+        if len(token) >= MIN_TOKEN_LENGTH
+    ]
+
+
+def stem(token):
+    # Грубое отсечение окончаний: запрос «турцию» находит «турция», «турции»
+    return token[:-2] if len(token) > 5 else token
+
+
+def documents(tour_ids):
+    tours = Tour.objects.filter(pk__in=tour_ids).select_related(
+        'company', 'country', 'tourinfo')
+    for tour in tours:
+        info = getattr(tour, 'tourinfo', None)
+        yield tour.pk, {
+            'title': tour.title,
+            'short_description': tour.short_description,
+            'company_name': tour.company.name,
+            'country_name': tour.country.name,
+            'description': info.description if info else '',
+            'placed': info.placed if info else '',
+        }
+
+
+def _postgres_vector(fields):
+    config = get_config()
+    vector = None
+    for name, weight in FIELD_WEIGHTS:
+        part = SearchVector(Value(fields[name] or ''), weight=weight, config=config)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def _terms(tour_id, fields):
+    weights = defaultdict(float)
+    for name, weight in FIELD_WEIGHTS:
+        for token in tokenize(fields[name]):
+            weights[token] += WEIGHT_VALUES[weight]
+    return [TourSearchTerm(term=term, tour_id=tour_id, weight=value)
+            for term, value in weights.items()]
+
+
+def index_tours(tour_ids):
+    tour_ids = list(tour_ids)
+    for start in range(0, len(tour_ids), CHUNK_SIZE):
+        chunk = tour_ids[start:start + CHUNK_SIZE]
+        with transaction.atomic():
+            if use_postgres():
+                TourSearchDocument.objects.bulk_create(
+                    [TourSearchDocument(tour_id=pk, vector=_postgres_vector(fields))
+                     for pk, fields in documents(chunk)],
+                    update_conflicts=True, unique_fields=['tour'], update_fields=['vector'])
+            else:
+                TourSearchTerm.objects.filter(tour_id__in=chunk).delete()
+                TourSearchTerm.objects.bulk_create(
+                    [term for pk, fields in documents(chunk) for term in _terms(pk, fields)],
+                    batch_size=CHUNK_SIZE)
+
+
+def rebuild():
+    ids = Tour.objects.order_by('pk').values_list('pk', flat=True)
+    count = 0
+    batch = []
+    for pk in ids.iterator(chunk_size=CHUNK_SIZE):
+        batch.append(pk)
+        if len(batch) == CHUNK_SIZE:
+            index_tours(batch)
+            count += len(batch)
+            batch = []
+    index_tours(batch)
+    return count + len(batch)
+
+
+def search(query, limit=20):
+    # Возвращает [(tour_id, rank)] по убыванию релевантности
+    if use_postgres():
+        search_query = SearchQuery(query, config=get_config(), search_type='websearch')
+        return list(
+            TourSearchDocument.objects.filter(vector=search_query)
+            .annotate(rank=SearchRank(F('vector'), search_query))
+            .order_by('-rank', 'tour_id')
+            .values_list('tour_id', 'rank')[:limit]
+        )
+
+    stems = {stem(token) for token in tokenize(query)}
+    if not stems:
+        return []
+
+    condition = Q()
+    for value in stems:
+        condition |= Q(term__startswith=value)
+    return list(
+        TourSearchTerm.objects.filter(condition)
+        .values('tour_id')
+        .annotate(rank=Sum('weight'))
+        .order_by('-rank', 'tour_id')
+        .values_list('tour_id', 'rank')[:limit]
+    )
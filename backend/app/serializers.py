@@ -2,14 +2,40 @@ from django.utils import timezone
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.db import transaction
 
 import os
 
+from app import avatars, imageproxy, lookups
+from app.compiled import CompiledSerializer
 from app.models import *
 
 User = get_user_model()
 
 
+class ProxiedImageField(serializers.URLField):
+    # Внешняя картинка: при включённом IMAGE_PROXY отдаётся ссылка на прокси
+    # с копией нужной ширины (app.imageproxy), запись — как у обычного URLField
+    def __init__(self, width, **kwargs):
+        self.width = width
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return imageproxy.proxied_url(str(value), self.width)
+
+
+class ProxiedImagesMixin:
+    # proxied_images = {'поле модели': ширина} — поля, которые отдаются через прокси
+    proxied_images = {}
+
+    def build_standard_field(self, field_name, model_field):
+        field_class, field_kwargs = super().build_standard_field(field_name, model_field)
+        if field_name in self.proxied_images:
+            field_class = ProxiedImageField
+            field_kwargs['width'] = self.proxied_images[field_name]
+        return field_class, field_kwargs
+
+
 class UserRegisterSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -63,9 +89,32 @@ class UserChangePasswordSerializer(serializers.ModelSerializer):
 
 
 class UserSerializer(serializers.ModelSerializer):
+    # Уменьшенные копии аватара: {"64": {"webp": url, "jpeg": url}, ...}
+    avatar_variants = serializers.SerializerMethodField(read_only=True)
+
     class Meta:
         model = User
-        fields = ['username', 'email', 'phone', 'avatar']
+        fields = ['username', 'email', 'phone', 'avatar', 'avatar_variants']
+
+    def get_avatar_variants(self, obj):
+        if not obj.avatar:
+            return {}
+        return avatars.variant_urls(obj.avatar.name, self.context.get('request'))
+
+    def update(self, instance, validated_data):
+        upload = validated_data.pop('avatar', None)
+        if upload is None:
+            return super().update(instance, validated_data)
+
+        # Файл и ссылка на него сохраняются под блокировкой файла (avatars.store)
+        with transaction.atomic():
+            previous = instance.avatar.name
+            instance.avatar.name = avatars.store(upload)
+            instance = super().update(instance, validated_data)
+            avatars.schedule_variants(instance.avatar.name)
+            if previous != instance.avatar.name:
+                transaction.on_commit(lambda: avatars.release(previous))
+        return instance
 
     def validate_avatar(self, value):
         # Проверка размера файла (например, не более 2MB)
@@ -94,14 +143,17 @@ class SocialMediaTypeSerializer(serializers.ModelSerializer):
 
 
 class SocialMediaSerializer(serializers.ModelSerializer):
-    media_type_name = serializers.CharField(
-        source='media_type.type', read_only=True)
+    # Имя типа берётся из справочника в памяти (app.lookups), без JOIN
+    media_type_name = serializers.SerializerMethodField(read_only=True)
     days_remaining = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = SocialMedia
         exclude = ['id']
 
+    def get_media_type_name(self, obj):
+        return lookups.social_media_types.get_name(obj.media_type_id)
+
     def get_days_remaining(self, obj):
         return (obj.date_to - timezone.now()).days
 
@@ -116,7 +168,9 @@ class SocialMediaSerializer(serializers.ModelSerializer):
         return data
 
 
-class CompanySerializer(serializers.ModelSerializer):
+class CompanySerializer(ProxiedImagesMixin, serializers.ModelSerializer):
+    proxied_images = {'image': 320}
+
     class Meta:
         model = Company
         exclude = ['id']
@@ -125,13 +179,16 @@ class CompanySerializer(serializers.ModelSerializer):
         }
 
 
-class TourForCompanySerializer(serializers.ModelSerializer):
+class TourForCompanySerializer(ProxiedImagesMixin, serializers.ModelSerializer):
+    proxied_images = {'img_preview_url': 640}
+
     class Meta:
         model = Tour
         exclude = ['id']
 
 
-class CompanyFullSerializer(serializers.ModelSerializer):
+class CompanyFullSerializer(ProxiedImagesMixin, serializers.ModelSerializer):
+    proxied_images = {'image': 640}
     social_media = SocialMediaSerializer(
         source='socialmedia_set',  # Указываем обратное отношение
         many=True,
@@ -151,16 +208,15 @@ class CompanyFullSerializer(serializers.ModelSerializer):
         }
 
 
-class TourSerializer(serializers.ModelSerializer):
+class TourSerializer(ProxiedImagesMixin, serializers.ModelSerializer):
+    proxied_images = {'img_preview_url': 640}
     favourites_count = serializers.SerializerMethodField(read_only=True)
     company_name = serializers.CharField(source='company.name', read_only=True)
     company_slug = serializers.CharField(source='company.slug', read_only=True)
     country_name = serializers.CharField(source='country.name', read_only=True)
 
     def get_favourites_count(self, obj):
-        if hasattr(obj, 'favourites_count'):
-            return obj.favourites_count
-        return obj.favourites_set.count()
+        return obj.favourites_count
 
     class Meta:
         model = Tour
@@ -170,7 +226,9 @@ class TourSerializer(serializers.ModelSerializer):
         }
 
 
-class TourInfoSerializer(serializers.ModelSerializer):
+class TourInfoSerializer(ProxiedImagesMixin, serializers.ModelSerializer):
+    proxied_images = {'img_url': 1280, 'img_background_url': 1920}
+
     class Meta:
         model = TourInfo
         exclude = ['id']
@@ -180,13 +238,14 @@ class TourTimeSpanSerializer(serializers.ModelSerializer):
     places_released = serializers.SerializerMethodField(read_only=True)
 
     def get_places_released(self, obj):
-        if hasattr(obj, 'places_released'):
-            return obj.places_released
-        return obj.reservation.count()
+        # Оплаченные места (сумма count), а не число оплаченных броней:
+        # фронтенд показывает свободные места как place_count - places_released
+        return obj.places_paid
 
     class Meta:
         model = TourTimeSpan
-        exclude = ['id']
+        # Счётчики учёта мест и tour наружу не отдаются; id нужен для выбора периода
+        fields = ['id', 'group_name', 'date_from', 'date_to', 'place_count', 'places_released']
 
 
 class ReservationStatusSerializer(serializers.ModelSerializer):
@@ -195,7 +254,9 @@ class ReservationStatusSerializer(serializers.ModelSerializer):
         exclude = ['id']
 
 
-class TourToReservationSerializer(serializers.ModelSerializer):
+class TourToReservationSerializer(ProxiedImagesMixin, serializers.ModelSerializer):
+    proxied_images = {'img_preview_url': 320}
+
     class Meta:
         model = Tour
         fields = ['title', 'slug', 'img_preview_url', 'price']
@@ -210,6 +271,15 @@ class ReservationSerializer(serializers.ModelSerializer):
         exclude = ['customer']
 
 
+class ReservationBatchItemSerializer(serializers.Serializer):
+    timespan = serializers.IntegerField()
+    count = serializers.IntegerField(min_value=1, default=1)
+
+
+class ReservationBatchSerializer(serializers.Serializer):
+    items = ReservationBatchItemSerializer(many=True, allow_empty=False)
+
+
 class CountrySerializer(serializers.ModelSerializer):
     class Meta:
         model = Country
@@ -222,10 +292,19 @@ class CountrySerializer(serializers.ModelSerializer):
 class FavouriteSerializer(serializers.ModelSerializer):
     tour_slug = serializers.CharField(source='target.slug', read_only=True)
     tour_price = serializers.CharField(source='target.price', read_only=True)
-    tour_img = serializers.URLField(
-        source='target.img_preview_url', read_only=True)
+    tour_img = ProxiedImageField(
+        width=320, source='target.img_preview_url', read_only=True)
     tour_title = serializers.CharField(source='target.title', read_only=True)
 
     class Meta:
         model = Favourites
-        fields = '__all__'
+        # datetime (время добавления, для рейтингов) в API не отдаётся
+        fields = ['id', 'tour_slug', 'tour_price', 'tour_img', 'tour_title', 'customer', 'target']
+
+
+# Плоские сериализаторы для списков (app.compiled): тот же JSON из строк values()
+compiled_tour_serializer = CompiledSerializer(
+    TourSerializer, method_sources={'favourites_count': 'favourites_count'})
+compiled_company_serializer = CompiledSerializer(CompanySerializer)
+compiled_reservation_serializer = CompiledSerializer(ReservationSerializer)
+compiled_favourite_serializer = CompiledSerializer(FavouriteSerializer)
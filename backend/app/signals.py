@@ -0,0 +1,112 @@
+import threading
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from app import authentication, caching, facets, lookups, search
+from app.middleware import install_query_recorder
+from app.models import (Company, Country, ReservationStatus, SocialMedia, SocialMediaType, Tour,
+                        TourInfo, TourTimeSpan, User)
+
+# Группы кэша ответов (CachedResponseMixin.cache_groups), зависящие от модели
+CACHE_GROUPS = {
+    Tour: 'tour',
+    TourInfo: 'tour',
+    TourTimeSpan: 'tour',
+    Company: 'company',
+    SocialMedia: 'social_media',
+    SocialMediaType: 'social_media',
+    Country: 'country',
+    ReservationStatus: 'reservation_status',
+}
+
+
+def reindex_later(tour_ids):
+    # Индексируем после коммита, чтобы читать уже сохранённые данные
+    transaction.on_commit(lambda: search.index_tours(tour_ids))
+
+
+@receiver(post_save, sender=Tour)
+def index_tour(sender, instance, **kwargs):
+    reindex_later([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=TourInfo)
+def index_tour_info(sender, instance, **kwargs):
+    reindex_later([instance.tour_id])
+
+
+@receiver(pre_save, sender=Company)
+@receiver(pre_save, sender=Country)
+def check_name_change(sender, instance, update_fields=None, **kwargs):
+    # В индекс туров попадает только название компании и страны
+    instance._name_changed = False
+    if instance.pk is None or (update_fields is not None and 'name' not in update_fields):
+        return
+    old_name = sender.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+    instance._name_changed = old_name is not None and old_name != instance.name
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_save, sender=Country)
+def index_named_tours(sender, instance, **kwargs):
+    if getattr(instance, '_name_changed', False):
+        reindex_later(list(instance.tour_set.values_list('pk', flat=True)))
+
+
+@receiver([post_save, post_delete], sender=Tour)
+@receiver([post_save, post_delete], sender=Company)
+@receiver([post_save, post_delete], sender=Country)
+def invalidate_facets(sender, **kwargs):
+    facets.invalidate()
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_auth_user(sender, instance, **kwargs):
+    # patch_user, change_password, delete и правки в админке
+    user_id = instance.pk
+    transaction.on_commit(lambda: authentication.invalidate(user_id))
+
+
+@receiver([post_save, post_delete], sender=Country)
+@receiver([post_save, post_delete], sender=ReservationStatus)
+@receiver([post_save, post_delete], sender=SocialMediaType)
+def invalidate_lookups(sender, **kwargs):
+    # Свой процесс перечитывает таблицу сразу, остальные — после коммита
+    table = lookups.TABLES[sender]
+    table.reset()
+    transaction.on_commit(table.invalidate)
+
+
+# id туров, чьи страницы надо сбросить после коммита (по потоку)
+_pending_tours = threading.local()
+
+
+def invalidate_tour_pages():
+    tour_ids = getattr(_pending_tours, 'ids', None)
+    if not tour_ids:
+        return
+    _pending_tours.ids = set()
+    slugs = Tour.objects.filter(pk__in=tour_ids).values_list('slug', flat=True)
+    caching.invalidate(*(f'tour:{slug}' for slug in slugs))
+
+
+@receiver([post_save, post_delete])
+def invalidate_responses(sender, instance, **kwargs):
+    group = CACHE_GROUPS.get(sender)
+    if group:
+        caching.invalidate(group)
+    if sender is Tour:
+        caching.invalidate(f'tour:{instance.slug}')
+    elif sender in (TourInfo, TourTimeSpan):
+        # Слаги всех затронутых туров читаются одним запросом после коммита,
+        # а не по запросу на строку (каскадное удаление периодов)
+        if not hasattr(_pending_tours, 'ids'):
+            _pending_tours.ids = set()
+        _pending_tours.ids.add(instance.tour_id)
+        transaction.on_commit(invalidate_tour_pages)
+
+
+connection_created.connect(install_query_recorder)
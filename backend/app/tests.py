@@ -1,3 +1,1436 @@
-from django.test import TestCase
+import base64
+import datetime
+import http.server
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from app import (authentication, avatars, caching, facets, favourites, hashing, imageproxy, lookups, metrics,
+                 rankings, reservations, search)
+from app.addons import unique_slugify_bulk
+from app.benchmarks.data import seed_catalogue
+from app.importer import CatalogueImporter, read_csv, read_jsonl
+from app.middleware import QueryBudgetExceeded
+from app.models import *
+from app.serializers import *
+
+
+def create_catalogue():
+    for code, _ in ReservationStatus.STATUS_CHOICES:
+        ReservationStatus.objects.get_or_create(status=code)
+
+    company = Company.objects.create(
+        name='Компания', phone='79990000000', address='-',
+        description='-', image='https://example.com/c.png')
+    country = Country.objects.create(name='Турция')
+    tour = Tour.objects.create(
+        company=company, country=country, title='Тур в Турцию', price=1000,
+        img_preview_url='https://example.com/t.png', short_description='-')
+    now = timezone.now()
+    timespan = TourTimeSpan.objects.create(
+        group_name='Группа', tour=tour, place_count=10,
+        date_from=now + datetime.timedelta(days=10),
+        date_to=now + datetime.timedelta(days=20))
+    return tour, timespan
+
+
+class SlugAllocationTests(TestCase):
+    def test_sequential_and_bulk_slugs_are_unique(self):
+        tour, _ = create_catalogue()
+        second = Tour.objects.create(
+            company=tour.company, country=tour.country, title=tour.title, price=1,
+            img_preview_url='https://example.com/t.png', short_description='-')
+        self.assertEqual((tour.slug, second.slug), ('tur-v-turtsiju', 'tur-v-turtsiju-1'))
+
+        slugs = unique_slugify_bulk(Tour, 'slug', [tour.title] * 3 + ['Другой тур'])
+        self.assertEqual(slugs, [
+            'tur-v-turtsiju-2', 'tur-v-turtsiju-3', 'tur-v-turtsiju-4', 'drugoj-tur'])
+
+    def test_slugs_of_other_bases_are_skipped(self):
+        tour, _ = create_catalogue()
+        fields = dict(company=tour.company, country=tour.country, price=1,
+                      img_preview_url='https://example.com/t.png', short_description='-')
+        self.assertEqual(Tour.objects.create(title='Тур', **fields).slug, 'tur')
+        self.assertEqual(Tour.objects.create(title='Тур', **fields).slug, 'tur-1')
+        # Счётчик базы tur стоит на 1, а tur-2 и tur-3 заняты другими турами
+        Tour.objects.create(title='Тур 2', **fields)
+        Tour.objects.create(title='Другой', slug='tur-3', **fields)
+
+        self.assertEqual(unique_slugify_bulk(Tour, 'slug', ['Тур', 'Тур', 'Тур 2']),
+                         ['tur-4', 'tur-5', 'tur-2-1'])
+        self.assertEqual(Tour.objects.create(title='Тур', **fields).slug, 'tur-6')
+
+    def test_free_base_slug_skips_counter(self):
+        tour, _ = create_catalogue()
+        # Проверка slug'а и INSERT (SAVEPOINT — из-за транзакции теста)
+        with self.assertNumQueries(4):
+            Tour(company=tour.company, country=tour.country, title='Новый тур', price=1,
+                 img_preview_url='https://example.com/t.png', short_description='-').save()
+        self.assertFalse(SlugCounter.objects.filter(base='novyj-tur').exists())
+
+
+class CatalogueImportTests(TestCase):
+    company = {'type': 'company', 'name': 'Поставщик', 'phone': '79990000000', 'address': '-',
+               'description': '-', 'image': 'https://example.com/c.png'}
+
+    def tour(self, title, **fields):
+        return {'company': 'Поставщик', 'country': 'Турция', 'title': title, 'price': '100.00',
+                'img_preview_url': 'https://example.com/t.png', 'short_description': '-', **fields}
+
+    def run_import(self, records, **kwargs):
+        errors = []
+        importer = CatalogueImporter(on_error=lambda line_no, message: errors.append(line_no),
+                                     **kwargs)
+        stats = importer.run(enumerate(records, start=1))
+        return stats, errors
+
+    def test_readers_parse_csv_and_jsonl(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'feed.csv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('title,price,slug,group_name,date_from,date_to,place_count\n'
+                        'Тур,10,,Группа,2030-01-01T00:00,2030-01-08T00:00,5\n'
+                        'Без периода,20,tur-x,,,,\n')
+            rows = list(read_csv(path))
+            self.assertEqual(rows[0], (2, {'title': 'Тур', 'price': '10', 'timespans': [{
+                'group_name': 'Группа', 'date_from': '2030-01-01T00:00',
+                'date_to': '2030-01-08T00:00', 'place_count': '5'}]}))
+            self.assertEqual(rows[1], (3, {'title': 'Без периода', 'price': '20', 'slug': 'tur-x'}))
+
+            path = os.path.join(directory, 'feed.jsonl')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('{"title": "Тур"}\n\n{broken\n')
+            rows = list(read_jsonl(path))
+            self.assertEqual(rows[0], (1, {'title': 'Тур'}))
+            self.assertEqual(rows[1][0], 3)
+            self.assertIsInstance(rows[1][1], Exception)
+
+    def test_bad_rows_are_reported_without_stopping_the_load(self):
+        stats, errors = self.run_import([
+            self.company,
+            self.tour('Хороший', timespans=[{'group_name': 'Г', 'date_from': '2030-01-01T00:00',
+                                             'date_to': '2030-01-08T00:00', 'place_count': 5}]),
+            self.tour('Без цены', price='дорого'),
+            self.tour('Чужой', company='Нет такой'),
+            self.tour('Без даты', timespans=[{'group_name': 'Г', 'date_from': 'завтра',
+                                              'date_to': '2030-01-08T00:00', 'place_count': 5}]),
+            {'type': 'company', 'name': 'Без телефона'},
+            ValueError('Некорректный JSON'),
+        ])
+        self.assertEqual(sorted(errors), [3, 4, 5, 6, 7])
+        self.assertEqual((stats.rows, stats.companies, stats.tours, stats.timespans, stats.errors),
+                         (7, 1, 1, 1, 5))
+        self.assertEqual(list(Tour.objects.values_list('title', flat=True)), ['Хороший'])
+
+    def test_failed_batch_is_retried_row_by_row(self):
+        write_tours = CatalogueImporter.write_tours
+
+        def failing(importer, tours):
+            if any(tour.title == 'Сломанный' for tour in tours):
+                raise DatabaseError('boom')
+            return write_tours(importer, tours)
+
+        with mock.patch.object(CatalogueImporter, 'write_tours', failing):
+            stats, errors = self.run_import([
+                self.company, self.tour('Первый'), self.tour('Сломанный'), self.tour('Третий')])
+        self.assertEqual(errors, [3])
+        self.assertEqual(stats.tours, 2)
+        self.assertEqual(sorted(Tour.objects.values_list('title', flat=True)), ['Первый', 'Третий'])
+
+    def test_feed_slugs_upsert_and_allocated_slugs_only_insert(self):
+        tour, _ = create_catalogue()
+        fields = dict(company=tour.company, country=tour.country, price=1,
+                      img_preview_url='https://example.com/t.png', short_description='-')
+        Tour.objects.create(title='Тур', **fields)
+        Tour.objects.create(title='Тур', **fields)
+        # Занимает следующий номер счётчика базы tur
+        other = Tour.objects.create(title='Тур 2', **fields)
+
+        # tur-2 уже занят, tur-3 занимает строка со slug'ом из того же пакета
+        feed = [self.company, self.tour('Тур'), self.tour('Тур'), self.tour('Из файла', slug='tur-3')]
+        stats, errors = self.run_import(feed)
+        self.assertEqual(errors, [])
+        imported = Company.objects.get(name='Поставщик').tour_set.order_by('slug')
+        self.assertEqual(list(imported.values_list('slug', 'title')),
+                         [('tur-3', 'Из файла'), ('tur-4', 'Тур'), ('tur-5', 'Тур')])
+        other.refresh_from_db()
+        self.assertEqual((other.slug, other.title), ('tur-2', 'Тур 2'))
+
+        # Повторный импорт обновляет те же туры: по slug'у из файла и по (компания, название)
+        feed = [self.company, self.tour('Тур', price='200.00'), self.tour('Тур', price='300.00'),
+                self.tour('Переименован', slug='tur-3'), self.tour('Тур', price='400.00')]
+        stats, errors = self.run_import(feed, chunk_size=2)
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            list(imported.values_list('slug', 'title', 'price')),
+            [('tur-3', 'Переименован', 100), ('tur-4', 'Тур', 200), ('tur-5', 'Тур', 300),
+             ('tur-6', 'Тур', 400)])
+        self.assertEqual(Tour.objects.count(), 8)
+
+    def test_command_writes_errors_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'feed.jsonl')
+            with open(path, 'w', encoding='utf-8') as f:
+                for record in [self.company, self.tour('Тур'), self.tour('Плохой', price='x')]:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            errors = os.path.join(directory, 'errors.jsonl')
+            call_command('import_catalogue', path, '--errors', errors, stdout=io.StringIO())
+            with open(errors, encoding='utf-8') as f:
+                self.assertEqual([json.loads(line)['line'] for line in f], [3])
+        self.assertTrue(Tour.objects.filter(title='Тур').exists())
+
+
+class KeysetPaginationTests(TestCase):
+    def test_cursor_walk_matches_ordering(self):
+        tour, _ = create_catalogue()
+        for i in range(24):
+            Tour.objects.create(
+                company=tour.company, country=tour.country, title=f'Тур {i}', price=i % 3,
+                img_preview_url='https://example.com/t.png', short_description='-')
+        expected = list(Tour.objects.order_by('price', 'id').values_list('slug', flat=True))
+
+        client = APIClient()
+        slugs, url = [], '/api/tour/?pagination=cursor'
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            slugs += [item['slug'] for item in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(slugs, expected)
+
+    def test_malformed_cursor_is_404(self):
+        tour, _ = create_catalogue()
+        user = User.objects.create_user('user', password='password')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        def cursor(raw):
+            return base64.urlsafe_b64encode(raw.encode()).decode()
+
+        cases = [
+            ('/api/tour/', '!!!'),
+            ('/api/tour/', cursor('1')),
+            ('/api/tour/', cursor('{"a": 1}')),
+            ('/api/tour/', cursor('["1"]')),
+            ('/api/tour/', cursor('["abc", "1"]')),
+            ('/api/tour/', cursor('[null, "1"]')),
+            ('/api/tour/', cursor('["1.00", "x"]')),
+            ('/api/reservation/history/', cursor('["вчера", "1"]')),
+        ]
+        for url, value in cases:
+            response = client.get(url, {'cursor': value})
+            self.assertEqual(response.status_code, 404, (url, value))
+            self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+        response = client.get('/api/tour/', {'cursor': cursor('["1.00", "0"]')})
+        self.assertEqual([item['slug'] for item in response.json()['results']], [tour.slug])
+
+
+class TourSearchTests(TestCase):
+    def test_search_ranks_title_matches_first(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tour, _ = create_catalogue()
+            other = Tour.objects.create(
+                company=tour.company, country=Country.objects.create(name='Египет'),
+                title='Пирамиды Гизы', price=1, img_preview_url='https://example.com/t.png',
+                short_description='Экскурсия после Турции')
+            TourInfo.objects.create(tour=other, description='-', placed='Каир',
+                                    img_url='https://example.com/i.png',
+                                    img_background_url='https://example.com/b.png')
+
+        response = APIClient().get('/api/tour/search/', {'q': 'турцию'})
+        self.assertEqual([item['slug'] for item in response.data], [tour.slug, other.slug])
+
+        response = APIClient().get('/api/tour/search/', {'q': 'каир'})
+        self.assertEqual([item['slug'] for item in response.data], [other.slug])
+
+    def test_company_reindexed_only_on_rename(self):
+        tour, _ = create_catalogue()
+        company = Company.objects.get(pk=tour.company_id)
+        with mock.patch.object(search, 'index_tours') as index_tours:
+            with self.captureOnCommitCallbacks(execute=True):
+                company.phone = '79991111111'
+                company.save()
+            index_tours.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                company.name = 'Новое имя'
+                company.save()
+            index_tours.assert_called_once_with([tour.pk])
+
+
+class TourFacetTests(TestCase):
+    def test_list_returns_facet_counts_and_invalidates(self):
+        tour, _ = create_catalogue()
+        Tour.objects.create(
+            company=tour.company, country=Country.objects.create(name='Египет'),
+            title='Пирамиды', price=50000, img_preview_url='https://example.com/t.png',
+            short_description='-')
+
+        response = APIClient().get('/api/tour/', {'facets': 1})
+        self.assertEqual(response.data['facets']['company'][0]['count'], 2)
+        self.assertEqual(
+            [(item['name'], item['count']) for item in response.data['facets']['country']],
+            [('Египет', 1), ('Турция', 1)])
+        self.assertEqual(response.data['facets']['price'], [
+            {'min': None, 'max': 10000, 'count': 1},
+            {'min': 50000, 'max': 100000, 'count': 1},
+        ])
+
+        response = APIClient().get('/api/tour/', {'facets': 1, 'country': 'Турц'})
+        self.assertEqual(response.data['facets']['company'][0]['count'], 1)
+        # Нормализованные параметры попадают в тот же кэш: только COUNT и страница
+        with self.assertNumQueries(2):
+            APIClient().get('/api/tour/', {'facets': 1, 'country': 'Турц '})
+
+        tour.delete()
+        response = APIClient().get('/api/tour/', {'facets': 1, 'country': 'Турц'})
+        self.assertEqual(response.data['facets']['company'], [])
+
+    def test_evicted_version_does_not_revive_old_entries(self):
+        cache.clear()
+        params = QueryDict('country=Турция')
+        first = facets.cache_key(params, ['country'])
+        facets.invalidate()
+        second = facets.cache_key(params, ['country'])
+        # Ключ версии вытеснен: новая версия не совпадает ни с одной прежней
+        cache.delete(facets.VERSION_KEY)
+        third = facets.cache_key(params, ['country'])
+        self.assertEqual(len({first, second, third}), 3)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        caching.get_backend().clear()
+        self.tour, _ = create_catalogue()
+
+    def test_anonymous_list_is_cached_and_revalidated(self):
+        client = APIClient()
+        first = client.get('/api/tour/', {'page': 1})
+        self.assertEqual(first['X-Cache'], 'MISS')
+
+        with self.assertNumQueries(0):
+            second = client.get('/api/tour/', {'page': '1'})
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+
+        with self.assertNumQueries(0):
+            response = client.get('/api/tour/', {'page': 1}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        self.tour.title = 'Новое название'
+        self.tour.save()
+        response = client.get('/api/tour/', {'page': 1}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['results'][0]['title'], 'Новое название')
+
+    def test_hit_keeps_drf_headers(self):
+        client = APIClient()
+        miss = client.get(f'/api/tour/{self.tour.slug}/')
+        hit = client.get(f'/api/tour/{self.tour.slug}/')
+        not_modified = client.get(f'/api/tour/{self.tour.slug}/', HTTP_IF_NONE_MATCH=miss['ETag'])
+        self.assertEqual((miss['X-Cache'], hit['X-Cache'], not_modified.status_code), ('MISS', 'HIT', 304))
+        for name in ('Vary', 'Allow'):
+            self.assertTrue(miss.has_header(name), name)
+            self.assertEqual(hit[name], miss[name])
+        self.assertEqual(not_modified['Vary'], miss['Vary'])
+        self.assertIn('Cookie', hit['Vary'])
+
+    @override_settings(ALLOWED_HOSTS=['a.example.com', 'b.example.com'])
+    def test_hosts_are_cached_separately(self):
+        for i in range(10):
+            Tour.objects.create(company=self.tour.company, country=self.tour.country, title=f'Тур {i}',
+                                price=i, img_preview_url='https://example.com/t.png', short_description='-')
+        client = APIClient()
+        first = client.get('/api/tour/', HTTP_HOST='a.example.com')
+        second = client.get('/api/tour/', HTTP_HOST='b.example.com')
+        self.assertEqual(second['X-Cache'], 'MISS')
+        self.assertTrue(first.json()['next'].startswith('http://a.example.com/'))
+        self.assertTrue(second.json()['next'].startswith('http://b.example.com/'))
+
+    def test_authenticated_requests_bypass_cache(self):
+        client = APIClient(HTTP_AUTHORIZATION='Bearer token')
+        response = client.get('/api/country/')
+        self.assertNotIn('X-Cache', response)
+
+
+class TourDetailTests(TestCase):
+    def setUp(self):
+        caching.get_backend().clear()
+        self.tour, self.timespan = create_catalogue()
+        TourInfo.objects.create(tour=self.tour, description='-', placed='-')
+        now = timezone.now()
+        TourTimeSpan.objects.create(
+            group_name='Прошедшая', tour=self.tour, place_count=10,
+            date_from=now - datetime.timedelta(days=20),
+            date_to=now - datetime.timedelta(days=10))
+
+    def test_full_info_is_bounded_and_cached(self):
+        client = APIClient()
+        url = f'/api/tour/{self.tour.slug}/full/'
+        # Тур со справочниками и ближайшие периоды — два запроса независимо от их числа
+        with self.assertNumQueries(2):
+            response = client.get(url)
+        data = response.json()
+        self.assertEqual(data['time_spans']['id'], self.timespan.pk)
+        self.assertEqual([item['id'] for item in data['upcoming_time_spans']], [self.timespan.pk])
+
+        with self.assertNumQueries(0):
+            response = client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+        user = User.objects.create_user('user', 'user@example.com', 'password')
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation = reservations.create(user, self.timespan, 3)
+            reservations.transition(Reservation.objects.all(), [reservation.pk], ReservationStatus.PAID)
+        response = client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['time_spans']['places_released'], 3)
+
+    def test_full_info_without_upcoming_is_bounded(self):
+        self.timespan.delete()
+        past = TourTimeSpan.objects.get(tour=self.tour)
+        # Последний прошедший период берётся тем же запросом, что и ближайшие
+        with self.assertNumQueries(2):
+            response = APIClient().get(f'/api/tour/{self.tour.slug}/full/')
+        data = response.json()
+        self.assertEqual(data['time_spans']['id'], past.pk)
+        self.assertEqual([item['id'] for item in data['upcoming_time_spans']], [past.pk])
+
+    def test_timespan_changes_resolve_slugs_once(self):
+        client = APIClient()
+        url = f'/api/tour/{self.tour.slug}/full/'
+        client.get(url)
+        for i in range(3):
+            TourTimeSpan.objects.create(
+                group_name=f'Ещё {i}', tour=self.tour, place_count=5,
+                date_from=self.timespan.date_from, date_to=self.timespan.date_to)
+
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                TourTimeSpan.objects.filter(tour=self.tour).exclude(pk=self.timespan.pk).delete()
+        # Один запрос слагов на всю пачку, а не по строке
+        self.assertEqual(len([query for query in queries if '"app_tour"."slug"' in query['sql']]), 1)
+        self.assertEqual(client.get(url)['X-Cache'], 'MISS')
+
+    def test_unknown_slug_is_404(self):
+        response = APIClient().get('/api/tour/missing/full/')
+        self.assertEqual(response.status_code, 404)
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        caching.get_backend().clear()
+        self.tour, _ = create_catalogue()
+
+    def test_server_timing_and_histograms(self):
+        response = APIClient().get(f'/api/tour/{self.tour.slug}/full/')
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="2 queries"')
+        self.assertRegex(response['Server-Timing'], r'serialize;dur=[\d.]+, render;dur=[\d.]+')
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+        output = metrics.render_prometheus()
+        self.assertIn('# TYPE http_request_db_queries histogram', output)
+        self.assertIn('http_request_db_queries_bucket{view="tour.get_full_info",le="2"}', output)
+        self.assertIn('http_request_serialize_duration_seconds_count{view="tour.get_full_info"}', output)
+
+    def test_serializer_time_is_counted_once(self):
+        from app.middleware import QueryStats, _current_stats
+        tours = list(Tour.objects.select_related('company', 'country'))
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+        try:
+            with mock.patch('app.middleware.time.perf_counter', side_effect=[0.0, 0.5]):
+                TourSerializer(tours, many=True).data
+        finally:
+            _current_stats.reset(token)
+        # ListSerializer.data → Serializer.data → BaseSerializer.data: один замер
+        self.assertEqual(stats.serialize_duration, 0.5)
+
+    def test_metrics_require_token(self):
+        # Адрес клиента не даёт доступа: за локальным nginx это всегда 127.0.0.1
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 404)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE', response.content.decode())
+
+    @override_settings(QUERY_BUDGET={'VIEWS': {'tour.get_full_info': 1}, 'RAISE': True})
+    def test_query_budget_fails_in_tests(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            APIClient().get(f'/api/tour/{self.tour.slug}/full/')
+
+
+class AsyncCatalogueTests(TestCase):
+    def setUp(self):
+        caching.get_backend().clear()
+        self.tour, _ = create_catalogue()
+
+    @override_settings(POPULAR_TOURS={'BACKGROUND_REFRESH': False})
+    async def test_async_views_match_viewsets(self):
+        paths = ['tour/?page=1', f'tour/{self.tour.slug}/', f'tour/{self.tour.slug}/full/',
+                 'tour/popular/', 'company/', f'company/{self.tour.company.slug}/', 'country/']
+        for path in paths:
+            expected = await sync_to_async(APIClient().get)(f'/api/{path}')
+            response = await self.async_client.get(f'/api/async/{path}')
+            self.assertEqual(response.status_code, 200, path)
+            self.assertEqual(response.content.replace(b'/api/async/', b'/api/'), expected.content, path)
+
+        response = await self.async_client.get('/api/async/tour/missing/')
+        self.assertEqual(response.status_code, 404)
+
+
+class CompiledSerializerTests(TestCase):
+    def test_output_matches_model_serializers(self):
+        tour, timespan = create_catalogue()
+        user = User.objects.create_user('user', 'user@example.com', 'password')
+        reservations.create(user, timespan, 2)
+        Favourites.objects.add(user, tour)
+
+        renderer = JSONRenderer()
+        cases = [
+            (compiled_tour_serializer, TourSerializer, Tour.objects.select_related('company', 'country')),
+            (compiled_company_serializer, CompanySerializer, Company.objects.all()),
+            (compiled_reservation_serializer, ReservationSerializer,
+             Reservation.objects.select_related('target__tour', 'status')),
+            (compiled_favourite_serializer, FavouriteSerializer, Favourites.objects.select_related('target')),
+        ]
+        for compiled, serializer_class, queryset in cases:
+            self.assertEqual(
+                renderer.render(compiled.serialize(compiled.values(queryset))),
+                renderer.render(serializer_class(queryset, many=True).data),
+                serializer_class.__name__)
+
+
+class LookupTableTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tour, _ = create_catalogue()
+
+    def test_country_filter_uses_lookup_without_join(self):
+        lookups.countries.load()
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().get('/api/tour/?country=турц')
+        self.assertEqual([item['slug'] for item in response.json()['results']], [self.tour.slug])
+        # Страна ищется в памяти: в WHERE только country_id IN (...)
+        self.assertFalse(any('LIKE' in query['sql'] for query in queries.captured_queries))
+
+        self.assertEqual(APIClient().get('/api/tour/?country=нет').json()['results'], [])
+
+    @override_settings(LOOKUP_CHECK_INTERVAL=0)
+    def test_other_workers_reload_after_version_bump(self):
+        # Отдельный экземпляр таблицы изображает другой воркер
+        worker = lookups.LookupTable(Country, 'name')
+        self.assertEqual(worker.get_id('Турция'), self.tour.country_id)
+        with self.assertNumQueries(0):
+            worker.get_id('Турция')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Country.objects.filter(pk=self.tour.country_id).update(name='Греция')
+            Country.objects.get(pk=self.tour.country_id).save()
+        self.assertIsNone(worker.get_id('Турция'))
+        self.assertEqual(worker.get_id('Греция'), self.tour.country_id)
+
+    @override_settings(POPULAR_TOURS={'BACKGROUND_REFRESH': False})
+    def test_rows_inserted_without_signals_are_found(self):
+        lookups.countries.load()
+        # bulk_create не вызывает post_save: справочник узнаёт о стране при промахе
+        egypt = Country.objects.bulk_create([Country(name='Египет')])[0]
+        Tour.objects.filter(pk=self.tour.pk).update(country=egypt)
+
+        response = APIClient().get('/api/tour/', {'country': 'Египет'})
+        self.assertEqual(response.json()['count'], 1)
+        self.assertEqual(APIClient().get('/api/tour/popular/', {'country': 'Египет'}).status_code, 200)
+
+    def test_import_invalidates_countries(self):
+        version = cache.get(lookups.countries.version_key)
+        records = [{'type': 'company', 'name': 'Поставщик', 'phone': '79990000000', 'address': '-',
+                    'description': '-', 'image': 'https://example.com/c.png'},
+                   {'company': 'Поставщик', 'country': 'Египет', 'title': 'Пирамиды',
+                    'price': '1', 'img_preview_url': 'https://example.com/t.png',
+                    'short_description': '-'}]
+        with self.captureOnCommitCallbacks(execute=True):
+            CatalogueImporter().run(enumerate(records, start=1))
+        self.assertNotEqual(cache.get(lookups.countries.version_key), version)
+        # Одно чтение таблицы, без проверки промаха
+        with self.assertNumQueries(1):
+            self.assertIsNotNone(lookups.countries.get_id('Египет'))
+
+
+class CachedAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('user', 'user@example.com', 'password')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def test_user_is_cached_until_changed(self):
+        self.assertEqual(self.client.get('/api/reservation/count/').status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/reservation/count/')
+        self.assertFalse(any('"app_user"."' in query['sql'] for query in queries.captured_queries))
+
+        # В кэше только поля для проверки доступа, без хэша пароля
+        key = authentication.cache_key(self.user.pk, authentication.get_generation(self.user.pk))
+        self.assertEqual(set(cache.get(key)), {
+            'id', 'username', 'is_active', 'is_staff', 'is_superuser', 'password_version'})
+        self.assertNotIn(self.user.password, cache.get(key).values())
+        user = authentication.load_user(cache.get(key))
+        self.assertEqual((user.pk, user.username, user.is_active, user.is_staff),
+                         (self.user.pk, 'user', True, False))
+
+        # Профиль всегда читается из БД целиком
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch('/api/auth/update/', {'email': 'new@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/auth/user/').json()['email'], 'new@example.com')
+
+        self.client.get('/api/reservation/count/')
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/api/reservation/count/').status_code, 200)
+        # update() не шлёт сигналов: после него вызывается invalidate()
+        authentication.invalidate(self.user.pk)
+        self.assertEqual(self.client.get('/api/reservation/count/').status_code, 401)
+
+    def test_evicted_generation_does_not_revive_old_entries(self):
+        self.client.get('/api/reservation/count/')
+        generation = authentication.get_generation(self.user.pk)
+        cache.delete(authentication.generation_key(self.user.pk))
+        self.assertNotEqual(authentication.get_generation(self.user.pk), generation)
+
+    def test_password_change_revokes_cached_tokens(self):
+        # SIMPLE_JWT читается один раз при импорте simplejwt, override_settings не действует
+        with mock.patch.object(jwt_settings, 'CHECK_REVOKE_TOKEN', True):
+            token = RefreshToken.for_user(self.user).access_token
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.assertEqual(self.client.get('/api/reservation/count/').status_code, 200)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.set_password('new-password')
+                self.user.save()
+            self.assertEqual(self.client.get('/api/reservation/count/').status_code, 401)
+
+    @override_settings(JWT_STATELESS_READS=True)
+    def test_stateless_reads_skip_user_lookup(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/favourites/check-many/?slugs=a')
+        self.assertEqual(response.json(), {'a': False})
+
+        # Изменяющие запросы по-прежнему получают настоящего пользователя
+        response = self.client.post('/api/favourites/add-many/', {'slugs': ['a']}, format='json')
+        self.assertEqual(response.json(), {'added': 0, 'missing': ['a']})
+
+
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user', 'user@example.com', 'password')
+
+    def test_login_and_register_hash_in_pool(self):
+        response = APIClient().post('/api/auth/register/', {
+            'username': 'new', 'email': 'new@example.com', 'password': 'secret-pass', 'phone': '1'},
+            format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(User.objects.get(username='new').check_password('secret-pass'))
+
+        response = APIClient().post('/api/auth/login/', {'username': 'user', 'password': 'password'},
+                                    format='json')
+        self.assertIn('access', response.json())
+        self.assertGreater(metrics.histograms()[('password_hash_seconds', (('operation', 'check'),))]['count'], 0)
+
+    @override_settings(PASSWORD_HASHING={'WORKERS': 1, 'MAX_PENDING': 0})
+    def test_full_pool_rejects_with_503(self):
+        release = threading.Event()
+        busy = hashing.get_pool().submit('test', release.wait)
+        try:
+            response = APIClient().post('/api/auth/login/', {'username': 'user', 'password': 'password'},
+                                        format='json')
+        finally:
+            release.set()
+            busy.result()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    @override_settings(PASSWORD_HASHING={'WORKERS': 1, 'MAX_PENDING': 0})
+    def test_full_pool_falls_back_inline_outside_api(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin-pass')
+        release = threading.Event()
+        busy = hashing.get_pool().submit('test', release.wait)
+        try:
+            # Вход в админку: HashingOverloaded вне DRF дал бы 500
+            response = self.client.post('/admin/login/?next=/admin/',
+                                        {'username': 'admin', 'password': 'admin-pass'})
+        finally:
+            release.set()
+            busy.result()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], '/admin/')
+
+    async def test_async_check_password(self):
+        user = await User.objects.aget(pk=self.user.pk)
+        self.assertTrue(await user.acheck_password('password'))
+        self.assertFalse(await user.acheck_password('wrong'))
+
+
+class AvatarPipelineTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name, AVATARS={'WORKERS': 0})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.media = media.name
+
+    def upload(self, user):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 400), 'red').save(buffer, 'PNG')
+        buffer.name = 'photo.png'
+        buffer.seek(0)
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.patch('/api/auth/update/', {'avatar': buffer}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        return client
+
+    def test_variants_are_generated_deduplicated_and_cleaned_up(self):
+        first = User.objects.create_user('first', 'first@example.com', 'password')
+        second = User.objects.create_user('second', 'second@example.com', 'password')
+        client = self.upload(first)
+        self.upload(second)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.avatar.name, second.avatar.name)
+        self.assertRegex(first.avatar.name, r'^avatars/[0-9a-f]{64}\.png$')
+
+        variants = client.get('/api/auth/user/').json()['avatar_variants']
+        self.assertEqual(sorted(variants, key=int), ['64', '128', '256'])
+        self.assertTrue(variants['64']['webp'].endswith('/64.webp'))
+        files = [first.avatar.name, *avatars.variant_names(first.avatar.name)]
+        self.assertTrue(all(os.path.exists(os.path.join(self.media, name)) for name in files))
+
+        # Файл общий: удаление у одного пользователя его не трогает
+        with self.captureOnCommitCallbacks(execute=True):
+            client.delete('/api/auth/avatar/')
+        self.assertTrue(os.path.exists(os.path.join(self.media, files[0])))
+
+        second_client = APIClient()
+        second_client.force_authenticate(second)
+        with self.captureOnCommitCallbacks(execute=True):
+            second_client.delete('/api/auth/avatar/')
+        self.assertFalse(any(os.path.exists(os.path.join(self.media, name)) for name in files))
+
+
+    def test_account_deletion_releases_avatar(self):
+        user = User.objects.create_user('user', 'user@example.com', 'password')
+        client = self.upload(user)
+        user.refresh_from_db()
+        files = [user.avatar.name, *avatars.variant_names(user.avatar.name)]
+        self.assertTrue(AvatarFile.objects.filter(name=user.avatar.name).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.delete('/api/auth/delete/').status_code, 204)
+        self.assertFalse(any(os.path.exists(os.path.join(self.media, name)) for name in files))
+        self.assertFalse(AvatarFile.objects.exists())
+
+    def test_release_checks_references_under_file_lock(self):
+        # Незакоммиченная загрузка держит блокировку файла; release() берёт её
+        # до проверки ссылок и поэтому видит ссылку, сохранённую загрузкой
+        owner = User.objects.create_user('owner', 'owner@example.com', 'password')
+        self.upload(owner)
+        owner.refresh_from_db()
+        with CaptureQueriesContext(connection) as queries:
+            avatars.release(owner.avatar.name)
+        reference = next(i for i, query in enumerate(queries) if '"app_user"' in query['sql'])
+        lock = next(i for i, query in enumerate(queries) if '"app_avatarfile"' in query['sql'])
+        self.assertLess(lock, reference)
+        self.assertTrue(os.path.exists(os.path.join(self.media, owner.avatar.name)))
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        settings = override_settings(MEDIA_ROOT=root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.content = bytes(range(256)) * 4
+        os.makedirs(os.path.join(root.name, 'avatars'))
+        self.name = f'avatars/{"a" * 64}.png'
+        with open(os.path.join(root.name, self.name), 'wb') as file:
+            file.write(self.content)
+
+    def test_conditional_and_range_requests(self):
+        response = self.client.get(f'/media/{self.name}')
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertIn('immutable', response['Cache-Control'])
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(f'/media/{self.name}', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        response = self.client.get(f'/media/{self.name}', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+        response = self.client.get(f'/media/{self.name}', HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+
+        response = self.client.get(f'/media/{self.name}', HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+
+    @override_settings(MEDIA_SERVING={'OFFLOAD': 'x-accel'})
+    def test_offload_to_nginx(self):
+        response = self.client.get(f'/media/{self.name}')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.name}')
+        self.assertEqual(response.content, b'')
+
+
+class ImageProxyTests(TestCase):
+    def setUp(self):
+        from PIL import Image
+
+        cache.clear()
+        buffer = io.BytesIO()
+        Image.new('RGB', (2000, 1000), 'blue').save(buffer, 'PNG')
+        image = buffer.getvalue()
+        self.hits = []
+
+        # Локальный «внешний» сервер картинок
+        class Origin(http.server.BaseHTTPRequestHandler):
+            def do_GET(handler):
+                self.hits.append(handler.path)
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'image/png')
+                handler.send_header('Content-Length', str(len(image)))
+                handler.end_headers()
+                handler.wfile.write(image)
+
+            def log_message(handler, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Origin)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = f'http://127.0.0.1:{server.server_port}/tour.png'
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        proxy_settings = override_settings(IMAGE_PROXY={
+            'ENABLED': True, 'ALLOW_PRIVATE_NETWORKS': True, 'CACHE_DIR': directory.name})
+        proxy_settings.enable()
+        self.addCleanup(proxy_settings.disable)
+
+    def test_serializers_emit_proxied_urls_served_from_cache(self):
+        tour, _ = create_catalogue()
+        Tour.objects.filter(pk=tour.pk).update(img_preview_url=self.url)
+        proxied = APIClient().get('/api/tour/').json()['results'][0]['img_preview_url']
+        self.assertTrue(proxied.startswith('/api/image-proxy/?'))
+
+        from PIL import Image
+
+        response = self.client.get(proxied, HTTP_ACCEPT='image/webp,*/*')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertEqual(Image.open(io.BytesIO(b''.join(response.streaming_content))).size, (640, 320))
+
+        self.assertEqual(self.client.get(
+            proxied, HTTP_ACCEPT='image/webp', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        # Другая ширина строится из сохранённого оригинала — источник запрошен один раз
+        response = self.client.get(imageproxy.proxied_url(self.url, 320))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(len(self.hits), 1)
+
+        self.assertEqual(self.client.get(proxied.replace('&s=', '&s=x')).status_code, 403)
+
+    def test_private_addresses_are_rejected(self):
+        with override_settings(IMAGE_PROXY={'ENABLED': True}):
+            response = self.client.get(imageproxy.proxied_url(self.url, 320))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.hits, [])
+
+    def test_rebound_address_is_rejected_after_connect(self):
+        # Проверка имени прошла (DNS ответил публичным адресом), а соединение ушло на 127.0.0.1
+        config = {**imageproxy.get_config(), 'ALLOW_PRIVATE_NETWORKS': False}
+        with mock.patch.object(imageproxy, 'check_host'):
+            with self.assertRaises(imageproxy.ProxyError) as error:
+                imageproxy.fetch(self.url, config)
+        self.assertEqual(error.exception.status, 400)
+        self.assertEqual(self.hits, [])
+
+    def test_disk_cache_evicts_least_recently_used(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        disk = imageproxy.DiskCache(directory.name, max_size=250)
+        for index, key in enumerate(['aa' * 32, 'bb' * 32, 'cc' * 32]):
+            disk.set(key, 'jpg', b'x' * 100).close()
+            os.utime(disk.path(key, 'jpg'), (index, index))
+        self.assertIsNone(disk.open('aa' * 32, 'jpg'))
+        self.assertIsNotNone(disk.read('cc' * 32, 'jpg'))
+
+
+class FavouritesCounterTests(TestCase):
+    def setUp(self):
+        self.tour, _ = create_catalogue()
+        self.other = Tour.objects.create(
+            company=self.tour.company, country=self.tour.country, title='Другой', price=1,
+            img_preview_url='https://example.com/t.png', short_description='-')
+        self.users = [User.objects.create_user(f'user-{i}', password='password') for i in range(2)]
+
+    def counts(self):
+        return list(Tour.objects.order_by('pk').values_list('favourites_count', flat=True))
+
+    def test_counter_follows_add_remove_and_deletes(self):
+        self.assertTrue(Favourites.objects.add(self.users[0], self.tour))
+        self.assertFalse(Favourites.objects.add(self.users[0], self.tour))
+        Favourites.objects.add(self.users[1], self.tour)
+        Favourites.objects.add(self.users[1], self.other)
+        self.assertEqual(self.counts(), [2, 1])
+
+        self.assertEqual(Favourites.objects.remove(customer=self.users[0], target=self.tour), 1)
+        self.assertEqual(Favourites.objects.remove(customer=self.users[0], target=self.tour), 0)
+        self.assertEqual(self.counts(), [1, 1])
+
+        # Удаление аккаунта списывает счётчики всех его туров
+        client = APIClient()
+        client.force_authenticate(self.users[1])
+        self.assertEqual(client.delete('/api/auth/delete/').status_code, 204)
+        self.assertEqual(self.counts(), [0, 0])
+
+        # Удаление тура не задевает счётчики остальных
+        Favourites.objects.add(self.users[0], self.tour)
+        Favourites.objects.add(self.users[0], self.other)
+        self.tour.delete()
+        self.assertEqual(self.counts(), [1])
+        self.assertEqual(Favourites.objects.count(), 1)
+
+    def test_repair_counters_fixes_drift(self):
+        Favourites.objects.add(self.users[0], self.tour)
+        Tour.objects.filter(pk=self.tour.pk).update(favourites_count=5)
+        Tour.objects.filter(pk=self.other.pk).update(favourites_count=3)
+
+        call_command('repair_counters', '--dry-run', stdout=io.StringIO())
+        self.assertEqual(self.counts(), [5, 3])
+
+        output = io.StringIO()
+        call_command('repair_counters', stdout=output)
+        self.assertIn('favourites_count: исправлено туров — 2', output.getvalue())
+        self.assertEqual(self.counts(), [1, 0])
+
+
+class PopularRankingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tour, self.timespan = create_catalogue()
+        self.other = Tour.objects.create(
+            company=Company.objects.create(name='Другая', phone='79990000001', address='-',
+                                           description='-', image='https://example.com/c.png'),
+            country=Country.objects.create(name='Египет'), title='Тур в Египет', price=1,
+            img_preview_url='https://example.com/t.png', short_description='-')
+        self.users = [User.objects.create_user(f'user-{i}', password='password') for i in range(4)]
+
+    def favourite(self, user, tour, days_ago):
+        Favourites.objects.create(customer=user, target=tour,
+                                  datetime=timezone.now() - datetime.timedelta(days=days_ago))
+
+    def test_scores_decay_with_age_and_count_paid_seats(self):
+        self.favourite(self.users[0], self.tour, 1)
+        self.favourite(self.users[1], self.tour, 20)
+        self.favourite(self.users[2], self.other, 60)
+        self.favourite(self.users[3], self.other, 200)
+        Reservation.objects.create(customer=self.users[0], target=self.timespan, count=2,
+                                   status=ReservationStatus.objects.get(status=ReservationStatus.PAID))
+        Reservation.objects.create(customer=self.users[1], target=self.timespan, count=5,
+                                   status=ReservationStatus.objects.get(status=ReservationStatus.WAITING))
+
+        scores = rankings.compute_scores()
+        # 1.0 + 0.5 + 2 оплаченных места * 2.0; неоплаченная бронь не считается
+        self.assertAlmostEqual(scores[self.tour.pk], 5.5)
+        self.assertAlmostEqual(scores[self.other.pk], 0.25 + 0.1)
+
+    def test_rankings_are_split_by_scope(self):
+        self.favourite(self.users[0], self.other, 1)
+
+        result = rankings.build_rankings()
+        self.assertEqual(result[rankings.scope_key(rankings.GLOBAL)], [self.other.pk, self.tour.pk])
+        self.assertEqual(result[rankings.scope_key(rankings.COUNTRY, self.tour.country_id)], [self.tour.pk])
+        self.assertEqual(result[rankings.scope_key(rankings.COMPANY, self.other.company_id)], [self.other.pk])
+        self.assertEqual(len(result), 5)
+
+    def test_cold_cache_is_refreshed_in_background(self):
+        Tour.objects.filter(pk=self.other.pk).update(favourites_count=3)
+        with mock.patch.object(rankings.threading, 'Thread') as thread, \
+                mock.patch.object(rankings, 'close_old_connections'):
+            # До пересчёта — ограниченная выборка по счётчику избранного
+            with self.assertNumQueries(1):
+                self.assertEqual(rankings.get_popular_ids(), [self.other.pk, self.tour.pk])
+            # Пока пересчёт идёт, второй не запускается
+            self.assertEqual(rankings.get_popular_ids(rankings.COUNTRY, self.tour.country_id), [self.tour.pk])
+            thread.assert_called_once()
+
+            thread.call_args.kwargs['target']()
+            with self.assertNumQueries(0):
+                self.assertEqual(rankings.get_popular_ids(), [self.other.pk, self.tour.pk])
+            # Срез без туров после свежего пересчёта не запускает новый
+            self.assertEqual(rankings.get_popular_ids(rankings.COUNTRY, 0), [])
+            thread.assert_called_once()
+
+    def test_stale_slice_is_served_while_refreshing(self):
+        key = rankings.scope_key(rankings.GLOBAL)
+        cache.set(key, {'ids': [self.other.pk], 'built_at': time.time()})
+        with mock.patch.object(rankings.threading, 'Thread') as thread:
+            self.assertEqual(rankings.get_popular_ids(), [self.other.pk])
+            thread.assert_not_called()
+
+            cache.set(key, {'ids': [self.other.pk], 'built_at': time.time() - 3600})
+            self.assertEqual(rankings.get_popular_ids(), [self.other.pk])
+            thread.assert_called_once()
+
+    @override_settings(POPULAR_TOURS={'WORKER_REFRESH': False})
+    def test_workers_can_leave_refresh_to_command(self):
+        with mock.patch.object(rankings.threading, 'Thread') as thread:
+            self.assertEqual(rankings.get_popular_ids(), [self.tour.pk, self.other.pk])
+            thread.assert_not_called()
+
+    @override_settings(POPULAR_TOURS={'BACKGROUND_REFRESH': False})
+    def test_inline_refresh(self):
+        self.favourite(self.users[0], self.other, 1)
+        self.assertEqual(rankings.get_popular_ids(), [self.other.pk, self.tour.pk])
+
+    def test_refresh_command_warms_cache(self):
+        call_command('refresh_rankings', stdout=io.StringIO())
+        with mock.patch.object(rankings.threading, 'Thread') as thread:
+            self.assertEqual(rankings.get_popular_ids(rankings.COMPANY, self.tour.company_id), [self.tour.pk])
+            thread.assert_not_called()
+
+
+class FavouriteStateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tour, _ = create_catalogue()
+        self.other = Tour.objects.create(
+            company=self.tour.company, country=self.tour.country, title='Другой тур', price=2000,
+            img_preview_url='https://example.com/t.png', short_description='-')
+        self.user = User.objects.create_user('user', 'user@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            Favourites.objects.add(self.user, self.tour)
+
+    def test_check_many_is_one_query(self):
+        url = f'/api/favourites/check-many/?slugs={self.tour.slug},{self.other.slug},missing'
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.json(), {self.tour.slug: True, self.other.slug: False, 'missing': False})
+
+        response = self.client.post('/api/favourites/check-many/', {'slugs': [self.other.slug]}, format='json')
+        self.assertEqual(response.json(), {self.other.slug: False})
+
+    def test_state_is_fresh_in_other_workers(self):
+        url = f'/api/favourites/{self.other.slug}/check/'
+        self.assertFalse(self.client.get(url).json()['is_favorite'])
+        # Другой воркер со своим кэшем: добавление ему не видно через инвалидацию
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'worker-b'}}):
+            self.assertFalse(self.client.get(url).json()['is_favorite'])
+            self.client.post(f'/api/favourites/{self.other.slug}/add/')
+            self.assertTrue(self.client.get(url).json()['is_favorite'])
+        self.assertTrue(self.client.get(url).json()['is_favorite'])
+        response = self.client.get(f'/api/tour/{self.other.slug}/favourite/')
+        self.assertTrue(response.json()['is_favorite'])
+
+    def test_favourite_list_keeps_its_fields(self):
+        item = self.client.get('/api/favourite/').json()[0]
+        self.assertEqual(list(item), ['id', 'tour_slug', 'tour_price', 'tour_img', 'tour_title',
+                                      'customer', 'target'])
+
+    def test_list_marks_favourites_for_authenticated_user(self):
+        # Настоящий токен: по заголовку кэш ответов отличает авторизованные запросы
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        results = client.get('/api/tour/').json()['results']
+        self.assertEqual({item['slug']: item['is_favorite'] for item in results},
+                         {self.tour.slug: True, self.other.slug: False})
+
+        results = APIClient().get('/api/tour/').json()['results']
+        self.assertNotIn('is_favorite', results[0])
+
+    def test_batch_add_and_remove_are_idempotent(self):
+        slugs = [self.tour.slug, self.other.slug, 'missing']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/favourites/add-many/', {'slugs': slugs}, format='json')
+        self.assertEqual(response.json(), {'added': 1, 'missing': ['missing']})
+        self.assertEqual(favourites.get_slugs(self.user, slugs), {self.tour.slug, self.other.slug})
+
+        response = self.client.post('/api/favourites/add-many/', {'slugs': slugs}, format='json')
+        self.assertEqual(response.json()['added'], 0)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.favourites_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/favourites/remove-many/', {'slugs': slugs}, format='json')
+        self.assertEqual(response.json(), {'removed': 2})
+        self.assertEqual(favourites.get_slugs(self.user, slugs), frozenset())
+        self.assertEqual(
+            list(Tour.objects.order_by('pk').values_list('favourites_count', flat=True)), [0, 0])
+
+        response = self.client.post('/api/favourites/remove-many/', {'slugs': 'x'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ReservationEngineTests(TestCase):
+    def setUp(self):
+        self.tour, self.timespan = create_catalogue()
+        self.user = User.objects.create_user('user', 'user@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_reserve_rejects_overbooking(self):
+        response = self.client.post(
+            f'/api/reservation/{self.tour.slug}/reserve/',
+            {'count': 8, 'timespan': self.timespan.pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.post(
+            f'/api/reservation/{self.tour.slug}/reserve/', {'count': 3}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+        self.timespan.refresh_from_db()
+        self.assertEqual(self.timespan.places_reserved, 8)
+
+    def test_update_count_rejects_overbooking(self):
+        reservation = reservations.create(self.user, self.timespan, 5)
+
+        response = self.client.patch(
+            '/api/reservation/update/', {'id': reservation.pk, 'count': 11}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+        response = self.client.patch(
+            '/api/reservation/update/', {'id': reservation.pk, 'count': 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.timespan.refresh_from_db()
+        self.assertEqual(self.timespan.places_reserved, 2)
+
+    def test_status_transitions_follow_state_machine(self):
+        first, second, third = reservations.create_many(
+            self.user, [(self.timespan, 2), (self.timespan, 3), (self.timespan, 1)])
+        foreign = reservations.create(
+            User.objects.create_user('other', 'other@example.com', 'password'), self.timespan, 1)
+
+        response = self.client.patch('/api/reservation/status/', {
+            'ids': [first.pk, second.pk, foreign.pk, 999999]}, format='json')
+        self.assertEqual(response.json(), {'updated': [first.pk, second.pk],
+                                           'skipped': sorted([foreign.pk, 999999])})
+        self.timespan.refresh_from_db()
+        self.assertEqual((self.timespan.places_reserved, self.timespan.places_paid), (2, 5))
+
+        # paid → declined не разрешён, waiting → declined освобождает места
+        response = self.client.patch('/api/reservation/status/', {
+            'ids': [first.pk, third.pk], 'status': ReservationStatus.DECLINED}, format='json')
+        self.assertEqual(response.json()['updated'], [third.pk])
+        self.timespan.refresh_from_db()
+        self.assertEqual((self.timespan.places_reserved, self.timespan.places_paid), (1, 5))
+
+        response = self.client.patch('/api/reservation/status/', {
+            'ids': [first.pk], 'status': ReservationStatus.COMPLETED}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        # SELECT FOR UPDATE, учёт мест (UPDATE + слаги для кэша), UPDATE статуса и savepoint
+        with self.assertNumQueries(6):
+            updated = reservations.transition(
+                Reservation.objects.all(), [first.pk, second.pk], ReservationStatus.COMPLETED)
+        self.assertEqual(updated, [first.pk, second.pk])
+
+    def test_drifted_ledger_does_not_go_negative(self):
+        reservation = reservations.create(self.user, self.timespan, 3)
+        # Учёт поправили вручную, и он меньше суммы броней
+        TourTimeSpan.objects.filter(pk=self.timespan.pk).update(places_reserved=1)
+
+        reservations.transition(Reservation.objects.all(), [reservation.pk], ReservationStatus.DECLINED)
+        self.timespan.refresh_from_db()
+        self.assertEqual((self.timespan.places_reserved, self.timespan.places_paid), (0, 0))
+
+        other = reservations.create(self.user, self.timespan, 2)
+        TourTimeSpan.objects.filter(pk=self.timespan.pk).update(places_reserved=0)
+        self.assertEqual(reservations.release(Reservation.objects.filter(pk=other.pk)), 1)
+        self.timespan.refresh_from_db()
+        self.assertEqual(self.timespan.places_reserved, 0)
+
+    def test_batch_reserve_is_all_or_nothing(self):
+        other = TourTimeSpan.objects.create(
+            group_name='Вторая', tour=self.tour, place_count=1,
+            date_from=self.timespan.date_from, date_to=self.timespan.date_to)
+
+        response = self.client.post('/api/reservation/reserve-batch/', {'items': [
+            {'timespan': self.timespan.pk, 'count': 2},
+            {'timespan': other.pk, 'count': 2},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Reservation.objects.exists())
+
+        response = self.client.post('/api/reservation/reserve-batch/', {'items': [
+            {'timespan': self.timespan.pk, 'count': 2},
+            {'timespan': other.pk, 'count': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['ids']), 2)
+
+
+    def test_release_returns_seats(self):
+        first, second = reservations.create_many(self.user, [(self.timespan, 2), (self.timespan, 3)])
+        reservations.transition(Reservation.objects.all(), [second.pk], ReservationStatus.PAID)
+
+        self.assertEqual(reservations.release(Reservation.objects.filter(pk=first.pk)), 1)
+        self.timespan.refresh_from_db()
+        self.assertEqual((self.timespan.places_reserved, self.timespan.places_paid), (0, 3))
+
+        # Удаление аккаунта освобождает и оплаченные места
+        self.assertEqual(self.client.delete('/api/auth/delete/').status_code, 204)
+        self.timespan.refresh_from_db()
+        self.assertEqual((self.timespan.places_reserved, self.timespan.places_paid), (0, 0))
+
+    def test_places_released_counts_paid_seats(self):
+        caching.get_backend().clear()
+        paid = reservations.create_many(self.user, [(self.timespan, 3), (self.timespan, 2)])
+        reservations.create(self.user, self.timespan, 4)
+        reservations.transition(Reservation.objects.all(), [item.pk for item in paid], ReservationStatus.PAID)
+
+        time_spans = self.client.get(f'/api/tour/{self.tour.slug}/full/').json()['time_spans']
+        # Сумма оплаченных мест (3 + 2), а не число оплаченных броней
+        self.assertEqual(time_spans['places_released'], 5)
+        self.assertEqual(sorted(time_spans), ['date_from', 'date_to', 'group_name', 'id',
+                                              'place_count', 'places_released'])
+
+    def test_repair_counters_rebuilds_ledger(self):
+        first, second = reservations.create_many(self.user, [(self.timespan, 2), (self.timespan, 3)])
+        reservations.transition(Reservation.objects.all(), [second.pk], ReservationStatus.PAID)
+        TourTimeSpan.objects.filter(pk=self.timespan.pk).update(places_reserved=7, places_paid=0)
+
+        call_command('repair_counters', '--dry-run', stdout=io.StringIO())
+        self.timespan.refresh_from_db()
+        self.assertEqual((self.timespan.places_reserved, self.timespan.places_paid), (7, 0))
+
+        output = io.StringIO()
+        call_command('repair_counters', stdout=output)
+        self.assertIn('учёт мест: исправлено периодов — 1', output.getvalue())
+        self.timespan.refresh_from_db()
+        self.assertEqual((self.timespan.places_reserved, self.timespan.places_paid), (2, 3))
+
+class ReservationConcurrencyTests(TransactionTestCase):
+    threads = 16
+    attempts = 10
+
+    def setUp(self):
+        self.tour, self.timespan = create_catalogue()
+        self.users = [
+            User.objects.create_user(f'user-{i}', password='password')
+            for i in range(self.threads)
+        ]
+
+    def test_parallel_reservations_never_overbook(self):
+        barrier = threading.Barrier(self.threads)
+        succeeded = []
+
+        def worker(user):
+            barrier.wait()
+            try:
+                for _ in range(self.attempts):
+                    try:
+                        reservations.create(user, self.timespan, 1)
+                        succeeded.append(user.pk)
+                    except (reservations.OverbookingError, DatabaseError):
+                        pass
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(user,)) for user in self.users]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.timespan.refresh_from_db()
+        reserved = sum(Reservation.objects.filter(
+            target=self.timespan).values_list('count', flat=True))
+
+        self.assertLessEqual(reserved, self.timespan.place_count)
+        self.assertEqual(reserved, self.timespan.places_reserved)
+        self.assertEqual(reserved, len(succeeded))
+
+
+# Замеры ходят с Host: localhost, который вне тестов разрешён через DEBUG
+@override_settings(POPULAR_TOURS={'BACKGROUND_REFRESH': False}, ALLOWED_HOSTS=['localhost'])
+class BenchmarkSmokeTests(TestCase):
+    # Генератор и замеры на крошечных объёмах: проверяется, что они вообще работают
+
+    def benchmark(self, *args):
+        output = io.StringIO()
+        call_command('benchmark', *args, stdout=output)
+        return json.loads(output.getvalue())
+
+    def test_generate_catalogue(self):
+        args = ['--companies', '2', '--countries', '2', '--tours', '12', '--timespans', '2',
+                '--users', '5', '--favourites', '30', '--reservations', '40']
+        output = io.StringIO()
+        call_command('generate_catalogue', *args, stdout=output)
+        result = json.loads(output.getvalue())
+        self.assertEqual((result['tours'], result['favourites'], result['timespans']), (12, 30, 24))
+        self.assertEqual(Reservation.objects.count(), 40)
+
+        # Счётчики, заполненные генератором, сходятся с пересчётом
+        output = io.StringIO()
+        call_command('repair_counters', '--dry-run', stdout=output)
+        self.assertIn('favourites_count: исправлено туров — 0', output.getvalue())
+        self.assertIn('учёт мест: исправлено периодов — 0', output.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('generate_catalogue', *args, stdout=io.StringIO())
+        call_command('generate_catalogue', *args, '--flush', stdout=io.StringIO())
+        self.assertEqual(Tour.objects.count(), 12)
+
+    def test_benchmarks_run(self):
+        seed_catalogue(companies=2, countries=2, tours=25, users=5, favourites=40,
+                       timespans=2, reservations=20)
+
+        endpoints = self.benchmark('endpoints', '--iterations', '1', '--warmup', '0')['endpoints']
+        self.assertEqual({name: result['status'] for name, result in endpoints.items()
+                          if not 200 <= result['status'] < 300}, {})
+
+        result = self.benchmark('pagination', '--page', '2', '--iterations', '1')
+        self.assertIn('cursor_2', result)
+        result = self.benchmark('popular', '--iterations', '10')
+        self.assertGreater(result['refresh_scopes'], 0)
+        result = self.benchmark('search', '--reindex', '--iterations', '1')
+        self.assertEqual(result['indexed'], 25)
+        result = self.benchmark('serializers', '--rows', '10', '--iterations', '1')
+        self.assertTrue(all(case['identical'] for name, case in result.items() if name != 'rows'))
+        result = self.benchmark('slugs', '--count', '5', '--legacy-count', '2')
+        self.assertEqual(len(result), 3)
+
+
+@override_settings(POPULAR_TOURS={'BACKGROUND_REFRESH': False}, ALLOWED_HOSTS=['localhost'])
+class ThreadedBenchmarkSmokeTests(TransactionTestCase):
+    # Запросы из потоков видят только закоммиченные данные
+    def setUp(self):
+        seed_catalogue(companies=2, countries=2, tours=25, users=2, favourites=10, timespans=1)
+
+    def test_concurrency(self):
+        output = io.StringIO()
+        call_command('benchmark', 'concurrency', '--requests', '4', '--concurrency', '2',
+                     '--only', 'tour.list', stdout=output)
+        result = json.loads(output.getvalue())
+        self.assertEqual({mode: data['errors'] for mode, data in result['tour.list'].items()},
+                         {'wsgi': 0, 'asgi-sync': 0, 'asgi-async': 0})
+
+    def test_logins(self):
+        output = io.StringIO()
+        with mock.patch('django.contrib.auth.hashers.PBKDF2PasswordHasher.iterations', 1000):
+            call_command('benchmark', 'logins', '--requests', '4', '--logins', '1', stdout=output)
+        self.assertEqual(set(json.loads(output.getvalue())), {'meta', 'baseline', 'unbounded', 'pooled'})
+
+
+class QueryPlanTests(TestCase):
+    # Горячие запросы должны обращаться к большим таблицам через индекс
+    hot_tables = ['app_tour', 'app_favourites', 'app_reservation', 'app_tourtimespan']
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalogue(companies=50, countries=30, tours=5000, users=500, favourites=20000)
+        for code, _ in ReservationStatus.STATUS_CHOICES:
+            ReservationStatus.objects.get_or_create(status=code)
+
+        now = timezone.now()
+        TourTimeSpan.objects.bulk_create([
+            TourTimeSpan(tour_id=tour_id, group_name='-', place_count=100,
+                         date_from=now + datetime.timedelta(days=i),
+                         date_to=now + datetime.timedelta(days=i + 7))
+            for tour_id in Tour.objects.values_list('pk', flat=True) for i in range(3)
+        ])
+        statuses = list(ReservationStatus.objects.all())
+        timespans = list(TourTimeSpan.objects.values_list('pk', flat=True)[:3000])
+        Reservation.objects.bulk_create([
+            Reservation(customer=user, target_id=timespans[(n + i) % len(timespans)],
+                        status=statuses[(n + i) % len(statuses)], count=1)
+            for n, user in enumerate(User.objects.all()) for i in range(10)
+        ])
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        cls.user = User.objects.first()
+        cls.tour = Tour.objects.order_by('pk')[100]
+
+    def setUp(self):
+        caching.get_backend().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN {sql}')
+                return '\n'.join(row[0] for row in cursor.fetchall())
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+
+    def assertIndexScans(self, url, method='get', data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 400, response.content)
+
+        for query in queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            plan = self.plan(query['sql'])
+            for table in self.hot_tables:
+                if connection.vendor == 'postgresql':
+                    full_scan = re.search(rf'Seq Scan on {table}\b', plan)
+                else:
+                    full_scan = re.search(rf'SCAN {table}\b(?! USING)', plan)
+                self.assertIsNone(full_scan, f'{url}: {query["sql"]}\n{plan}')
+
+    def test_favourite_check(self):
+        self.assertIndexScans(f'/api/favourites/{self.tour.slug}/check/')
+        self.assertIndexScans(f'/api/tour/{self.tour.slug}/favourite/')
+
+    def test_favourite_toggle(self):
+        self.assertIndexScans(f'/api/favourites/{self.tour.slug}/add/', 'post')
+        self.assertIndexScans(f'/api/favourites/{self.tour.slug}/remove/', 'delete')
+
+    def test_reservation_list_and_count(self):
+        self.assertIndexScans('/api/reservation/')
+        self.assertIndexScans('/api/reservation/count/')
+
+    def test_nearest_timespan(self):
+        self.assertIndexScans(f'/api/tour/{self.tour.slug}/full/')
+
+    def test_tour_filter(self):
+        self.assertIndexScans('/api/tour/', data={'min_price': 100, 'max_price': 200})
+        self.assertIndexScans('/api/tour/', data={'country': 'bench-country-7', 'max_price': 200})
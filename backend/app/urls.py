@@ -3,6 +3,7 @@ from rest_framework.routers import DefaultRouter
 from app import views
 from django.urls import path, include
 
+from . import async_views
 from .addons import CustomRouter
 from .views import *
 
@@ -16,3 +17,14 @@ router.register(r'reservation-status-type', ReservationStatusViewSet, basename='
 router.register(r'country', CountryViewSet, basename='country')
 router.register(r'auth', AuthViewSet, basename='auth')
 router.register(r'reservation', ReservationViewSet, basename='reservations')
+
+# Асинхронный путь чтения каталога для запуска под ASGI (backend/asgi.py)
+async_urlpatterns = [
+    path('tour/', async_views.tour_list, name='async-tour-list'),
+    path('tour/popular/', async_views.popular_tours, name='async-tour-popular'),
+    path('tour/<slug:slug>/', async_views.tour_detail, name='async-tour-detail'),
+    path('tour/<slug:slug>/full/', async_views.tour_full_info, name='async-tour-full'),
+    path('company/', async_views.company_list, name='async-company-list'),
+    path('company/<slug:slug>/', async_views.company_detail, name='async-company-detail'),
+    path('country/', async_views.country_list, name='async-country-list'),
+]
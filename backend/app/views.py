@@ -1,21 +1,29 @@
-from django.db.models import Prefetch, Count, Q
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from app import avatars, facets, favourites, lookups, metrics, rankings, reservations, search
+from app.caching import CachedResponseMixin
+from app.compiled import CompiledListMixin
 from app.models import *
+from app.pagination import CatalogPagination
 from app.serializers import *
 from app.filters import *
 
 
-class SocialMediaTypeViewSet(viewsets.GenericViewSet):
+class SocialMediaTypeViewSet(CachedResponseMixin, viewsets.GenericViewSet):
     queryset = SocialMediaType.objects.all()
     serializer_class = SocialMediaTypeSerializer
+    cache_groups = ('social_media',)
 
     def list(self, request, *args, **kwargs):
         instance = self.get_queryset()
@@ -23,9 +31,10 @@ class SocialMediaTypeViewSet(viewsets.GenericViewSet):
         return Response(serializer.data)
 
 
-class ReservationStatusViewSet(viewsets.GenericViewSet):
+class ReservationStatusViewSet(CachedResponseMixin, viewsets.GenericViewSet):
     queryset = ReservationStatus.objects.all()
     serializer_class = ReservationStatusSerializer
+    cache_groups = ('reservation_status',)
 
     def list(self, request, *args, **kwargs):
         instance = self.get_queryset()
@@ -33,9 +42,10 @@ class ReservationStatusViewSet(viewsets.GenericViewSet):
         return Response(serializer.data)
 
 
-class CountryViewSet(viewsets.GenericViewSet):
+class CountryViewSet(CachedResponseMixin, viewsets.GenericViewSet):
     queryset = Country.objects.all()
     serializer_class = CountrySerializer
+    cache_groups = ('country',)
 
     def list(self, request, *args, **kwargs):
         instance = self.get_queryset()
@@ -45,13 +55,16 @@ class CountryViewSet(viewsets.GenericViewSet):
 
 class SocialMediaViewSet(viewsets.ModelViewSet):
     serializer_class = SocialMediaSerializer
-    queryset = SocialMedia.objects.select_related('media_type', 'target')
+    queryset = SocialMedia.objects.select_related('target')
 
 
-class CompanyViewSet(viewsets.ModelViewSet):
+class CompanyViewSet(CachedResponseMixin, CompiledListMixin, viewsets.ModelViewSet):
     queryset = Company.objects.all()
+    compiled_serializer = compiled_company_serializer
+    cache_groups = ('company', 'social_media', 'tour')
     serializer_class = CompanySerializer
-    pagination_class = PageNumberPagination
+    pagination_class = CatalogPagination
+    keyset_ordering = ('id',)
     lookup_field = 'slug'
     lookup_url_kwarg = 'slug'
     filter_backends = [DjangoFilterBackend]
@@ -68,8 +81,7 @@ class CompanyViewSet(viewsets.ModelViewSet):
         if self.action == 'retrieve':
             queryset = queryset.prefetch_related(
                 Prefetch('socialmedia_set',
-                         queryset=SocialMedia.objects.select_related(
-                             'media_type')
+                         queryset=SocialMedia.objects.all()
                          ),
                 Prefetch('tour_set',
                          queryset=Tour.objects.all()
@@ -78,17 +90,33 @@ class CompanyViewSet(viewsets.ModelViewSet):
         return queryset
 
 
-class TourViewSet(viewsets.ModelViewSet):
-    queryset = Tour.objects.annotate(
-        favourites_count=Count('favourites')
-    ).select_related('company', 'country')
+class TourViewSet(CachedResponseMixin, CompiledListMixin, viewsets.ModelViewSet):
+    queryset = Tour.objects.select_related('company', 'country')
+    compiled_serializer = compiled_tour_serializer
+    cache_groups = ('tour', 'company', 'country')
+    cached_actions = ('list', 'retrieve', 'get_full_info')
+    # Чтения, которым от пользователя нужен только id (см. app.authentication)
+    stateless_auth_actions = ('list', 'get_favourite', 'get_popular_tours')
     serializer_class = TourSerializer
     lookup_field = 'slug'
     lookup_url_kwarg = 'slug'
-    pagination_class = PageNumberPagination
+    pagination_class = CatalogPagination
+    keyset_ordering = ('price', 'id')
     filter_backends = [DjangoFilterBackend]
     filterset_class = TourFilter
 
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        favourites.mark(request, response.data['results'] if isinstance(response.data, dict) else response.data)
+
+        if request.query_params.get('facets') and isinstance(response.data, dict):
+            response.data['facets'] = facets.get_facets(
+                self.filter_queryset(self.get_queryset()),
+                request.query_params,
+                self.filterset_class.base_filters
+            )
+        return response
+
     @action(detail=True, methods=['get'], url_path='favourite')
     def get_favourite(self, request, slug=None):
         response_data = {'is_favorite': False}
@@ -96,18 +124,11 @@ class TourViewSet(viewsets.ModelViewSet):
         if not request.user.is_authenticated:
             return Response(response_data)
 
-        try:
-            tour = self.get_object()
-            response_data['is_favorite'] = Favourites.objects.filter(
-                customer=request.user,
-                target=tour
-            ).exists()
-        except Exception:
-            pass
+        response_data['is_favorite'] = slug in favourites.get_slugs(request.user, [slug])
 
         return Response(response_data)
 
-    @action(detail=True, methods=['post'], url_path='favourite')
+    @get_favourite.mapping.post
     def set_favourite(self, request, slug=None):
         if not request.user.is_authenticated:
             return Response(
@@ -118,15 +139,14 @@ class TourViewSet(viewsets.ModelViewSet):
         tour = self.get_object()
         customer = request.user
 
-        if not Favourites.objects.filter(customer=customer, target=tour).exists():
-            Favourites.objects.create(customer=customer, target=tour)
+        Favourites.objects.add(customer, tour)
 
         return Response(
             {'is_favorite': True},
             status=status.HTTP_201_CREATED
         )
 
-    @action(detail=True, methods=['delete'], url_path='favourite')
+    @get_favourite.mapping.delete
     def delete_favourite(self, request, slug=None):
         if not request.user.is_authenticated:
             return Response(
@@ -136,10 +156,10 @@ class TourViewSet(viewsets.ModelViewSet):
 
         tour = self.get_object()
         customer = request.user
-        deleted, _ = Favourites.objects.filter(
+        deleted = Favourites.objects.remove(
             customer=customer,
             target=tour
-        ).delete()
+        )
 
         if deleted == 0:
             return Response(
@@ -152,55 +172,80 @@ class TourViewSet(viewsets.ModelViewSet):
             status=status.HTTP_200_OK
         )
 
+    def get_cache_groups(self, action, **kwargs):
+        if action == 'get_full_info':
+            # Страница тура сбрасывается отдельно: места списываются update() без сигналов,
+            # и бронирование не должно сбрасывать кэш всего каталога
+            return ('company', 'country', f'tour:{kwargs.get("slug")}')
+        return super().get_cache_groups(action, **kwargs)
+
     @action(detail=True, methods=['get'], url_path='full')
     def get_full_info(self, request, slug=None):
-        desired_statuses = [ReservationStatus.PAID]
-
-        tour = Tour.objects.filter(slug=slug).annotate(
-            favourites_count=Count('favourites')
-        ).select_related(
-            'tourinfo',
-            'company',
-            'country'
-        ).prefetch_related(
-            Prefetch(
-                'tourtimespan_set',
-                queryset=TourTimeSpan.objects.order_by('-date_to').annotate(
-                    places_released=Count(
-                        'reservation',
-                        filter=Q(
-                            reservation__status__status__in=desired_statuses)
-                    )
-                ).prefetch_related(
-                    Prefetch(
-                        'reservation_set',
-                        queryset=Reservation.objects.select_related('status')
-                        .filter(status__status__in=desired_statuses),
-                        to_attr='filtered_reservations'
-                    )
-                )
-            )
-        ).first()
-
-        nearest_timespan = tour.tourtimespan_set.first()
+        tour = get_object_or_404(
+            Tour.objects.select_related('tourinfo', 'company', 'country'),
+            slug=slug
+        )
+        timespans = reservations.upcoming_timespans(tour)
 
         data = {
             'basic_info': TourSerializer(tour).data,
             'detailed_info': TourInfoSerializer(tour.tourinfo).data if hasattr(tour, 'tourinfo') else None,
-            'time_spans': TourTimeSpanSerializer(nearest_timespan).data if nearest_timespan else None
+            'time_spans': TourTimeSpanSerializer(timespans[0]).data if timespans else None,
+            'upcoming_time_spans': TourTimeSpanSerializer(timespans, many=True).data
         }
         return Response(data)
 
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {'error': 'Query parameter q is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+        except ValueError:
+            limit = 20
+
+        ranked = search.search(query, limit=max(limit, 1))
+        tours = self.get_queryset().in_bulk([pk for pk, _ in ranked])
+
+        results = []
+        for pk, rank in ranked:
+            if pk in tours:
+                data = self.get_serializer(tours[pk]).data
+                data['rank'] = round(rank, 4)
+                results.append(data)
+        return Response(results)
+
     @action(detail=False, methods=['get'], url_path='popular')
     def get_popular_tours(self, request):
-        popular_tours = self.get_queryset().order_by('-favourites_count')[:7]
+        scope, scope_id = rankings.GLOBAL, None
+
+        if country := request.query_params.get('country'):
+            scope = rankings.COUNTRY
+            scope_id = lookups.countries.get_id(country)
+            if scope_id is None:
+                raise Http404('No Country matches the given query.')
+        elif company := request.query_params.get('company'):
+            scope = rankings.COMPANY
+            scope_id = get_object_or_404(Company, slug=company).pk
+
+        ids = rankings.get_popular_ids(scope, scope_id)
+        tours = self.get_queryset().in_bulk(ids)
+        popular_tours = [tours[pk] for pk in ids if pk in tours]
+
         serializer = self.get_serializer(popular_tours, many=True)
-        return Response(serializer.data)
+        return Response(favourites.mark(request, serializer.data))
 
 
 class AuthViewSet(viewsets.GenericViewSet):
     serializer_class = UserSerializer
     queryset = User.objects.all()
+    # Профиль читается и сохраняется целиком: пользователь из БД, а не из кэша
+    cached_auth_user = False
 
     def get_permissions(self):
         if self.action in ['user', 'list', 'delete', 'change-password', 'update']:
@@ -238,7 +283,13 @@ class AuthViewSet(viewsets.GenericViewSet):
 
     @action(detail=False, methods=['delete'], url_path='delete')
     def delete(self, request):
+        # Каскад не трогает счётчики туров и мест, поэтому снимаем явно
+        Favourites.objects.remove(customer=request.user)
+        reservations.release(Reservation.objects.filter(customer=request.user))
+        avatar = request.user.avatar.name
         request.user.delete()
+        # Файл аватара удаляется, если он больше ни у кого не используется
+        transaction.on_commit(lambda: avatars.release(avatar))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, methods=['post'], url_path='change-password')
@@ -265,6 +316,7 @@ class AuthViewSet(viewsets.GenericViewSet):
 
     @action(detail=False, methods=['patch'], url_path='update')
     def patch_user(self, request):
+        avatars.use_disk_uploads(request._request)
         user = request.user
         serializer = self.get_serializer(user, data=request.data, partial=True)
 
@@ -286,13 +338,11 @@ class AuthViewSet(viewsets.GenericViewSet):
             )
 
         try:
-            # Удаляем файл с диска
-            if os.path.isfile(user.avatar.path):
-                os.remove(user.avatar.path)
-
-            # Очищаем поле в базе данных
+            # Оригинал и все копии удаляются после коммита, если файл не нужен другим
+            name = user.avatar.name
             user.avatar = None
             user.save()
+            transaction.on_commit(lambda: avatars.release(name))
 
             return Response(
                 {"detail": "Аватар успешно удален"},
@@ -323,14 +373,18 @@ class AuthViewSet(viewsets.GenericViewSet):
         return Response(serializer.data)
 
 
+CHECK_MANY_LIMIT = 100
+
+
 class FavouritesViewsSet(viewsets.GenericViewSet):
     queryset = Favourites.objects.all()
     serializer_class = FavouriteSerializer
+    stateless_auth_actions = ('check', 'check_many')
     lookup_field = 'slug'
     lookup_url_kwarg = 'slug'
 
     def get_permissions(self):
-        if self.action in ['add', 'remove']:
+        if self.action in ['add', 'remove', 'add_many', 'remove_many']:
             return [IsAuthenticated()]
         return super().get_permissions()
 
@@ -346,30 +400,74 @@ class FavouritesViewsSet(viewsets.GenericViewSet):
         response = {'is_favorite': False}
 
         if request.user.is_authenticated:
-            response['is_favorite'] = Favourites.objects.filter(
-                customer=request.user,
-                target__slug=slug
-            ).exists()
+            response['is_favorite'] = slug in favourites.get_slugs(request.user, [slug])
 
         return Response(response)
 
+    @action(detail=False, methods=['get', 'post'], url_path='check-many')
+    def check_many(self, request):
+        # Состояние избранного для карточек страницы одним запросом:
+        # GET ?slugs=a,b,c или POST {"slugs": [...]}
+        if request.method == 'POST':
+            slugs = request.data.get('slugs')
+            if not isinstance(slugs, list) or not all(isinstance(slug, str) for slug in slugs):
+                return Response(
+                    {'error': 'slugs must be a list of strings'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            slugs = [slug for value in request.query_params.getlist('slugs')
+                     for slug in value.split(',') if slug]
+
+        if len(slugs) > CHECK_MANY_LIMIT:
+            return Response(
+                {'error': f'Не больше {CHECK_MANY_LIMIT} слагов за запрос'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        favourite_slugs = favourites.get_slugs(request.user, slugs) if request.user.is_authenticated else frozenset()
+        return Response({slug: slug in favourite_slugs for slug in slugs})
+
     @action(detail=True, methods=['post'], url_path='add')
     def add(self, request, slug=None):
         tour = get_object_or_404(Tour, slug=slug)
-        Favourites.objects.get_or_create(
-            customer=request.user,
-            target=tour
-        )
+        Favourites.objects.add(request.user, tour)
         return Response({'is_favorite': True}, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['delete'], url_path='remove')
     def remove(self, request, slug=None):
-        Favourites.objects.filter(
+        Favourites.objects.remove(
             customer=request.user,
             target__slug=slug
-        ).delete()
+        )
         return Response({'is_favorite': False}, status=status.HTTP_204_NO_CONTENT)
 
+    # Пакетные изменения (синхронизация офлайн-избранного): POST {"slugs": [...]}.
+    # Повторный запрос с теми же слагами ничего не меняет
+    @action(detail=False, methods=['post'], url_path='add-many')
+    def add_many(self, request):
+        slugs = favourites.parse_slugs(request.data.get('slugs'))
+        if slugs is None:
+            return Response(
+                {'error': f'slugs must be a list of at most {favourites.BATCH_LIMIT} strings'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        added, missing = favourites.add_many(request.user, slugs)
+        return Response({'added': added, 'missing': missing})
+
+    @action(detail=False, methods=['post'], url_path='remove-many')
+    def remove_many(self, request):
+        slugs = favourites.parse_slugs(request.data.get('slugs'))
+        if slugs is None:
+            return Response(
+                {'error': f'slugs must be a list of at most {favourites.BATCH_LIMIT} strings'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        removed = favourites.remove_many(request.user, slugs)
+        return Response({'removed': removed})
+
 
 class FavouriteViewSet(viewsets.GenericViewSet):
     serializer_class = FavouriteSerializer
@@ -380,24 +478,28 @@ class FavouriteViewSet(viewsets.GenericViewSet):
         return Favourites.objects.select_related('target').filter(customer=self.request.user)
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = FavouriteSerializer(queryset, many=True)
-        return Response(serializer.data)
+        rows = compiled_favourite_serializer.values(self.get_queryset())
+        return Response(compiled_favourite_serializer.serialize(rows))
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        instance.delete()
+        Favourites.objects.remove(pk=instance.pk, customer=request.user)
         return Response(status=204)
 
     @action(detail=False, methods=['get'], url_path='clear')
     def clear(self, request, *args, **kwargs):
-        self.get_queryset().delete()
+        Favourites.objects.remove(customer=request.user)
         return Response(status=204)
 
 
+# Статусы, которые пользователь может выставить своим броням сам
+CUSTOMER_STATUSES = (ReservationStatus.PAID, ReservationStatus.DECLINED)
+
+
 class ReservationViewSet(viewsets.GenericViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = ReservationSerializer
+    keyset_ordering = ('target__date_to', 'id')
     lookup_field = 'slug'
     lookup_url_kwarg = 'slug'
 
@@ -408,19 +510,16 @@ class ReservationViewSet(viewsets.GenericViewSet):
         return queryset
 
     def list(self, request, *args, **kwargs):
-        paginator = PageNumberPagination()
+        paginator = CatalogPagination()
         desired_statuses = [ReservationStatus.WAITING]
 
         instance = self.get_queryset().filter(status__status__in=desired_statuses)
-        page = paginator.paginate_queryset(instance, request)
+        rows = compiled_reservation_serializer.values(instance, *self.keyset_ordering)
+        page = paginator.paginate_queryset(rows, request, view=self)
 
-        serializer = self.get_serializer(instance, many=True)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return paginator.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(instance, many=True)
-        return Response(serializer.data)
+            return paginator.get_paginated_response(compiled_reservation_serializer.serialize(page))
+        return Response(compiled_reservation_serializer.serialize(rows))
 
     @action(detail=False, methods=['get'], url_path='count')
     def count(self, request, *args, **kwargs):
@@ -435,41 +534,82 @@ class ReservationViewSet(viewsets.GenericViewSet):
 
     @action(detail=False, methods=['get'], url_path='history')
     def history(self, request, *args, **kwargs):
-        paginator = PageNumberPagination()
+        paginator = CatalogPagination()
 
-        queryset = self.get_queryset()
-        page = paginator.paginate_queryset(queryset, request)
+        rows = compiled_reservation_serializer.values(self.get_queryset(), *self.keyset_ordering)
+        page = paginator.paginate_queryset(rows, request, view=self)
 
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return paginator.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+            return paginator.get_paginated_response(compiled_reservation_serializer.serialize(page))
+        return Response(compiled_reservation_serializer.serialize(rows))
 
     @action(detail=True, methods=['post'], url_path='reserve')
     def reserve(self, request, slug=None, *args, **kwargs):
-        instance = Tour.objects.prefetch_related(
-            Prefetch(
-                'tourtimespan_set',
-                queryset=TourTimeSpan.objects.order_by('-date_to')
+        tour = get_object_or_404(Tour, slug=slug)
+
+        try:
+            count = int(request.data.get('count') or 1)
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "Count must be a valid integer"},
+                status=status.HTTP_400_BAD_REQUEST
             )
-        ).get(slug=slug)
 
-        timespan = instance.tourtimespan_set.first()
-        customer = request.user
-        stat = ReservationStatus.objects.get(status=ReservationStatus.WAITING)
-        count = request.data.get('count')
+        if count <= 0:
+            return Response(
+                {"error": "Count must be a positive integer"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        Reservation.objects.create(
-            status=stat,
-            customer=customer,
-            target=timespan,
-            count=count if count else 1
-        )
+        timespan = reservations.select_timespan(tour, request.data.get('timespan'))
+        if not timespan:
+            return Response(
+                {"error": "Time span not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        try:
+            reservations.create(request.user, timespan, count)
+        except reservations.OverbookingError as e:
+            return Response(
+                {"error": str(e), "timespan": e.timespan_id},
+                status=status.HTTP_409_CONFLICT
+            )
 
         return Response(status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'], url_path='reserve-batch')
+    def reserve_batch(self, request, *args, **kwargs):
+        serializer = ReservationBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['items']
+
+        timespans = TourTimeSpan.objects.in_bulk(
+            {item['timespan'] for item in items}
+        )
+        missing = sorted({item['timespan'] for item in items} - timespans.keys())
+        if missing:
+            return Response(
+                {"error": "Time span not found", "timespans": missing},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        try:
+            created = reservations.create_many(
+                request.user,
+                [(timespans[item['timespan']], item['count']) for item in items]
+            )
+        except reservations.OverbookingError as e:
+            return Response(
+                {"error": str(e), "timespan": e.timespan_id},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        return Response(
+            {'ids': [reservation.pk for reservation in created]},
+            status=status.HTTP_201_CREATED
+        )
+
     @action(detail=False, methods=['delete'], url_path='delete')
     def delete(self, request, *args, **kwargs):
         try:
@@ -480,9 +620,9 @@ class ReservationViewSet(viewsets.GenericViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            deleted_count, _ = self.get_queryset().filter(
-                id=reservation_id
-            ).delete()
+            deleted_count = reservations.release(
+                self.get_queryset().filter(id=reservation_id)
+            )
 
             if deleted_count == 0:
                 return Response(
@@ -517,24 +657,27 @@ class ReservationViewSet(viewsets.GenericViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            item = self.get_queryset().filter(
-                id=reservation_id
-            ).first()
-
-            if not item:
-                return Response(
-                    {"error": "Reservation not found or not owned by user"},
-                    status=status.HTTP_404_NOT_FOUND
-                )
-
             if count <= 0:
                 return Response(
                     {"error": "Count must be a positive integer"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            item.count = count
-            item.save()
+            try:
+                item = reservations.change_count(
+                    self.get_queryset().filter(id=reservation_id), count
+                )
+            except reservations.OverbookingError as e:
+                return Response(
+                    {"error": str(e), "timespan": e.timespan_id},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+            if not item:
+                return Response(
+                    {"error": "Reservation not found or not owned by user"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
 
             return Response(status=status.HTTP_200_OK)
 
@@ -547,14 +690,43 @@ class ReservationViewSet(viewsets.GenericViewSet):
     @action(detail=False, methods=['patch'], url_path='status')
     def update_status(self, request, *args, **kwargs):
         ids = request.data.get('ids', [])
-        if not isinstance(ids, list) or not ids:
+        if not isinstance(ids, list) or not ids or not all(isinstance(pk, int) for pk in ids):
             return Response(
                 {"error": "A non-empty list of IDs is required"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        stat = ReservationStatus.objects.get(status=ReservationStatus.PAID)
+        status_code = request.data.get('status', ReservationStatus.PAID)
+        allowed = reservations.TRANSITIONS if request.user.is_staff else CUSTOMER_STATUSES
+        if status_code not in allowed:
+            return Response(
+                {"error": f"Status must be one of: {', '.join(sorted(allowed))}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        query = self.get_queryset().filter(id__in=ids).update(status=stat)
+        # Персонал меняет статусы любых броней, пользователь — только своих
+        queryset = Reservation.objects.all() if request.user.is_staff else self.get_queryset()
+        try:
+            updated = reservations.transition(queryset, ids, status_code)
+        except reservations.OverbookingError as e:
+            return Response(
+                {"error": str(e), "timespan": e.timespan_id},
+                status=status.HTTP_409_CONFLICT
+            )
 
-        return Response(status=status.HTTP_200_OK)
+        # Не найденные и не допускающие переход брони не меняются
+        updated_ids = set(updated)
+        return Response(
+            {'updated': updated, 'skipped': sorted(set(ids) - updated_ids)},
+            status=status.HTTP_200_OK
+        )
+
+
+def metrics_view(request):
+    # Prometheus забирает метрики с токеном из settings.METRICS_TOKEN
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token or not constant_time_compare(
+            request.headers.get('Authorization', ''), f'Bearer {token}'):
+        raise Http404
+    return HttpResponse(metrics.render_prometheus(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
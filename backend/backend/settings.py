@@ -47,6 +47,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'app.middleware.InstrumentationMiddleware',
+    'app.hashing.PasswordHashingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -111,6 +113,15 @@ AUTH_PASSWORD_VALIDATORS = [
 
 AUTH_USER_MODEL = 'app.User'
 
+# Пул хэширования паролей (app.hashing): одновременно WORKERS хэшей,
+# ещё MAX_PENDING ждут в очереди, остальным запросам API — 503 с Retry-After.
+# Вне API (админка) при заполненном пуле пароль хэшируется в потоке запроса
+PASSWORD_HASHING = {
+    'WORKERS': 2,
+    'MAX_PENDING': 32,
+    'TIMEOUT': 10,
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -135,7 +146,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'app.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
@@ -154,6 +165,14 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
 }
 
+# Поля пользователя JWT-запроса, нужные для прав доступа, кэшируются на
+# AUTH_USER_CACHE_TTL секунд (app.authentication). Поколение ключа сбрасывается
+# в общем CACHES, поэтому при нескольких воркерах он должен быть общим (Redis).
+# JWT_STATELESS_READS: чтения из stateless_auth_actions вьюсетов работают с
+# пользователем из claims токена, без БД
+AUTH_USER_CACHE_TTL = 60
+JWT_STATELESS_READS = False
+
 if DEBUG:
     CORS_ALLOW_ALL_ORIGINS = True
     CORS_ALLOW_CREDENTIALS = True
@@ -178,3 +197,66 @@ CORS_ALLOW_HEADERS = [
 
 MEDIA_URL = '/media/'  # URL-префик для медиафайлов
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # Папка для хранения
+
+# Раздача MEDIA_ROOT (app.media). OFFLOAD: None — отдаёт Django (sendfile через
+# wsgi.file_wrapper у gunicorn), 'x-accel' — nginx, 'x-sendfile' — Apache/lighttpd
+MEDIA_SERVING = {
+    'OFFLOAD': None,
+    'ACCEL_PREFIX': '/protected-media/',
+    'MAX_AGE': 60 * 60,
+}
+
+# Прокси внешних картинок туров и компаний (app.imageproxy). При ENABLED
+# сериализаторы отдают подписанные ссылки на /api/image-proxy/ вместо исходных адресов
+IMAGE_PROXY = {
+    'ENABLED': False,
+    'BASE_URL': '',
+    'CACHE_SIZE': 512 * 1024 * 1024,
+}
+
+# Уменьшенные копии аватаров (app.avatars) строятся пулом из WORKERS потоков после коммита
+AVATARS = {
+    'SIZES': [64, 128, 256],
+    'WORKERS': 1,
+}
+
+# Рейтинги популярных туров (app.rankings). Запросы пересчёт не ждут: пока
+# среза нет в кэше, отдаётся топ по favourites_count. С локальным кэшем по
+# умолчанию каждый воркер считает рейтинг сам в фоновом потоке, а команда
+# refresh_rankings пишет только в свой процесс. С общим CACHES (Redis и т.п.)
+# рейтинг считается один раз на все воркеры; тогда можно запустить
+# refresh_rankings --loop и выключить WORKER_REFRESH
+POPULAR_TOURS = {
+    'SIZE': 7,
+    'TTL': 60 * 60,
+    'STALE_AFTER': 5 * 60,
+}
+
+# Фасеты каталога туров (app.facets)
+TOUR_FACETS = {
+    'TTL': 10 * 60,
+    'PRICE_BUCKETS': [10000, 30000, 50000, 100000],
+}
+
+# Кэш анонимных ответов каталога (app.caching). При нескольких воркерах
+# используйте 'app.caching.DjangoCacheBackend' поверх общего CACHES (Redis)
+RESPONSE_CACHE = {
+    'BACKEND': 'app.caching.LRUBackend',
+    'OPTIONS': {'max_entries': 1000},
+    'TTL': 60,
+}
+
+# Prometheus передаёт его в заголовке Authorization: Bearer <token>.
+# Без токена /metrics закрыт. Адрес клиента не проверяется: за локальным
+# nginx (MEDIA_SERVING['OFFLOAD'] = 'x-accel') все запросы приходят с 127.0.0.1
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Бюджет SQL-запросов на запрос (app.middleware.InstrumentationMiddleware):
+# превышение пишется в лог, а при RAISE=True вызывает исключение
+QUERY_BUDGET = {
+    'DEFAULT': 50,
+    'VIEWS': {
+        'tour.get_full_info': 2,
+    },
+    'RAISE': False,
+}
@@ -15,13 +15,19 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
-from django.conf.urls.static import static
+from django.urls import path, include, re_path
 
 from backend import settings
-from app.urls import router
+from app import imageproxy, media
+from app.urls import async_urlpatterns, router
+from app.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/async/', include(async_urlpatterns)),
+    path('api/image-proxy/', imageproxy.image_proxy, name='image-proxy'),
     path('api/', include(router.urls)),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('metrics', metrics_view, name='metrics'),
+    # Медиафайлы (app.media); за nginx включите MEDIA_SERVING['OFFLOAD'] = 'x-accel'
+    re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.+)$', media.serve, name='media'),
+]